@@ -1,6 +1,15 @@
 import mathutils
 import bpy
+import copy
 import hashlib
+import json
+import mmap
+import os
+import sqlite3
+import time
+import numpy as np
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 bl_info = {
     "name": "Material Batch Tools",
@@ -30,6 +39,224 @@ node_unify_settings = {
     "material": ""
 }
 
+# Material templates, written as plain data (the same layout is used by user templates, which are .json files in the
+# "matbatchtools/templates" folder of Blender's user config folder). Each template has:
+#   "name", "description"  - shown in the Template dropdown
+#   "image"                - optional. Which existing image texture to keep: "FIRST" (first one found), or "CONNECTED_LDR" (first
+#                            non-HDR one connected to the output). Available to nodes as "$image"
+#   "hdr_image"            - optional. If true, the HDR / EXR / lightmap texture is looked up too, and available as "$hdr_image"
+#   "transform"            - optional. Name of a function in MATERIAL_TEMPLATE_TRANSFORMS that modifies the existing nodes instead
+#   "material"             - list of {"set": {setting: value}} entries, applied to the material itself
+#   "nodes"                - list of {"name", "type", "location", "label", "properties", "inputs"} entries. The node tree is cleared first
+#   "links"                - list of {"from": [node name, output socket], "to": [node name, input socket]} entries
+# Every entry can also have "when" (a list of conditions that must all be true - "image", "transparency", "alpha_channel",
+# "hdr_image", or any of those with a "!" in front), and "min_version" / "max_version" (max is exclusive), like [4, 2, 0].
+# Node types and sockets can be aliases from TEMPLATE_NODE_TYPES and TEMPLATE_SOCKET_MAPS, which are resolved by Blender version.
+# Property values starting with "$" are per-material variables: "$image", "$hdr_image", "$uv_map" (first UV map of the object)
+# and "$color_attribute" (first color attribute of the object). If a variable isn't available, the property is left as is.
+
+TEMPLATE_NODE_TYPES = {
+    "$mix": [{"max_version": [3, 4, 0], "value": "ShaderNodeMixRGB"},
+             {"min_version": [3, 4, 0], "value": "ShaderNodeMix"}],
+}
+
+TEMPLATE_SOCKET_MAPS = {
+    "ShaderNodeMix": {"inputs": {"Factor": 0, "A": 6, "B": 7}, "outputs": {"Result": 2}},
+    "ShaderNodeMixRGB": {"inputs": {"Factor": 0, "A": 1, "B": 2}, "outputs": {"Result": 0}},
+    "ShaderNodeBsdfPrincipled": {"inputs": {"Alpha": [{"max_version": [4, 0, 0], "value": 21},
+                                                      {"min_version": [4, 0, 0], "value": 4}]}},
+}
+
+# Render settings shared by most templates
+TEMPLATE_OPAQUE = [{"set": {"surface_render_method": "DITHERED"}, "min_version": [4, 2, 0]},
+                   {"set": {"blend_method": "OPAQUE"}, "max_version": [4, 2, 0]}]
+
+# Texture blended with the vertex colors, shared by the "Color + Texture" templates
+TEMPLATE_COLOR_TEXTURE_NODES = [
+    {"name": "UV Map", "type": "ShaderNodeUVMap", "location": [-700, 0], "when": ["image"], "properties": {"uv_map": "$uv_map"}},
+    {"name": "Image Texture", "type": "ShaderNodeTexImage", "location": [-500, 0], "when": ["image"], "properties": {"image": "$image"}},
+    {"name": "Mix", "type": "$mix", "location": [-200, 100], "when": ["image"], "properties": {"data_type": "RGBA", "blend_type": "MULTIPLY"}, "inputs": {"Factor": 1.0}},
+    {"name": "Color Attribute", "type": "ShaderNodeVertexColor", "location": [-400, 150], "properties": {"layer_name": "$color_attribute"}},
+    {"name": "Emission", "type": "ShaderNodeEmission", "location": [0, 100]},
+]
+TEMPLATE_COLOR_TEXTURE_LINKS = [
+    {"from": ["UV Map", 0], "to": ["Image Texture", 0]},
+    {"from": ["Image Texture", 0], "to": ["Mix", "B"]},
+    {"from": ["Color Attribute", 0], "to": ["Mix", "A"]},
+    {"from": ["Mix", "Result"], "to": ["Emission", 0]},
+    {"from": ["Color Attribute", 0], "to": ["Emission", 0], "when": ["!image"]},
+]
+
+MATERIAL_TEMPLATES = {
+    "ECT": {
+        "name": "Emissive + Color + Texture", "description": "Blends vertex color onto texture, if one exists",
+        "image": "FIRST",
+        "material": TEMPLATE_OPAQUE,
+        "nodes": TEMPLATE_COLOR_TEXTURE_NODES + [
+            {"name": "Material Output", "type": "ShaderNodeOutputMaterial", "location": [200, 100]}],
+        "links": TEMPLATE_COLOR_TEXTURE_LINKS + [
+            {"from": ["Emission", 0], "to": ["Material Output", 0]}],
+    },
+    "EC": {
+        "name": "Emissive + Color", "description": "Ignores image textures completely",
+        "material": TEMPLATE_OPAQUE,
+        "nodes": [
+            {"name": "Color Attribute", "type": "ShaderNodeVertexColor", "location": [-200, 100], "properties": {"layer_name": "$color_attribute"}},
+            {"name": "Emission", "type": "ShaderNodeEmission", "location": [0, 100]},
+            {"name": "Material Output", "type": "ShaderNodeOutputMaterial", "location": [200, 100]}],
+        "links": [
+            {"from": ["Color Attribute", 0], "to": ["Emission", 0]},
+            {"from": ["Emission", 0], "to": ["Material Output", 0]}],
+    },
+    "ACCT": {
+        "name": "Alpha Clip + Color + Texture", "description": "Transparency via alpha clip, and emission",
+        "image": "FIRST",
+        "material": [
+            {"set": {"surface_render_method": "DITHERED"}, "min_version": [4, 2, 0]},
+            {"set": {"blend_method": "CLIP"}, "max_version": [4, 2, 0]},
+            {"set": {"alpha_threshold": 0.5}}],
+        "nodes": TEMPLATE_COLOR_TEXTURE_NODES + [
+            {"name": "Transparent BSDF", "type": "ShaderNodeBsdfTransparent", "location": [0, -100]},
+            {"name": "Mix Shader", "type": "ShaderNodeMixShader", "location": [200, 100]},
+            {"name": "Material Output", "type": "ShaderNodeOutputMaterial", "location": [400, 100]},
+            # Blender 4.2 got rid of the alpha clip setting, so the Math node is used instead
+            {"name": "Greater Than", "type": "ShaderNodeMath", "location": [-200, -140], "when": ["image"], "min_version": [4, 2, 0], "properties": {"operation": "GREATER_THAN"}}],
+        "links": TEMPLATE_COLOR_TEXTURE_LINKS + [
+            {"from": ["Emission", 0], "to": ["Mix Shader", 2]},
+            {"from": ["Transparent BSDF", 0], "to": ["Mix Shader", 1]},
+            {"from": ["Image Texture", "Alpha"], "to": ["Mix Shader", 0], "max_version": [4, 2, 0]},
+            {"from": ["Image Texture", "Alpha"], "to": ["Greater Than", 0]},
+            {"from": ["Greater Than", 0], "to": ["Mix Shader", 0]},
+            {"from": ["Mix Shader", 0], "to": ["Material Output", 0]}],
+    },
+    "ACT": {
+        "name": "Additive + Color + Texture", "description": "Combines transparency and emission for an additive effect",
+        "image": "FIRST",
+        "material": [{"set": {"blend_method": "BLEND"}}],
+        "nodes": TEMPLATE_COLOR_TEXTURE_NODES + [
+            {"name": "Transparent BSDF", "type": "ShaderNodeBsdfTransparent", "location": [0, -100]},
+            {"name": "Add Shader", "type": "ShaderNodeAddShader", "location": [200, 100]},
+            {"name": "Material Output", "type": "ShaderNodeOutputMaterial", "location": [400, 100]}],
+        "links": TEMPLATE_COLOR_TEXTURE_LINKS + [
+            {"from": ["Emission", 0], "to": ["Add Shader", 0]},
+            {"from": ["Transparent BSDF", 0], "to": ["Add Shader", 1]},
+            {"from": ["Add Shader", 0], "to": ["Material Output", 0]}],
+    },
+    "AC": {
+        "name": "Additive + Color", "description": "Combines transparency and emission for an additive effect",
+        "material": [{"set": {"blend_method": "BLEND"}}],
+        "nodes": [
+            {"name": "Color Attribute", "type": "ShaderNodeVertexColor", "location": [-200, 100], "properties": {"layer_name": "$color_attribute"}},
+            {"name": "Emission", "type": "ShaderNodeEmission", "location": [0, 100]},
+            {"name": "Transparent BSDF", "type": "ShaderNodeBsdfTransparent", "location": [0, -100]},
+            {"name": "Add Shader", "type": "ShaderNodeAddShader", "location": [200, 100]},
+            {"name": "Material Output", "type": "ShaderNodeOutputMaterial", "location": [400, 100]}],
+        "links": [
+            {"from": ["Color Attribute", 0], "to": ["Emission", 0]},
+            {"from": ["Emission", 0], "to": ["Add Shader", 0]},
+            {"from": ["Transparent BSDF", 0], "to": ["Add Shader", 1]},
+            {"from": ["Add Shader", 0], "to": ["Material Output", 0]}],
+    },
+    "PT": {
+        "name": "Principled + Texture", "description": "Principled shading, with texture",
+        "image": "FIRST",
+        "material": TEMPLATE_OPAQUE + [
+            {"set": {"blend_method": "CLIP", "alpha_threshold": 0.5}, "when": ["image", "transparency"], "max_version": [4, 2, 0]}],
+        "nodes": [
+            {"name": "UV Map", "type": "ShaderNodeUVMap", "location": [-854, 0], "when": ["image"], "properties": {"uv_map": "$uv_map"}},
+            {"name": "Image Texture", "type": "ShaderNodeTexImage", "location": [-655, 0], "when": ["image"], "properties": {"image": "$image"}},
+            {"name": "Greater Than", "type": "ShaderNodeMath", "location": [-377, -83], "when": ["image", "transparency"], "min_version": [4, 2, 0], "properties": {"operation": "GREATER_THAN"}},
+            {"name": "Principled BSDF", "type": "ShaderNodeBsdfPrincipled", "location": [-200, 0]},
+            {"name": "Material Output", "type": "ShaderNodeOutputMaterial", "location": [100, 0]}],
+        "links": [
+            {"from": ["UV Map", 0], "to": ["Image Texture", 0]},
+            {"from": ["Image Texture", 0], "to": ["Principled BSDF", 0]},
+            {"from": ["Principled BSDF", 0], "to": ["Material Output", 0]},
+            # Keep using the texture for transparency, if it was used for that before
+            {"from": ["Image Texture", "Alpha"], "to": ["Principled BSDF", "Alpha"], "when": ["transparency", "alpha_channel"], "max_version": [4, 2, 0]},
+            {"from": ["Image Texture", "Color"], "to": ["Principled BSDF", "Alpha"], "when": ["transparency", "!alpha_channel"], "max_version": [4, 2, 0]},
+            {"from": ["Image Texture", "Alpha"], "to": ["Greater Than", 0]},
+            {"from": ["Greater Than", 0], "to": ["Principled BSDF", "Alpha"]}],
+    },
+    "PC": {
+        "name": "Principled + Color", "description": "Principled shading, with vertex color",
+        "material": TEMPLATE_OPAQUE,
+        "nodes": [
+            {"name": "Color Attribute", "type": "ShaderNodeVertexColor", "location": [-400, 0], "properties": {"layer_name": "$color_attribute"}},
+            {"name": "Principled BSDF", "type": "ShaderNodeBsdfPrincipled", "location": [-200, 0]},
+            {"name": "Material Output", "type": "ShaderNodeOutputMaterial", "location": [100, 0]}],
+        "links": [
+            {"from": ["Color Attribute", 0], "to": ["Principled BSDF", 0]},
+            {"from": ["Principled BSDF", 0], "to": ["Material Output", 0]}],
+    },
+    "HDRT": {
+        "name": "HDR Lightmap", "description": "Emissive but with an HDR lightmap applied for baked lighting. Your HDR's UV map must be named 'lightmap', and your HDR's filename must contain either 'light_', '.hdr' or '.exr' to be detected automatically",
+        "image": "CONNECTED_LDR",
+        "hdr_image": True,
+        "material": [{"set": {"surface_render_method": "BLENDED"}, "min_version": [4, 2, 0]},
+                     {"set": {"blend_method": "OPAQUE"}, "max_version": [4, 2, 0]}],
+        "nodes": [
+            {"name": "HDR UV Map", "type": "ShaderNodeUVMap", "location": [-700, 350], "properties": {"uv_map": "lightmap"}},
+            {"name": "HDR Lightmap", "type": "ShaderNodeTexImage", "location": [-500, 350], "label": "HDR Lightmap", "properties": {"image": "$hdr_image"}},
+            {"name": "UV Map", "type": "ShaderNodeUVMap", "location": [-700, 0], "when": ["image"], "properties": {"uv_map": "$uv_map"}},
+            {"name": "Image Texture", "type": "ShaderNodeTexImage", "location": [-500, 0], "when": ["image"], "properties": {"image": "$image"}},
+            {"name": "Mix", "type": "$mix", "location": [-200, 100], "when": ["image"], "properties": {"data_type": "RGBA", "blend_type": "MULTIPLY", "use_clamp": False, "clamp_factor": False, "clamp_result": False}, "inputs": {"Factor": 1.0}},
+            {"name": "Emission", "type": "ShaderNodeEmission", "location": [0, 100]},
+            {"name": "Material Output", "type": "ShaderNodeOutputMaterial", "location": [200, 100]}],
+        "links": [
+            {"from": ["HDR UV Map", 0], "to": ["HDR Lightmap", 0]},
+            {"from": ["UV Map", 0], "to": ["Image Texture", 0]},
+            {"from": ["Image Texture", 0], "to": ["Mix", "B"]},
+            {"from": ["HDR Lightmap", 0], "to": ["Mix", "A"]},
+            {"from": ["Mix", "Result"], "to": ["Emission", 0]},
+            {"from": ["HDR Lightmap", 0], "to": ["Emission", 0], "when": ["!image"]},
+            {"from": ["Emission", 0], "to": ["Material Output", 0]}],
+    },
+    "PP": {
+        "name": "Mirror UV", "description": "Mirroring / ping pong effect applied to any UV Maps, on both X and Y axis",
+        "transform": "PING_PONG",
+    },
+    "NO_PP": {
+        "name": "Unmirror UV", "description": "Removes the mirror / ping pong effect from any UV Maps, on both X and Y axis",
+        "transform": "REMOVE_PING_PONG",
+    },
+}
+
+# User templates loaded from the templates folder, by key. A user template with the same key as a built-in one replaces it
+user_templates = dict()
+
+# Items of the Template dropdown. Kept in a module-level list, since Blender needs dynamic enum items to stay referenced
+template_enum_items = []
+
+def refresh_template_enum_items():
+    ''' Rebuilds the Template dropdown items. Built-in templates keep their original numbers, user templates are numbered from 100 '''
+    template_enum_items.clear()
+    for index, key in enumerate(MATERIAL_TEMPLATES.keys()):
+        template = user_templates.get(key, MATERIAL_TEMPLATES[key])
+        template_enum_items.append((key, template.get("name", key), template.get("description", ""), index))
+    for index, key in enumerate(sorted(key for key in user_templates.keys() if key not in MATERIAL_TEMPLATES)):
+        template = user_templates[key]
+        template_enum_items.append((key, template.get("name", key), template.get("description", ""), 100 + index))
+
+def get_template_items(self, context):
+    if len(template_enum_items) == 0:
+        refresh_template_enum_items()
+    return template_enum_items
+
+
+
+class NodeUnifyTemplate(bpy.types.PropertyGroup):
+    NodeName: bpy.props.StringProperty(
+        name="Node", description="The name of the template node", default="", maxlen=200)
+    NodeType: bpy.props.StringProperty(
+        name="Node Type", description="The type of the template node. Only nodes of this type are affected", default="", maxlen=200)
+    NodeLabel: bpy.props.StringProperty(
+        name="Node Type Name", description="The readable type name of the template node, shown in the panel", default="", maxlen=200)
+    Material: bpy.props.StringProperty(
+        name="Material", description="The material that contains the template node", default="", maxlen=200)
+    FilterLabel: bpy.props.StringProperty(
+        name="Label Filter", description="If specified, this template only affects nodes that have this custom label", default="", maxlen=100)
+
 
 class MatBatchProperties(bpy.types.PropertyGroup):
     BakeTargetNodeColorEnable: bpy.props.BoolProperty(
@@ -58,22 +285,22 @@ class MatBatchProperties(bpy.types.PropertyGroup):
         name="Copied Node Type", description="The type of the node from which settings were copied", default="", maxlen=200)
     UnifyFilterLabel: bpy.props.StringProperty(
         name="Label Filter", description="If specified, the Unify button will only affect any nodes that have this custom label. Case sensitive! Leave blank if you want to alter ALL nodes of the same type as the template node", default="", maxlen=100)
+    UnifyTemplates: bpy.props.CollectionProperty(
+        type=NodeUnifyTemplate, name="Template Set", description="Node Unify templates that are all applied in one pass. Saved with the .blend file")
+    UnifyOnlyChanges: bpy.props.BoolProperty(
+        name="Only Write Changes", description="Compares every setting with the template node before writing it, and skips the ones that already match. Curve points and color ramp stops are kept when their count already matches. Running Unify again over nodes that already match then changes nothing", default=True)
     SwitchShaderTarget: bpy.props.EnumProperty(
         name="Shader", description="The shader to switch in all materials in all selected objects to. For example, if you select Principled, any Emission nodes will be switched to Principled", items=[("EMISSION", 'Emission', 'Fullbright / shadeless shader - not affected by scene lighting', 0), ("BSDF_PRINCIPLED", 'Principled BSDF', 'Standard shader in Blender, affected by scene lighting', 1)], default=0)
     CopiedTexture: bpy.props.StringProperty(
         name="Copied Texture Name", description="The name of the active image texture copied from a selected face", default="", maxlen=200)
     Template: bpy.props.EnumProperty(
-        name="Template", description="The node graph template to apply to all materials in all selected objects", items=[("ECT", 'Emissive + Color + Texture', 'Blends vertex color onto texture, if one exists', 0),
-                                                                                                                         ("EC", 'Emissive + Color', 'Ignores image textures completely', 1),
-                                                                                                                         ("ACCT", 'Alpha Clip + Color + Texture', 'Transparency via alpha clip, and emission', 2),
-                                                                                                                         ("ACT", 'Additive + Color + Texture', 'Combines transparency and emission for an additive effect', 3),
-                                                                                                                         ("AC", 'Additive + Color', 'Combines transparency and emission for an additive effect', 4),
-                                                                                                                         ("PT", 'Principled + Texture', 'Principled shading, with texture', 5),
-                                                                                                                         ("PC", 'Principled + Color', 'Principled shading, with vertex color', 6),
-                                                                                                                         ("HDRT", 'HDR Lightmap', "Emissive but with an HDR lightmap applied for baked lighting. Your HDR's UV map must be named 'lightmap', and your HDR's filename must contain either 'light_', '.hdr' or '.exr' to be detected automatically", 7),
-                                                                                                                         ("PP", 'Mirror UV', "Mirroring / ping pong effect applied to any UV Maps, on both X and Y axis", 8),
-                                                                                                                         ("NO_PP", 'Unmirror UV', "Removes the mirror / ping pong effect from any UV Maps, on both X and Y axis", 9),
-                                                                                                                         ], default=0)
+        name="Template", description="The node graph template to apply to all materials in all selected objects", items=get_template_items, default=0)
+    TemplateLibraryPath: bpy.props.StringProperty(
+        name="Library", description="Optional .blend file with template node groups (named like 'MBT ECT [image]'). When Use Node Groups is enabled, groups found in this file are linked from it instead of being built in every file, so templates can be maintained in one place. Groups missing from the library are built locally as usual", default="", subtype='FILE_PATH')
+    TemplateDiffApply: bpy.props.BoolProperty(
+        name="Only Apply Changes", description="Instead of clearing and rebuilding every material, existing nodes are matched to the template by name and type, and only the settings, nodes and links that differ are changed. Materials that already match the template are left untouched. Reused nodes end up exactly like newly built ones: settings that the template doesn't specify are reset to their defaults", default=True)
+    TemplateInstancing: bpy.props.BoolProperty(
+        name="Use Node Groups", description="Instead of copying the whole template into every material, the template is built once as a shared node group (named 'MBT' + the template). Each material only gets its own textures, color attribute and output, plus the group. Editing the group later changes every material using it", default=False)
     SkipTexture: bpy.props.StringProperty(
         name="Skip Texture", description="Any texture containing this string in its filename will NOT be assigned in any image texture when applying a material template (optional - leave blank if unneeded)", default="", maxlen=200)
     BackfaceCamera: bpy.props.BoolProperty(
@@ -88,7 +315,29 @@ class MatBatchProperties(bpy.types.PropertyGroup):
         name="Trait", description="The trait to look for in materials, in order to isolate their assigned faces into a separate object", items=[("transparent", 'Transparent', "Material uses alpha transparency, via Transparent BSDF or Principled BSDF's alpha slot.", 0),
                                                                                                                          ("emissive", 'Emissive', "Material uses Emission shader or Principled BSDF's Emission slot", 1),
                                                                                                                          ("animated", 'Animated', "Material uses an Image Sequence node, or contains animation data from keyframes and/or drivers", 2),
+                                                                                                                         ("all", 'All Traits', "Isolates every trait at once, each into its own object. Materials are classified in a single pass. A material with more than one trait goes to the first of Animated, Transparent, Emissive", 3),
+                                                                                                                         ], default=0)
+    HashMode: bpy.props.EnumProperty(
+        name="Hash Mode", description="How image pixels are turned into a hash when renaming textures by hash", items=[("QUANTIZED", 'Quantized (8-bit)', "Pixels are quantized to 8 bits per channel before hashing. Textures that only differ by tiny float errors get the same hash", 0),
+                                                                                                                         ("EXACT", 'Exact (Float)', "The raw float pixel values are hashed. Recommended for HDR / EXR textures, where values above 1.0 matter", 1),
+                                                                                                                         ("SOURCE", 'Source Bytes', "The texture's file (or packed data) is hashed as-is, without decoding it, on several threads at once. Only byte-identical files count as duplicates. Generated textures fall back to quantized pixel hashing", 2),
                                                                                                                          ], default=0)
+    HashWorkers: bpy.props.IntProperty(
+        name="Threads", description="Number of threads used by the Source Bytes hash mode. 0 uses one thread per CPU core", default=0, min=0, max=64)
+    HashLimitMemory: bpy.props.BoolProperty(
+        name="Limit Memory", description="Never copy out the pixels of a texture whose float copy would be larger than the memory budget. Those textures are hashed by their file (or packed) bytes instead, or skipped if they have neither, and are listed when hashing finishes. Other textures are quantized and hashed in small chunks, and get exactly the same hashes as without a limit", default=False)
+    HashMemoryBudget: bpy.props.IntProperty(
+        name="Memory Budget (MB)", description="Largest float copy of a texture's pixels that hashing may make when Limit Memory is enabled. An RGBA texture takes 16 bytes per pixel as floats, so a 4K texture needs 256 MB", default=512, min=16, max=65536)
+    HashUseCache: bpy.props.BoolProperty(
+        name="Use Hash Cache", description="Remember texture hashes between sessions, in a small database in Blender's user config folder. Textures whose file hasn't changed (same path, modification time and size) are never decoded again", default=True)
+    HashCacheMaxEntries: bpy.props.IntProperty(
+        name="Max Cache Entries", description="Maximum number of texture hashes kept in the hash cache. When the limit is reached, the least recently used entries are removed first", default=50000, min=100)
+    HashDuplicatesOnly: bpy.props.BoolProperty(
+        name="Duplicates Only", description="Only hash and rename textures that might have a duplicate. Textures are first grouped by a cheap check (file size in Source Bytes mode, resolution and channels otherwise), and any texture that is alone in its group is never hashed and keeps its current name. Every texture is read at most once. Much faster on files with many textures of different sizes", default=False)
+    SimilarThreshold: bpy.props.IntProperty(
+        name="Max Difference", description="Maximum number of differing bits (out of 64) between the perceptual hashes of two textures, for them to count as near-duplicates. 0 only matches visually identical textures. Values above 10 will start matching textures that merely look alike", default=4, min=0, max=32)
+    SimilarApply: bpy.props.BoolProperty(
+        name="Apply Remap", description="If enabled, near-duplicate textures are replaced by their best copy everywhere in the file, and then removed. If disabled, the near-duplicates are only reported", default=False)
 
 
 # FUNCTION DEFINITIONS
@@ -106,14 +355,14 @@ def display_msg_box(message="", title="Info", icon='INFO'):
 
     bpy.context.window_manager.popup_menu(draw, title=title, icon=icon)
 
-def update_alpha_settings(mat, alpha_mode, shadow_mode, alpha_threshold):
+def update_alpha_settings(material, alpha_mode, shadow_mode, alpha_threshold):
     if bpy.app.version >= (4, 2, 0):
 
         if alpha_mode != "CLIP":
             # Remove the Math "Greater Than" node if one exists
-            for node in bpy.data.materials[mat].node_tree.nodes:
+            for node in material.node_tree.nodes:
                 if node.type == 'MATH' and node.operation == "GREATER_THAN":
-                    bpy.data.materials[mat].node_tree.nodes.remove(node)
+                    material.node_tree.nodes.remove(node)
                     break
 
         if alpha_mode == "BLEND":
@@ -126,7 +375,7 @@ def update_alpha_settings(mat, alpha_mode, shadow_mode, alpha_threshold):
             mix_shader_node = None
 
             # Search for existing nodes first
-            for node in bpy.data.materials[mat].node_tree.nodes:
+            for node in material.node_tree.nodes:
                 if node.type == 'MATH' and node.operation == "GREATER_THAN":
                     greaterthan_node = node
                     continue
@@ -141,63 +390,129 @@ def update_alpha_settings(mat, alpha_mode, shadow_mode, alpha_threshold):
                     continue
             if img_tex_node is not None and (principled_node is not None or mix_shader_node is not None):
                 if greaterthan_node is None:
-                    greaterthan_node = bpy.data.materials[mat].node_tree.nodes.new(type='ShaderNodeMath')
+                    greaterthan_node = material.node_tree.nodes.new(type='ShaderNodeMath')
                     greaterthan_node.operation = "GREATER_THAN"
                 greaterthan_node.location = (img_tex_node.location.x + 100, img_tex_node.location.y - 286)
-                bpy.data.materials[mat].node_tree.links.new(img_tex_node.outputs[1], greaterthan_node.inputs[0])
+                material.node_tree.links.new(img_tex_node.outputs[1], greaterthan_node.inputs[0])
                 if principled_node is not None:
-                    bpy.data.materials[mat].node_tree.links.new(greaterthan_node.outputs[0], principled_node.inputs[4])
+                    material.node_tree.links.new(greaterthan_node.outputs[0], principled_node.inputs[4])
                 elif mix_shader_node is not None:
-                    bpy.data.materials[mat].node_tree.links.new(greaterthan_node.outputs[0], mix_shader_node.inputs[0])
+                    material.node_tree.links.new(greaterthan_node.outputs[0], mix_shader_node.inputs[0])
             alpha_mode = "DITHERED"
         else:
             alpha_mode = "DITHERED"
 
-        bpy.data.materials[mat].surface_render_method = alpha_mode
+        material.surface_render_method = alpha_mode
     else:
-        bpy.data.materials[mat].blend_method = alpha_mode
-        bpy.data.materials[mat].shadow_method = shadow_mode
-        bpy.data.materials[mat].alpha_threshold = alpha_threshold
-
-def recursive_node_search(startnode, end_node_type):
-    '''Searches into a node's links for a specific node type. Search ends if a node of the specified type is found, or if .'''
-    endnode = None
-    connecting_nodes = list()
-
-    for x in range(0, 5, 1):
-        for i in startnode.inputs:
-            if len(startnode.inputs) >= (x + 1):
-                for l in startnode.inputs[x].links:
-                    connecting_nodes.append(
-                        startnode.inputs[x].links[x].from_node)
-            else:
-                break
+        material.blend_method = alpha_mode
+        material.shadow_method = shadow_mode
+        material.alpha_threshold = alpha_threshold
+
+def index_links_by_target(node_tree, link_index):
+    ''' Returns a dictionary of node pointer -> links going into that node, built once per node tree and kept in link_index    '''
+    ''' Muted links don't pass anything on, so they're left out. Every graph walk and signature uses this index, so they agree '''
+    key = node_tree.as_pointer()
+    if key not in link_index:
+        incoming = dict()
+        for link in node_tree.links:
+            if not link.is_muted:
+                incoming.setdefault(link.to_node.as_pointer(), []).append(link)
+        link_index[key] = incoming
+    return link_index[key]
+
+def find_upstream_node(start_node, predicate, max_depth=None, socket_filter=None, descend_groups=False):
+    ''' Breadth-first search from start_node against the direction of the links, for the nearest node where predicate(node) is True          '''
+    ''' max_depth limits how many links away the search goes. socket_filter(socket) decides which input sockets are followed (all by default)   '''
+    ''' With descend_groups, the search enters Group nodes through their Group Output, and leaves them again through the matching socket of    '''
+    ''' their Group Input. Every node is visited at most once, so the search is linear in the size of the graph, even with cycles and reroutes '''
+    ''' Returns (node, path), where path is the list of nodes from start_node to the found node, or (None, []) if nothing matches            '''
+    link_index = dict()
+
+    # A search state is (node, stack of the group nodes we're inside of, group input socket we came from)
+    start_state = (start_node, (), None)
+    start_key = (start_node.as_pointer(), (), None)
+    parents = {start_key: None}
+    states = {start_key: start_state}
+    current_level = [start_key]
+    depth = 0
+
+    def upstream_states(node, group_stack, socket_identifier):
+        # Leaving a group: continue from whatever feeds the matching input of the group node outside
+        if node.type == 'GROUP_INPUT':
+            if len(group_stack) == 0:
+                return
+            group_node = group_stack[-1]
+            for link in index_links_by_target(group_node.id_data, link_index).get(group_node.as_pointer(), ()):
+                if link.to_socket.identifier == socket_identifier and (socket_filter is None or socket_filter(link.to_socket)):
+                    yield link.from_node, group_stack[:-1], None
+            return
+
+        # Entering a group: continue from the active Group Output inside it
+        if node.type == 'GROUP' and descend_groups and node.node_tree is not None:
+            for inner_node in node.node_tree.nodes:
+                if inner_node.type == 'GROUP_OUTPUT' and inner_node.is_active_output:
+                    yield inner_node, group_stack + (node,), None
+            return
+
+        for link in index_links_by_target(node.id_data, link_index).get(node.as_pointer(), ()):
+            if socket_filter is None or socket_filter(link.to_socket):
+                if link.from_node.type == 'GROUP_INPUT':
+                    yield link.from_node, group_stack, link.from_socket.identifier
+                else:
+                    yield link.from_node, group_stack, None
+
+    while current_level and (max_depth is None or depth < max_depth):
+        depth += 1
+        next_level = []
+        for key in current_level:
+            node, group_stack, socket_identifier = states[key]
+            for next_node, next_stack, next_identifier in upstream_states(node, group_stack, socket_identifier):
+                next_key = (next_node.as_pointer(), tuple(group.as_pointer() for group in next_stack), next_identifier)
+                if next_key in parents:
+                    continue
+                parents[next_key] = key
+                states[next_key] = (next_node, next_stack, next_identifier)
 
-    while endnode == None:
-        for x in range(0, 5, 1):
-            for n in connecting_nodes:
-                for i in n.inputs:
-                    if len(startnode.inputs) >= (x + 1):
-                        if len(n.inputs[x].links) > 0:
-                            for l in n.inputs[x].links:
-                                if n.inputs[x].links[x].from_node.type == end_node_type:
-                                    endnode = n.inputs[x].links[x].from_node
-                                    return endnode
-                                else:
-                                    connecting_nodes.append(
-                                        n.inputs[x].links[x].from_node)
-                        else:
-                            continue
+                if predicate(next_node):
+                    path = []
+                    while next_key is not None:
+                        path.append(states[next_key][0])
+                        next_key = parents[next_key]
+                    path.reverse()
+                    return path[-1], path
 
-                connecting_nodes.remove(n)
+                next_level.append(next_key)
+        current_level = next_level
 
-        if len(connecting_nodes) < 2:
-            if len(connecting_nodes) < 1:
-                return None
-            elif len(connecting_nodes[0].inputs.links) < 1:
-                return None
-            else:
-                continue
+    return None, []
+
+def is_diffuse_texture_node(node, require_image=False):
+    ''' Checks if a node is an Image Texture whose color output goes into a "color" socket, or a Mix node's A and B sockets '''
+    if node.type != "TEX_IMAGE" or (require_image and not node.image):
+        return False
+
+    for link in node.outputs[0].links:
+        if "Color" in link.to_socket.name or "A" in link.to_socket.name or "B" in link.to_socket.name or link.to_socket.type == 'RGBA':
+            return True
+    return False
+
+def find_diffuse_texture_node(material, require_image=False):
+    ''' Returns the diffuse Image Texture node closest to the Material Output. If none is connected to the output, '''
+    ''' the first diffuse Image Texture node in the node tree is returned instead, or None if there is none at all  '''
+    if material is None or material.node_tree is None:
+        return None
+
+    for node in material.node_tree.nodes:
+        if node.type == 'OUTPUT_MATERIAL':
+            diffuse, path = find_upstream_node(node, lambda candidate: is_diffuse_texture_node(candidate, require_image))
+            if diffuse is not None:
+                return diffuse
+            break
+
+    for node in material.node_tree.nodes:
+        if is_diffuse_texture_node(node, require_image):
+            return node
+    return None
 
 def check_for_selected(objectOnly=False):
     list_of_mats = set()
@@ -224,65 +539,1762 @@ def check_for_selected(objectOnly=False):
     else:
         return False
 
-def is_node_connected(material, node_to_check):
-    ''' Checks if a specified node is actually connected (indirectly or directly) to the final Material Output'''
-    
-    output_node = None
+# One unique material used by the selected objects, with every selected mesh object that uses it, and one of those objects
+# to read per-object data from (like UV map and color attribute names)
+MaterialWorkItem = namedtuple("MaterialWorkItem", ["material", "owners", "representative"])
+
+def plan_material_work():
+    ''' Returns a list of MaterialWorkItem, one per unique material in the selected mesh objects, so each material is only processed once '''
+    ''' Empty material slots are skipped. Returns False (like check_for_selected) if there's nothing to process                             '''
+    if check_for_selected() == False:
+        return False
+
+    work_items = dict()
+    for obj in bpy.context.selected_objects:
+        if obj.type == "MESH":
+            for slot in obj.material_slots:
+                material = slot.material
+                if material == None:
+                    continue
+
+                work_item = work_items.get(material.as_pointer())
+                if work_item == None:
+                    work_items[material.as_pointer()] = MaterialWorkItem(material, [obj], obj)
+                elif work_item.owners[-1] != obj:
+                    work_item.owners.append(obj)
+
+    if len(work_items) == 0:
+        display_msg_box(
+            "There are no valid materials in the selected objects", "Error", "ERROR")
+        return False
+    return list(work_items.values())
+
+def update_owner_meshes(work_items):
+    ''' Calls update() once on every mesh used by the owners of the given work items, even if the mesh is shared by several objects '''
+    meshes = dict()
+    for work_item in work_items:
+        for obj in work_item.owners:
+            meshes.setdefault(obj.data.as_pointer(), obj.data)
+    for mesh in meshes.values():
+        mesh.update()
+
+# One unique mesh used by the selected objects, with every selected object that uses it
+MeshWorkItem = namedtuple("MeshWorkItem", ["mesh", "owners"])
+
+def plan_mesh_work():
+    ''' Returns a list of MeshWorkItem, one per unique mesh in the selected mesh objects, so a mesh shared by many objects is only processed '''
+    ''' (and updated) once. Returns False (like check_for_selected) if no objects are selected                                                '''
+    if check_for_selected(True) == False:
+        return False
+
+    work_items = dict()
+    for obj in bpy.context.selected_objects:
+        if obj.type == "MESH":
+            work_item = work_items.get(obj.data.as_pointer())
+            if work_item == None:
+                work_items[obj.data.as_pointer()] = MeshWorkItem(obj.data, [obj])
+            else:
+                work_item.owners.append(obj)
+    return list(work_items.values())
+
+connected_nodes_cache = dict()
+
+def clear_connected_nodes_cache():
+    ''' Forgets every memoized reachability set. Called at the start of each operator run, since node trees may have changed in between '''
+    connected_nodes_cache.clear()
+
+def invalidate_connected_nodes(material):
+    ''' Forgets the memoized reachability set of one material. Must be called after its node tree is modified '''
+    connected_nodes_cache.pop(material.as_pointer(), None)
+
+def get_connected_nodes(material):
+    ''' Returns the set of pointers (node.as_pointer()) of every node that feeds the Material Output, directly or indirectly '''
+    ''' Computed once per material with an iterative, visited-set traversal in O(nodes + links), then memoized             '''
+    key = material.as_pointer()
+    if key in connected_nodes_cache:
+        return connected_nodes_cache[key]
+
+    connected = set()
+    connected_nodes_cache[key] = connected
+    if material.node_tree is None:
+        return connected
+
     # Find the Material Output node
+    output_node = None
     for node in material.node_tree.nodes:
         if node.type == 'OUTPUT_MATERIAL':
             output_node = node
             break
-    
-    if not output_node:
-        return False
-    
-    # Function to recursively check connections
-    def check_connections(current_node):
-        if current_node == node_to_check:
-            return True
-        for input_socket in current_node.inputs:
-            for link in input_socket.links:
-                source_node = link.from_node
-                if check_connections(source_node):
-                    return True
-        return False
-    
-    # Start from the output node and check connections
-    return check_connections(output_node)
 
-def find_faces_with_material(mesh_obj, material_name):
-    if material_name not in mesh_obj.data.materials:
-        return []
+    if output_node is None:
+        return connected
 
-    mat_index = mesh_obj.data.materials.find(material_name)
-    faces_with_material = [poly.index for poly in mesh_obj.data.polygons if poly.material_index == mat_index]
-    return faces_with_material
+    # Index the links once, since socket.links scans every link in the tree on each access
+    incoming = index_links_by_target(material.node_tree, dict())
 
-def separate_faces(mesh_obj, face_indices):
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.reveal()
-    bpy.ops.mesh.select_all(action='DESELECT')
-    bpy.ops.mesh.select_mode(use_extend=False, use_expand=False, type='FACE')
-    bpy.ops.object.mode_set(mode='OBJECT')
+    connected.add(output_node.as_pointer())
+    pending = [output_node]
+    while pending:
+        node = pending.pop()
+        for link in incoming.get(node.as_pointer(), ()):
+            source_node = link.from_node
+            pointer = source_node.as_pointer()
+            if pointer not in connected:
+                connected.add(pointer)
+                pending.append(source_node)
+
+    return connected
+
+def is_node_connected(material, node_to_check):
+    ''' Checks if a specified node is actually connected (indirectly or directly) to the final Material Output'''
+    return node_to_check.as_pointer() in get_connected_nodes(material)
+
+# Node properties that are only about layout, display or identity, and are never copied or compared between nodes
+NODE_SETTINGS_SKIP_LIST = ('rna_type', 'type', 'location', 'width', 'width_hidden', 'height', 'dimensions', 'name', 'label', 'inputs', 'outputs', 'internal_links', 'parent', 'use_custom_color', 'color', 'select', 'show_options',
+                           'show_preview', 'hide', 'mute', 'show_texture', 'bl_idname', 'bl_label', 'bl_description', 'bl_icon', 'bl_static_type', 'bl_width_default', 'bl_width_min', 'bl_width_max', 'bl_height_default', 'bl_height_min', 'bl_height_max')
+
+# Number of refinement rounds used by node_tree_signature. Each round lets a node's label take in one more link of its upstream graph
+NODE_SIGNATURE_ROUNDS = 3
+
+signature_properties = dict()
+
+def get_signature_properties(node):
+    ''' Returns the (identifier, default value) pairs of every writable, non-collection setting of a node type. Cached per bl_idname '''
+    if node.bl_idname not in signature_properties:
+        properties = []
+        for prop in node.bl_rna.properties:
+            if prop.identifier in NODE_SETTINGS_SKIP_LIST or prop.is_readonly or prop.type == 'COLLECTION':
+                continue
+
+            if prop.type == 'POINTER':
+                default = None
+            elif prop.type == 'ENUM' and prop.is_enum_flag:
+                default = set(prop.default_flag)
+            elif getattr(prop, "is_array", False):
+                default = signature_value(prop.default_array)
+            else:
+                default = prop.default
+            properties.append((prop.identifier, signature_value(default)))
+        signature_properties[node.bl_idname] = properties
+    return signature_properties[node.bl_idname]
+
+def signature_value(value, tree_signatures=None):
+    ''' Turns a property or socket value into a plain, session-independent value. Floats are rounded so that float noise doesn't count as a change '''
+    if isinstance(value, bool) or isinstance(value, int) or isinstance(value, str) or value is None:
+        return value
+    if isinstance(value, float):
+        return round(value, 5) + 0.0
+    if isinstance(value, set):
+        return tuple(sorted(value))
+    if isinstance(value, bpy.types.Image):
+        path = image_source_path(value)
+        return ("IMAGE", path if path is not None else value.name)
+    if isinstance(value, bpy.types.NodeTree):
+        return ("NODETREE", node_tree_signature(value, tree_signatures))
+    if isinstance(value, bpy.types.ID):
+        return (value.bl_rna.identifier, value.name)
+    try:
+        return tuple(signature_value(item, tree_signatures) for item in value)
+    except TypeError:
+        return str(value)
+
+def node_settings_signature(node, tree_signatures=None, linked_sockets=None):
+    ''' Returns the settings of a single node (type, non-default properties, unlinked socket values, curves and ramps) as a string '''
+    ''' linked_sockets is the set of socket pointers with an unmuted link into them. Without it, socket.is_linked is used        '''
+    settings = [node.bl_idname, node.label, node.mute]
+
+    for identifier, default in get_signature_properties(node):
+        value = signature_value(getattr(node, identifier, None), tree_signatures)
+        if value != default:
+            settings.append((identifier, value))
+
+    for socket in node.inputs:
+        is_linked = socket.is_linked if linked_sockets is None else socket.as_pointer() in linked_sockets
+        if not is_linked and hasattr(socket, "default_value"):
+            settings.append(("in", socket.identifier, signature_value(socket.default_value)))
+    for socket in node.outputs:
+        if hasattr(socket, "default_value"):
+            settings.append(("out", socket.identifier, signature_value(socket.default_value)))
+
+    if 'CURVE' in node.type:
+        for curve in node.mapping.curves:
+            settings.append(tuple((signature_value(point.location), point.handle_type) for point in curve.points))
+    if 'VALTORGB' in node.type:
+        settings.append((node.color_ramp.color_mode, node.color_ramp.interpolation, node.color_ramp.hue_interpolation))
+        settings.append(tuple((signature_value(stop.position), signature_value(stop.color)) for stop in node.color_ramp.elements))
+
+    return repr(settings)
+
+def node_tree_signature(node_tree, tree_signatures=None):
+    ''' Returns an MD5 signature of the structure of a node tree: node types, settings, socket values, links and referenced images             '''
+    ''' Node names, locations and the order nodes and links were created in don't affect it, so two identical setups always get the same one '''
+    ''' Node groups are included through their own signature, which is computed once per group and stored in tree_signatures                   '''
+    if node_tree is None:
+        return hashlib.md5(b"").hexdigest()
+
+    if tree_signatures is None:
+        tree_signatures = dict()
+    key = node_tree.as_pointer()
+    if key in tree_signatures:
+        return tree_signatures[key]
+    # Placeholder, so a group that (somehow) contains itself doesn't recurse forever
+    tree_signatures[key] = ""
+
+    # Muted links are left out by the shared link index, the same way the reachability walk leaves them out. An input whose only
+    # link is muted counts as unlinked, so its own value is part of the signature
+    links_by_target = index_links_by_target(node_tree, dict())
+    linked_sockets = set(link.to_socket.as_pointer() for links in links_by_target.values() for link in links)
+
+    # Start every node with a label made from its own settings. Frames are layout only, so they're left out
+    labels = dict()
+    for node in node_tree.nodes:
+        if node.type != 'FRAME':
+            labels[node.as_pointer()] = hashlib.md5(node_settings_signature(node, tree_signatures, linked_sockets).encode()).hexdigest()
+
+    incoming = {pointer: [] for pointer in labels}
+    for to_pointer, links in links_by_target.items():
+        for link in links:
+            from_pointer = link.from_node.as_pointer()
+            if from_pointer in labels and to_pointer in labels:
+                incoming[to_pointer].append((from_pointer, link.from_socket.identifier, link.to_socket.identifier))
+
+    # Refine each label with the (sorted) labels of the nodes linked into it, so identical nodes in different places get different labels
+    for _ in range(NODE_SIGNATURE_ROUNDS):
+        refined = dict()
+        for pointer, label in labels.items():
+            upstream = sorted((labels[from_pointer], from_socket, to_socket) for from_pointer, from_socket, to_socket in incoming[pointer])
+            refined[pointer] = hashlib.md5((label + repr(upstream)).encode()).hexdigest()
+        labels = refined
+
+    signature = hashlib.md5()
+    for label in sorted(labels.values()):
+        signature.update(label.encode())
+    for link in sorted((labels[from_pointer], from_socket, labels[to_pointer], to_socket) for to_pointer in incoming for from_pointer, from_socket, to_socket in incoming[to_pointer]):
+        signature.update(repr(link).encode())
+
+    tree_signatures[key] = signature.hexdigest()
+    return tree_signatures[key]
+
+def get_writable_properties(node):
+    ''' Returns the names of the settings of a node type that Node Unify copies. Shares the per-bl_idname cache of get_signature_properties '''
+    return tuple(identifier for identifier, default in get_signature_properties(node))
+
+def snapshot_value(value):
+    ''' Copies arrays (like colors and vectors) into tuples, so a snapshot doesn't keep referencing the template node's memory '''
+    if isinstance(value, (str, set)) or hasattr(value, "bl_rna"):
+        return value
+    if hasattr(value, "__len__"):
+        return tuple(value)
+    return value
+
+def resize_elements(elements, count, add_element):
+    ''' Adds or removes curve points / color ramp stops at the end until there are count of them. Blender refuses to remove the last ones '''
+    while len(elements) > count:
+        try:
+            elements.remove(elements[len(elements) - 1])
+        except RuntimeError:
+            break
+    while len(elements) < count:
+        add_element()
+
+class NodeSettingsSnapshot:
+    ''' The settings of a Node Unify template node, captured once: property values, input default values, curve points and ramp stops '''
+    ''' apply() writes them into another node of the same type with plain attribute access                                             '''
+
+    def __init__(self, node):
+        self.type = node.type
+        self.properties = tuple((identifier, snapshot_value(getattr(node, identifier))) for identifier in get_writable_properties(node))
+
+        # Inputs are matched by index. Sockets without a value (like shader sockets) are stored as None
+        self.inputs = tuple(snapshot_value(socket.default_value) if hasattr(socket, "default_value") else None for socket in node.inputs)
+
+        self.curves = None
+        if 'CURVE' in node.type:
+            self.curves = tuple(tuple((tuple(point.location), point.handle_type) for point in curve.points) for curve in node.mapping.curves)
+            self.curve_clip = (node.mapping.use_clip, node.mapping.clip_min_x, node.mapping.clip_min_y, node.mapping.clip_max_x, node.mapping.clip_max_y)
+
+        self.ramp = None
+        if 'VALTORGB' in node.type:
+            self.ramp = tuple((stop.position, tuple(stop.color)) for stop in node.color_ramp.elements)
+            self.ramp_modes = (node.color_ramp.color_mode, node.color_ramp.hue_interpolation, node.color_ramp.interpolation)
+
+    def with_overrides(self, properties, inputs):
+        ''' Returns a copy of the snapshot with some values replaced: properties as (identifier, value) pairs, inputs as {index: value} '''
+        snapshot = copy.copy(self)
+        overrides = dict(properties)
+        snapshot.properties = tuple((identifier, overrides.pop(identifier, value)) for identifier, value in self.properties) + tuple(overrides.items())
+        snapshot.inputs = tuple(inputs.get(index, value) for index, value in enumerate(self.inputs))
+        return snapshot
+
+    def apply(self, node, only_if_different=False):
+        ''' Copies the snapshot into node. With only_if_different, values that already match are not written. Returns whether anything was written '''
+        changed = False
+
+        def write(owner, identifier, value):
+            nonlocal changed
+            if only_if_different and not template_value_differs(getattr(owner, identifier), value):
+                return
+            setattr(owner, identifier, value)
+            changed = True
+
+        for index, socket in enumerate(node.inputs):
+            if index < len(self.inputs) and self.inputs[index] is not None and hasattr(socket, "default_value"):
+                write(socket, "default_value", self.inputs[index])
+
+        for identifier, value in self.properties:
+            write(node, identifier, value)
+
+        # Existing curve points and ramp stops are kept when their count already matches the template's
+        if self.curves is not None and 'CURVE' in node.type:
+            mapping = node.mapping
+            changed_before = changed
+            for curve, points in zip(mapping.curves, self.curves):
+                if len(curve.points) != len(points):
+                    resize_elements(curve.points, len(points), lambda: curve.points.new(1, 1))
+                    changed = True
+                for point, (location, handle_type) in zip(curve.points, points):
+                    write(point, "location", location)
+                    write(point, "handle_type", handle_type)
+            for identifier, value in zip(("use_clip", "clip_min_x", "clip_min_y", "clip_max_x", "clip_max_y"), self.curve_clip):
+                write(mapping, identifier, value)
+            if changed != changed_before or not only_if_different:
+                mapping.update()
+
+        if self.ramp is not None and 'VALTORGB' in node.type:
+            color_ramp = node.color_ramp
+            changed_before = changed
+            if len(color_ramp.elements) != len(self.ramp):
+                resize_elements(color_ramp.elements, len(self.ramp), lambda: color_ramp.elements.new(1.0))
+                changed = True
+            for stop, (position, color) in zip(color_ramp.elements, self.ramp):
+                write(stop, "position", position)
+                write(stop, "color", color)
+            for identifier, value in zip(("color_mode", "hue_interpolation", "interpolation"), self.ramp_modes):
+                write(color_ramp, identifier, value)
+            if changed != changed_before or not only_if_different:
+                color_ramp.elements.update()
+
+        return changed
+
+def get_unify_template_node(material_name, node_name):
+    ''' Returns a Node Unify template node, or None if it or its material no longer exists '''
+    material = bpy.data.materials.get(material_name)
+    if material is None or material.node_tree is None:
+        return None
+    return material.node_tree.nodes.get(node_name)
+
+def unify_nodes(work_items, dispatch, template_nodes, only_if_different=False):
+    ''' Applies Node Unify snapshots in one pass over the node tree of each work item. dispatch maps a node type to {label filter: snapshot}    '''
+    ''' A node uses the snapshot of its own label if there is one, otherwise the unfiltered ("") one. Returns the number of changed nodes '''
+    skip = {node.as_pointer() for node in template_nodes}
+    num_changed = 0
+    for work_item in work_items:
+        for node in work_item.material.node_tree.nodes:
+            by_label = dispatch.get(node.type)
+            if by_label is None or node.as_pointer() in skip:
+                continue
+            snapshot = by_label.get(node.label) if node.label != "" else None
+            if snapshot is None:
+                snapshot = by_label.get("")
+            if snapshot is not None and snapshot.apply(node, only_if_different):
+                num_changed += 1
+    return num_changed
+
+# Material settings that are only about identity, bookkeeping or the preview thumbnail. Every other writable, non-pointer setting of a material
+# (and of its Cycles settings) can change how it renders, so it's part of the material signature
+MATERIAL_SIGNATURE_SKIP_LIST = ('rna_type', 'name', 'use_fake_user', 'use_extra_user', 'tag', 'is_runtime_data', 'paint_active_slot', 'preview_render_type', 'use_preview_world')
+
+material_signature_settings = dict()
+
+def get_material_signature_settings(settings_owner):
+    ''' Returns the identifiers of every writable, non-pointer, non-collection setting of a material or its Cycles settings. Cached per RNA type '''
+    key = settings_owner.bl_rna.identifier
+    if key not in material_signature_settings:
+        material_signature_settings[key] = [prop.identifier for prop in settings_owner.bl_rna.properties
+                                            if prop.identifier not in MATERIAL_SIGNATURE_SKIP_LIST and not prop.is_readonly and prop.type not in ('POINTER', 'COLLECTION')]
+    return material_signature_settings[key]
+
+def animation_signature(animation_data):
+    ''' Returns the keyframes, drivers and NLA strips of an ID's animation data as plain values, or None if there is none. Layered actions '''
+    ''' (Blender 4.4+) that don't expose their F-Curves directly are identified by the action itself, so they only match the same action '''
+    if animation_data is None:
+        return None
+
+    keyframes = None
+    action = animation_data.action
+    if action is not None:
+        if hasattr(action, "fcurves") and not (hasattr(action, "layers") and len(action.layers) > 0):
+            keyframes = sorted((fcurve.data_path, fcurve.array_index, fcurve.extrapolation,
+                                tuple((signature_value(point.co), point.interpolation, signature_value(point.handle_left), signature_value(point.handle_right))
+                                      for point in fcurve.keyframe_points))
+                               for fcurve in action.fcurves)
+        else:
+            keyframes = ("ACTION", action.as_pointer())
+
+    drivers = sorted((fcurve.data_path, fcurve.array_index, fcurve.driver.type, fcurve.driver.expression,
+                      tuple((variable.name, variable.type, tuple((target.id.name if target.id else None, target.data_path, target.transform_type)
+                                                                 for target in variable.targets))
+                            for variable in fcurve.driver.variables))
+                     for fcurve in animation_data.drivers)
+
+    strips = tuple((track.name, track.mute, tuple((strip.action.as_pointer() if strip.action else None, signature_value(strip.frame_start), signature_value(strip.frame_end))
+                                                  for strip in track.strips))
+                   for track in animation_data.nla_tracks)
+
+    return (keyframes, drivers, strips)
+
+def material_signature(material, tree_signatures=None):
+    ''' Returns an MD5 signature of a material: its node tree signature, every render-relevant setting of the material and its Cycles  '''
+    ''' settings, and the animation (keyframes and drivers) of the material and its node tree, so differently animated materials are never merged '''
+    settings = [node_tree_signature(material.node_tree, tree_signatures)]
+    settings.append(("animation", animation_signature(material.animation_data)))
+    if material.node_tree is not None:
+        settings.append(("node_tree_animation", animation_signature(material.node_tree.animation_data)))
+    for setting in get_material_signature_settings(material):
+        settings.append((setting, signature_value(getattr(material, setting))))
+    cycles_settings = getattr(material, "cycles", None)
+    if cycles_settings is not None:
+        for setting in get_material_signature_settings(cycles_settings):
+            settings.append(("cycles." + setting, signature_value(getattr(cycles_settings, setting))))
+    return hashlib.md5(repr(settings).encode()).hexdigest()
+
+def is_numbered_duplicate_name(name):
+    ''' Checks if a datablock name ends with Blender's ".001" style duplicate suffix '''
+    base, dot, suffix = name.rpartition(".")
+    return dot != "" and base != "" and suffix.isdigit()
+
+def is_hdr_image(image):
+    ''' Checks if an image is an HDR / EXR texture, or named like a lightmap '''
+    return 'OPEN_EXR' in image.file_format or 'HDR' in image.file_format or 'lightmap' in image.name_full
+
+def add_ping_pong_nodes(node_tree):
+    ''' Inserts a Ping Pong (mirroring) node setup after every UV Map node in a node tree '''
+    uv_map_nodes = [node for node in node_tree.nodes if node.type == 'UVMAP']
+
+    for uv_map_node in uv_map_nodes:
+        connections = [link.to_socket for link in uv_map_node.outputs[0].links]
+
+        # Create a Separate XYZ node
+        separate_xyz_node = node_tree.nodes.new(type='ShaderNodeSeparateXYZ')
+        separate_xyz_node.label = "Ping Pong Separate"
+        separate_xyz_node.location = uv_map_node.location.x, uv_map_node.location.y + 200
+        node_tree.links.new(uv_map_node.outputs[0], separate_xyz_node.inputs[0])
+
+        # Create the first Math node
+        math_node_1 = node_tree.nodes.new(type='ShaderNodeMath')
+        math_node_1.operation = 'PINGPONG'
+        math_node_1.label = "Ping Pong X"
+        math_node_1.inputs[1].default_value = 1.0
+        math_node_1.location = separate_xyz_node.location.x + 200, separate_xyz_node.location.y
+        node_tree.links.new(separate_xyz_node.outputs[0], math_node_1.inputs[0])
+
+        # Create the second Math node
+        math_node_2 = node_tree.nodes.new(type='ShaderNodeMath')
+        math_node_2.operation = 'PINGPONG'
+        math_node_2.label = "Ping Pong Y"
+        math_node_2.inputs[1].default_value = 1.0
+        math_node_2.location = separate_xyz_node.location.x + 200, separate_xyz_node.location.y - 100
+        node_tree.links.new(separate_xyz_node.outputs[1], math_node_2.inputs[0])
+
+        # Create the Combine XYZ node
+        combine_xyz_node = node_tree.nodes.new(type='ShaderNodeCombineXYZ')
+        combine_xyz_node.location = math_node_1.location.x + 200, (math_node_1.location.y + math_node_2.location.y) / 2
+        combine_xyz_node.label = "Ping Pong Combine"
+        combine_xyz_node.inputs[2].default_value = 0.0
+        node_tree.links.new(math_node_1.outputs['Value'], combine_xyz_node.inputs[0])
+        node_tree.links.new(math_node_2.outputs['Value'], combine_xyz_node.inputs[1])
+
+        # Reconnect the original connections to the Combine XYZ node
+        for socket in connections:
+            node_tree.links.new(combine_xyz_node.outputs['Vector'], socket)
+
+def remove_ping_pong_nodes(node_tree):
+    ''' Removes every Ping Pong node setup added by add_ping_pong_nodes, reconnecting the UV Map nodes directly '''
+    pp_separate_nodes = [node for node in node_tree.nodes if node.label == 'Ping Pong Separate']
+
+    for pp_separate_node in pp_separate_nodes:
+        in_node = pp_separate_node.inputs[0].links[0].from_node
+        pp_x_node = pp_separate_node.outputs[0].links[0].to_node
+        pp_y_node = pp_separate_node.outputs[1].links[0].to_node
+        pp_combine_node = pp_x_node.outputs[0].links[0].to_node
+        out_nodes = [link.to_node for link in pp_combine_node.outputs[0].links]
+
+        # Reconnect the original connections to the Combine XYZ node
+        for out_node in out_nodes:
+            node_tree.links.new(in_node.outputs[0], out_node.inputs[0])
+
+        # Remove Ping Pong nodes
+        node_tree.nodes.remove(pp_x_node)
+        node_tree.nodes.remove(pp_y_node)
+        node_tree.nodes.remove(pp_combine_node)
+        node_tree.nodes.remove(pp_separate_node)
+
+# Templates with a "transform" modify the existing node tree with one of these, instead of rebuilding it
+MATERIAL_TEMPLATE_TRANSFORMS = {
+    "PING_PONG": add_ping_pong_nodes,
+    "REMOVE_PING_PONG": remove_ping_pong_nodes,
+}
 
-    for face_index in face_indices:
-        if face_index < len(mesh_obj.data.polygons):
-            mesh_obj.data.polygons[face_index].select = True
+TEMPLATE_CONDITIONS = ("image", "transparency", "alpha_channel", "hdr_image")
+
+# Resolved parts of a compiled template. required / forbidden are the sets of conditions that must be true / false
+TemplateSetting = namedtuple("TemplateSetting", ["attribute", "value", "required", "forbidden"])
+TemplateNode = namedtuple("TemplateNode", ["name", "bl_idname", "location", "label", "properties", "inputs", "required", "forbidden"])
+TemplateLink = namedtuple("TemplateLink", ["from_name", "from_socket", "to_name", "to_socket", "required", "forbidden"])
+
+def template_entry_applies(entry, version):
+    ''' Checks the optional "min_version" (inclusive) and "max_version" (exclusive) of a template entry against a Blender version '''
+    minimum = entry.get("min_version")
+    maximum = entry.get("max_version")
+    return (minimum is None or version >= tuple(minimum)) and (maximum is None or version < tuple(maximum))
+
+def resolve_versioned(value, version):
+    ''' Returns the "value" of the first matching entry if value is a list of versioned entries, or value itself otherwise '''
+    if isinstance(value, list) and len(value) > 0 and all(isinstance(entry, dict) for entry in value):
+        for entry in value:
+            if template_entry_applies(entry, version):
+                return entry["value"]
+        return None
+    return value
+
+def get_material_template(key):
+    ''' Returns the template data for a template key, preferring user templates. Raises ValueError if there is no such template '''
+    template = user_templates.get(key, MATERIAL_TEMPLATES.get(key))
+    if template is None:
+        raise ValueError(f"The material template '{key}' doesn't exist. Try reloading the templates")
+    return template
+
+class MaterialTemplate:
+    ''' A material template compiled for the running Blender version. Version checks, type aliases, socket names and unsupported '''
+    ''' properties are all resolved once here, so apply() only has to check conditions, create nodes and link them per material   '''
+
+    def __init__(self, key, template, skip_texture="", version=None, library_path=None):
+        self.key = key
+        self.skip_texture = skip_texture
+        self.library_path = library_path
+        self.version = tuple(version if version is not None else bpy.app.version)
+        self.image_rule = template.get("image")
+        self.use_hdr_image = template.get("hdr_image", False)
+        self.fallback_hdr_image = False
+        self.transform = None
+        self.settings = []
+        self.nodes = []
+        self.links = []
+        self.condition_names = set()
+        self.outer_names = set()
+        self.groups = dict()
+        self.node_defaults = dict()
+
+        # The library is checked and indexed here, while the template is compiled, so a missing or unreadable library is reported
+        # before any material is changed. The index is cached, so this only reads the file once per session
+        if library_path is not None:
+            if not os.path.isfile(library_path):
+                raise ValueError(f"The template library '{library_path}' doesn't exist")
+            get_template_library_groups(library_path)
+
+        if self.image_rule not in (None, "FIRST", "CONNECTED_LDR"):
+            raise ValueError(f"Template '{key}': unknown image rule '{self.image_rule}'")
+
+        if "transform" in template:
+            if template["transform"] not in MATERIAL_TEMPLATE_TRANSFORMS:
+                raise ValueError(f"Template '{key}': unknown transform '{template['transform']}'")
+            self.transform = MATERIAL_TEMPLATE_TRANSFORMS[template["transform"]]
+            return
+
+        for entry in template.get("material", []):
+            if template_entry_applies(entry, self.version):
+                required, forbidden = self.compile_conditions(entry)
+                for attribute, value in entry["set"].items():
+                    self.settings.append(TemplateSetting(attribute, value, required, forbidden))
+
+        declared_names = set(entry["name"] for entry in template.get("nodes", []))
+        node_types = dict()
+        for entry in template.get("nodes", []):
+            if not template_entry_applies(entry, self.version):
+                continue
 
+            bl_idname = resolve_versioned(TEMPLATE_NODE_TYPES.get(entry["type"], entry["type"]), self.version)
+            node_class = getattr(bpy.types, bl_idname, None) if bl_idname is not None else None
+            if node_class is None:
+                raise ValueError(f"Template '{key}': unknown node type '{entry['type']}'")
+
+            # Properties that this node type doesn't have in the running Blender version are skipped
+            known_properties = node_class.bl_rna.properties.keys()
+            properties = tuple((attribute, value) for attribute, value in entry.get("properties", {}).items() if attribute in known_properties)
+            inputs = tuple((self.compile_socket(bl_idname, "inputs", socket), value) for socket, value in entry.get("inputs", {}).items())
+
+            required, forbidden = self.compile_conditions(entry)
+            node_types[entry["name"]] = bl_idname
+            self.nodes.append(TemplateNode(entry["name"], bl_idname, tuple(entry.get("location", (0, 0))), entry.get("label", ""),
+                                           properties, inputs, required, forbidden))
+
+        for entry in template.get("links", []):
+            if not template_entry_applies(entry, self.version):
+                continue
+
+            (from_name, from_socket), (to_name, to_socket) = entry["from"], entry["to"]
+            for name in (from_name, to_name):
+                if name not in declared_names:
+                    raise ValueError(f"Template '{key}': link uses unknown node '{name}'")
+
+            # Links to nodes that aren't built in this Blender version are dropped
+            if from_name not in node_types or to_name not in node_types:
+                continue
+
+            required, forbidden = self.compile_conditions(entry)
+            self.links.append(TemplateLink(from_name, self.compile_socket(node_types[from_name], "outputs", from_socket),
+                                           to_name, self.compile_socket(node_types[to_name], "inputs", to_socket), required, forbidden))
+
+        # For node group instancing: nodes with per-material variables stay in each material, along with the Material Output,
+        # and so do input nodes that only feed those (like the UV Map of a texture). Everything else goes into the shared node group
+        for spec in self.nodes:
+            if spec.bl_idname == 'ShaderNodeOutputMaterial' or any(isinstance(value, str) and value.startswith("$") for attribute, value in spec.properties):
+                self.outer_names.add(spec.name)
+        for spec in self.nodes:
+            targets = set(link.to_name for link in self.links if link.from_name == spec.name)
+            has_inputs = any(link.to_name == spec.name for link in self.links)
+            if not has_inputs and len(targets) > 0 and targets <= self.outer_names:
+                self.outer_names.add(spec.name)
+
+    def compile_conditions(self, entry):
+        required = set()
+        forbidden = set()
+        for condition in entry.get("when", []):
+            name = condition.lstrip("!")
+            if name not in TEMPLATE_CONDITIONS:
+                raise ValueError(f"Template '{self.key}': unknown condition '{condition}'")
+            (forbidden if condition.startswith("!") else required).add(name)
+            self.condition_names.add(name)
+        return frozenset(required), frozenset(forbidden)
+
+    def compile_socket(self, bl_idname, direction, socket):
+        ''' Turns a socket alias into the socket index for this Blender version. Other names and indices are kept as they are '''
+        socket_map = TEMPLATE_SOCKET_MAPS.get(bl_idname, {}).get(direction, {})
+        if socket in socket_map:
+            return resolve_versioned(socket_map[socket], self.version)
+        return socket
+
+    def find_hdr_image(self, material):
+        ''' Returns the HDR texture used in the material, or else one from this Blender file (looked up only once per run) '''
+        for node in material.node_tree.nodes:
+            if node.type == 'TEX_IMAGE' and node.image and is_hdr_image(node.image):
+                return node.image
+
+        if self.fallback_hdr_image == False:
+            self.fallback_hdr_image = None
+            for searched_img in bpy.data.images:
+                if is_hdr_image(searched_img):
+                    self.fallback_hdr_image = searched_img
+        return self.fallback_hdr_image
+
+    def gather(self, material, obj):
+        ''' Returns the per-material variables and the set of conditions that are true for this material '''
+        variables = dict()
+        flags = set()
+
+        if self.image_rule is not None:
+            image_node = None
+            for node in material.node_tree.nodes:
+                if node.type == 'TEX_IMAGE' and node.image:
+                    # With CONNECTED_LDR, make sure we're not using the HDR texture as the albedo
+                    if self.image_rule == "FIRST" or (not is_hdr_image(node.image) and is_node_connected(material, node)):
+                        image_node = node
+                        break
+
+            if image_node is not None:
+
+                # Check if the found texture was being used for transparency previously
+                for output in image_node.outputs:
+                    for link in output.links:
+                        if (link.to_node.type == "BSDF_PRINCIPLED" and link.to_socket.identifier == "Alpha") or (link.to_node.type == "MIX_SHADER" and link.to_socket.identifier == "Fac") or (link.to_node.type == "MATH" and link.to_node.operation == "GREATER_THAN"):
+                            flags.add("transparency")
+                            if output.identifier == "Alpha":
+                                flags.add("alpha_channel")
+                            break
+                    if "transparency" in flags:
+                        break
+
+                # Check if the designated "skipped texture" was stored
+                if self.skip_texture == "" or self.skip_texture not in image_node.image.filepath:
+                    variables["image"] = image_node.image
+                    flags.add("image")
+
+        if self.use_hdr_image:
+            variables["hdr_image"] = self.find_hdr_image(material)
+            if variables["hdr_image"] is not None:
+                flags.add("hdr_image")
+
+        if len(obj.data.uv_layers) > 0:
+            variables["uv_map"] = obj.data.uv_layers[0].name
+        if bpy.app.version >= (3, 2, 0):
+            if len(obj.data.color_attributes) > 0:
+                variables["color_attribute"] = obj.data.color_attributes[0].name
+        else:
+            if len(obj.data.vertex_colors) > 0:
+                variables["color_attribute"] = obj.data.vertex_colors[0].name
+
+        return variables, flags
+
+    def is_active(self, spec, flags):
+        return spec.required <= flags and not (spec.forbidden & flags)
+
+    def resolve_properties(self, spec, variables):
+        ''' Returns the (attribute, value) pairs of a node spec with the per-material variables filled in. Missing variables are left out '''
+        properties = []
+        for attribute, value in spec.properties:
+            if isinstance(value, str) and value.startswith("$"):
+                value = variables.get(value[1:])
+                if value is None:
+                    continue
+            properties.append((attribute, value))
+        return properties
+
+    def create_node(self, node_tree, spec, properties):
+        node = node_tree.nodes.new(type=spec.bl_idname)
+        node.name = spec.name
+        node.location = spec.location
+        if spec.label != "":
+            node.label = spec.label
+        for attribute, value in properties:
+            setattr(node, attribute, value)
+        for socket, value in spec.inputs:
+            node.inputs[socket].default_value = value
+        return node
+
+    def target_graph(self, variables, flags, instanced):
+        ''' Returns the nodes (as (spec, properties) pairs) and links a material should end up with. With instanced, the nodes that   '''
+        ''' belong in the shared node group are replaced by a single group node called "Template", and links into / out of them go '''
+        ''' through the group's interface sockets                                                                               '''
+        if not instanced:
+            nodes = [(spec, self.resolve_properties(spec, variables)) for spec in self.nodes if self.is_active(spec, flags)]
+            names = set(spec.name for spec, properties in nodes)
+            links = [spec for spec in self.links if spec.from_name in names and spec.to_name in names and self.is_active(spec, flags)]
+            return nodes, links
+
+        nodes = [(spec, self.resolve_properties(spec, variables)) for spec in self.nodes if spec.name in self.outer_names and self.is_active(spec, flags)]
+        names = set(spec.name for spec, properties in nodes)
+        inner_active = [spec for spec in self.nodes if spec.name not in self.outer_names and self.is_active(spec, flags)]
+        if len(inner_active) > 0:
+            location = (sum(spec.location[0] for spec in inner_active) / len(inner_active),
+                        sum(spec.location[1] for spec in inner_active) / len(inner_active))
+            group_spec = TemplateNode("Template", 'ShaderNodeGroup', location, self.key, (), (), frozenset(), frozenset())
+            nodes.append((group_spec, [("node_tree", self.get_group(flags))]))
+            names.add("Template")
+
+        links = []
+        for spec in self.links:
+            if not self.is_active(spec, flags):
+                continue
+            socket_name = f"{spec.from_name}:{spec.from_socket}"
+            from_outer, to_outer = spec.from_name in self.outer_names, spec.to_name in self.outer_names
+
+            if from_outer and to_outer:
+                links.append(spec)
+            elif from_outer and "Template" in names:
+                links.append(TemplateLink(spec.from_name, spec.from_socket, "Template", socket_name, spec.required, spec.forbidden))
+            elif to_outer and "Template" in names:
+                links.append(TemplateLink("Template", socket_name, spec.to_name, spec.to_socket, spec.required, spec.forbidden))
+
+        links = [spec for spec in links if spec.from_name in names and spec.to_name in names]
+        return nodes, links
+
+    def apply(self, material, obj, instanced=False, diff=False):
+        ''' Applies the template to one material. obj is the object that UV map and color attribute names are taken from          '''
+        ''' With instanced, the template body is shared through a node group instead of being copied into the material           '''
+        ''' With diff, the existing node tree is patched instead of rebuilt: nodes are matched by name and type, and only settings,  '''
+        ''' nodes and links that differ from the template are changed. Returns False if the material already matched the template '''
+        if self.transform is not None:
+            self.transform(material.node_tree)
+            invalidate_connected_nodes(material)
+            return True
+
+        variables, flags = self.gather(material, obj)
+        changed = False
+
+        for setting in self.settings:
+            if self.is_active(setting, flags):
+                if not diff or template_value_differs(getattr(material, setting.attribute), setting.value):
+                    setattr(material, setting.attribute, setting.value)
+                    changed = True
+
+        nodes, links = self.target_graph(variables, flags, instanced)
+        node_tree = material.node_tree
+
+        if not diff:
+            node_tree.nodes.clear()
+            built = dict((spec.name, self.create_node(node_tree, spec, properties)) for spec, properties in nodes)
+            for spec in links:
+                from_socket = find_socket(built[spec.from_name].outputs, spec.from_socket)
+                to_socket = find_socket(built[spec.to_name].inputs, spec.to_socket)
+                if from_socket is not None and to_socket is not None:
+                    node_tree.links.new(from_socket, to_socket)
+            invalidate_connected_nodes(material)
+            return True
+
+        # Reuse the nodes that already have the right name and type, and patch their settings
+        existing = dict((node.name, node) for node in node_tree.nodes)
+        built = dict()
+        for spec, properties in nodes:
+            node = existing.get(spec.name)
+            if node is not None and node.bl_idname != spec.bl_idname:
+                node_tree.nodes.remove(node)
+                node = None
+
+            if node is None:
+                node = self.create_node(node_tree, spec, properties)
+                changed = True
+            elif self.reset_node(node, spec, properties):
+                changed = True
+            built[spec.name] = node
+
+        # Remove the nodes that aren't part of the template
+        kept = set(node.as_pointer() for node in built.values())
+        for node in list(node_tree.nodes):
+            if node.as_pointer() not in kept:
+                node_tree.nodes.remove(node)
+                changed = True
+
+        # Relink only what differs
+        wanted = dict()
+        for spec in links:
+            from_socket = find_socket(built[spec.from_name].outputs, spec.from_socket)
+            to_socket = find_socket(built[spec.to_name].inputs, spec.to_socket)
+            if from_socket is not None and to_socket is not None:
+                wanted[(from_socket.as_pointer(), to_socket.as_pointer())] = (from_socket, to_socket)
+
+        for link in list(node_tree.links):
+            pair = (link.from_socket.as_pointer(), link.to_socket.as_pointer())
+            if pair in wanted:
+                del wanted[pair]
+            else:
+                node_tree.links.remove(link)
+                changed = True
+
+        for from_socket, to_socket in wanted.values():
+            node_tree.links.new(from_socket, to_socket)
+            changed = True
+
+        if changed:
+            invalidate_connected_nodes(material)
+        return changed
+
+    def fresh_node_defaults(self, bl_idname):
+        ''' Returns a NodeSettingsSnapshot of a newly created node of a type, made once per template run in a scratch node group '''
+        if bl_idname not in self.node_defaults:
+            scratch = bpy.data.node_groups.new("MBT Defaults", 'ShaderNodeTree')
+            try:
+                self.node_defaults[bl_idname] = NodeSettingsSnapshot(scratch.nodes.new(type=bl_idname))
+            finally:
+                bpy.data.node_groups.remove(scratch)
+        return self.node_defaults[bl_idname]
+
+    def reset_node(self, node, spec, properties):
+        ''' Brings a reused node to the state that create_node would give a new one: every setting and input value that the template '''
+        ''' doesn't set goes back to the node type's default. Only values that differ are written. Returns whether anything changed  '''
+        template_inputs = dict()
+        for socket, value in spec.inputs:
+            template_inputs[socket if isinstance(socket, int) else node.inputs.find(socket)] = value
+
+        target = self.fresh_node_defaults(spec.bl_idname).with_overrides(properties, template_inputs)
+        changed = target.apply(node, only_if_different=True)
+
+        if node.label != spec.label:
+            node.label = spec.label
+            changed = True
+        if node.mute:
+            node.mute = False
+            changed = True
+        return changed
+
+    def group_name(self, flags):
+        ''' Returns the name of the node group for a variant of this template. Variants differ by which of the template's conditions are true '''
+        variant = sorted(self.condition_names & flags)
+        if len(variant) == 0:
+            return f"MBT {self.key}"
+        return f"MBT {self.key} [{'+'.join(variant)}]"
+
+    def get_group(self, flags):
+        ''' Returns the shared node group for a variant of this template. If a template library is set and has a group with that name, '''
+        ''' it's linked from there. Otherwise the group is built in this file, if it doesn't exist yet. Existing groups are reused as  '''
+        ''' they are, so any edits made to them by hand are kept. Interface sockets are named "node name:socket" after the node they carry '''
+        name = self.group_name(flags)
+        if name in self.groups:
+            return self.groups[name]
+
+        group = None
+        if self.library_path is not None:
+            group = link_template_library_group(self.library_path, name)
+        if group is None:
+            group = bpy.data.node_groups.get(name)
+            if group is not None and group.library is not None:
+                group = None
+        if group is None:
+            group = bpy.data.node_groups.new(name, 'ShaderNodeTree')
+            inner_specs = [spec for spec in self.nodes if spec.name not in self.outer_names]
+            built = dict((spec.name, self.create_node(group, spec, self.resolve_properties(spec, dict()))) for spec in inner_specs if self.is_active(spec, flags))
+
+            locations = [spec.location for spec in inner_specs if spec.name in built]
+            group_input = group.nodes.new('NodeGroupInput')
+            group_input.location = (min(location[0] for location in locations) - 250, 0)
+            group_output = group.nodes.new('NodeGroupOutput')
+            group_output.location = (max(location[0] for location in locations) + 250, 0)
+
+            for spec in self.links:
+                if not self.is_active(spec, flags):
+                    continue
+                from_inner, to_inner = spec.from_name in built, spec.to_name in built
+                socket_name = f"{spec.from_name}:{spec.from_socket}"
+
+                if from_inner and to_inner:
+                    group.links.new(built[spec.from_name].outputs[spec.from_socket], built[spec.to_name].inputs[spec.to_socket])
+
+                elif to_inner and spec.from_name in self.outer_names:
+                    to_socket = built[spec.to_name].inputs[spec.to_socket]
+                    if socket_name not in group_input.outputs.keys():
+                        new_group_socket(group, socket_name, 'INPUT', to_socket.type)
+                    group.links.new(group_input.outputs[socket_name], to_socket)
+
+                elif from_inner and spec.to_name in self.outer_names:
+                    from_socket = built[spec.from_name].outputs[spec.from_socket]
+                    if socket_name not in group_output.inputs.keys():
+                        new_group_socket(group, socket_name, 'OUTPUT', from_socket.type)
+                    group.links.new(from_socket, group_output.inputs[socket_name])
+
+        self.groups[name] = group
+        return group
+
+def find_socket(sockets, key):
+    ''' Returns the socket with the given index or name, or None if the node doesn't have it '''
+    try:
+        return sockets[key]
+    except (KeyError, IndexError):
+        return None
+
+def template_value_differs(current, value):
+    ''' Compares a current property or socket value with a template value. Datablocks are compared by identity, everything else by value '''
+    if isinstance(current, bpy.types.ID) or isinstance(value, bpy.types.ID):
+        return current != value
+    return signature_value(current) != signature_value(value)
+
+# Names of the node groups in each template library .blend, by (absolute path, modification time). Each library's index is
+# only read once per session, no matter how many files are processed with it
+template_library_index = dict()
+
+def get_template_library_groups(path):
+    ''' Returns the names of the node groups in a template library .blend, without loading any of them '''
+    try:
+        key = (path, os.path.getmtime(path))
+        if key not in template_library_index:
+            with bpy.data.libraries.load(path, link=True) as (data_from, data_to):
+                template_library_index[key] = set(data_from.node_groups)
+    except OSError as error:
+        raise ValueError(f"Couldn't read the template library '{path}': {error}")
+    return template_library_index[key]
+
+def link_template_library_group(path, name):
+    ''' Returns the node group called name, linked from the template library at path, or None if the library doesn't have it '''
+    ''' If this file already links the group, the existing link is reused instead of loading the library again             '''
+    for group in bpy.data.node_groups:
+        if group.name == name and group.library is not None and os.path.normpath(bpy.path.abspath(group.library.filepath)) == path:
+            return group
+
+    if name not in get_template_library_groups(path):
+        return None
+
+    try:
+        with bpy.data.libraries.load(path, link=True) as (data_from, data_to):
+            data_to.node_groups = [name]
+    except OSError as error:
+        raise ValueError(f"Couldn't link '{name}' from the template library '{path}': {error}")
+    return data_to.node_groups[0]
+
+# Interface socket type for each kind of socket that a template node group may need to pass through
+GROUP_SOCKET_TYPES = {
+    'SHADER': 'NodeSocketShader',
+    'RGBA': 'NodeSocketColor',
+    'VECTOR': 'NodeSocketVector',
+    'VALUE': 'NodeSocketFloat',
+    'INT': 'NodeSocketInt',
+    'BOOLEAN': 'NodeSocketBool',
+}
+
+def new_group_socket(group, name, in_out, socket_kind):
+    ''' Adds an input or output socket to a node group's interface. Blender 4.0 replaced group.inputs / outputs with group.interface '''
+    socket_type = GROUP_SOCKET_TYPES.get(socket_kind, 'NodeSocketColor')
+    if bpy.app.version >= (4, 0, 0):
+        group.interface.new_socket(name=name, in_out=in_out, socket_type=socket_type)
+    elif in_out == 'INPUT':
+        group.inputs.new(socket_type, name)
+    else:
+        group.outputs.new(socket_type, name)
+
+def template_folder():
+    ''' Returns the folder that user templates (.json files) are loaded from, creating it if needed '''
+    return bpy.utils.user_resource('CONFIG', path=os.path.join("matbatchtools", "templates"), create=True)
+
+def load_user_templates():
+    ''' (Re)loads every user template from the templates folder, and returns a list of error messages for the ones that failed '''
+    ''' Every template is compiled once while loading, so mistakes are reported here instead of in the middle of applying it  '''
+    user_templates.clear()
+    errors = []
+    folder = template_folder()
+
+    for filename in sorted(os.listdir(folder)):
+        if not filename.lower().endswith(".json"):
+            continue
+
+        key = os.path.splitext(filename)[0]
+        try:
+            with open(os.path.join(folder, filename), encoding="utf-8") as template_file:
+                template = json.load(template_file)
+            key = template.get("key", key)
+            MaterialTemplate(key, template)
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as error:
+            errors.append(f"{filename}: {error}")
+            continue
+        user_templates[key] = template
+
+    refresh_template_enum_items()
+    return errors
+
+# Bit of each trait in the masks returned by classify_material_traits
+MATERIAL_TRAITS = {"transparent": 1, "emissive": 2, "animated": 4}
+
+# When a material has more than one trait, its faces are isolated with the first of its traits in this order
+MATERIAL_TRAIT_PRIORITY = ("animated", "transparent", "emissive")
+
+def principled_trait_slots():
+    ''' Returns the Principled BSDF input indices that classify_material_traits reads: alpha, emission color and emission strength '''
+    if bpy.app.version < (4, 0, 0):
+        return (21, 19, 20)
+    return (4, 27, 28)
+
+def classify_material_traits(material):
+    ''' Returns a bitmask of every MATERIAL_TRAITS trait the material has, found in one pass over the nodes connected to its output '''
+    if material == None or not material.use_nodes or material.node_tree == None:
+        return 0
+
+    principled_alpha_slot, principled_emissive_color_slot, principled_emissive_strength_slot = principled_trait_slots()
+    all_traits = sum(MATERIAL_TRAITS.values())
+    traits = 0
+
+    # Animated scenario 1 - Animation data exists and isn't "none"
+    if material.node_tree.animation_data != None:
+        traits |= MATERIAL_TRAITS["animated"]
+
+    for node in material.node_tree.nodes:
+        if traits == all_traits:
+            break
+        if not is_node_connected(material, node):
+            continue
+
+        if node.type == "BSDF_PRINCIPLED":
+
+            # Transparency scenario 1 - Principled BSDF with alpha input
+            alpha_slot = node.inputs[principled_alpha_slot]
+            if len(alpha_slot.links) > 0 or alpha_slot.default_value != 1:
+                traits |= MATERIAL_TRAITS["transparent"]
+
+            # Emissive scenario 1 - Principled BSDF with emissive input
+            em_color_slot = node.inputs[principled_emissive_color_slot]
+            em_strength_slot = node.inputs[principled_emissive_strength_slot]
+            if em_strength_slot.default_value != 0.0 or len(em_strength_slot.links) > 0:
+                if len(em_color_slot.links) > 0:
+                    traits |= MATERIAL_TRAITS["emissive"]
+                elif list(em_color_slot.default_value) != [0.0,0.0,0.0,1.0] and list(em_color_slot.default_value) != [0.0,0.0,0.0,0.0]:
+                    traits |= MATERIAL_TRAITS["emissive"]
+
+        # Transparency scenario 2 - Transparent BSDF
+        elif node.type == "BSDF_TRANSPARENT":
+            traits |= MATERIAL_TRAITS["transparent"]
+
+        # Emissive scenario 2 - Emission shader
+        elif node.type == "EMISSION":
+            traits |= MATERIAL_TRAITS["emissive"]
+
+        # Animated scenario 2 - Image Sequence node
+        elif node.type == "TEX_IMAGE":
+            if node.image != None and node.image.source == 'SEQUENCE':
+                traits |= MATERIAL_TRAITS["animated"]
+
+    return traits
+
+def isolated_trait(traits, wanted_traits):
+    ''' Returns the trait that a material with the traits bitmask is isolated with, out of wanted_traits, or None '''
+    for trait in MATERIAL_TRAIT_PRIORITY:
+        if trait in wanted_traits and traits & MATERIAL_TRAITS[trait]:
+            return trait
+    return None
+
+def connected_diffuse_texture_names(material):
+    ''' Returns the names (without file extension) of the diffuse textures connected to the material's output, in node order '''
+    names = dict()
+    if material.node_tree != None:
+        for node in material.node_tree.nodes:
+
+            # Check if a file is actually loaded in this image texture node, and that it's used as a diffuse
+            if is_diffuse_texture_node(node, require_image=True) and is_node_connected(material, node):
+                names[node.image.name.split(".", 1)[0]] = True
+    return list(names)
+
+# Analysis results that are stored in each material (as JSON, in the "mbt_analysis" custom property), so they survive saving and
+# reopening the file. Each one is only computed again when the material's fingerprint changes. Node tree signatures aren't stored:
+# they read every setting of every node, so a fingerprint that could tell when they change would cost as much as the signature itself
+MATERIAL_ANALYSES = {
+    "traits": classify_material_traits,
+    "diffuse_textures": connected_diffuse_texture_names,
+}
+MATERIAL_ANALYSIS_PROPERTY = "mbt_analysis"
+
+# Raise this whenever an analysis changes, so results stored by older versions of the addon are thrown away
+MATERIAL_ANALYSIS_VERSION = 2
+
+def socket_fingerprint_value(socket):
+    ''' Returns a socket's default value exactly (colors and vectors as tuples), so that any change to it changes the fingerprint '''
+    value = socket.default_value
+    return tuple(value) if hasattr(value, "__len__") else value
+
+def material_fingerprint(material):
+    ''' Returns an MD5 of only what the stored analyses read: node types and names, which output is active, image names and sources, '''
+    ''' the links and the sockets they go into, the Principled BSDF inputs that decide the traits, and whether the tree is animated  '''
+    ''' It's a single flat pass over the nodes and links, with no graph walking and no RNA property scans                           '''
+    fingerprint = hashlib.md5(repr((MATERIAL_ANALYSIS_VERSION, material.use_nodes)).encode())
+    node_tree = material.node_tree
+    if node_tree == None:
+        return fingerprint.hexdigest()
+
+    trait_slots = principled_trait_slots()
+    fingerprint.update(repr(node_tree.animation_data != None).encode())
+    for node in node_tree.nodes:
+        image = getattr(node, "image", None)
+        settings = (node.bl_idname, node.name, getattr(node, "is_active_output", None), image.name if image else None, image.source if image else None)
+        if node.type == "BSDF_PRINCIPLED":
+            settings += tuple(socket_fingerprint_value(node.inputs[slot]) for slot in trait_slots)
+        fingerprint.update(repr(settings).encode())
+    for link in node_tree.links:
+        fingerprint.update(repr((link.from_node.name, link.from_socket.identifier, link.to_node.name, link.to_socket.identifier,
+                                 link.to_socket.name, link.to_socket.type, link.is_muted)).encode())
+    return fingerprint.hexdigest()
+
+material_analysis_cache = dict()
+
+def clear_material_analysis_cache():
+    ''' Forgets the analysis results read during the last operator run. Called at the start of each run, since materials may have changed in between '''
+    material_analysis_cache.clear()
+
+def get_material_analysis(material, name):
+    ''' Returns one of the MATERIAL_ANALYSES results for a material. The result stored in the material is used when the material's  '''
+    ''' fingerprint still matches, otherwise all stored results are dropped and this one is computed and stored again. The          '''
+    ''' fingerprint is taken and the stored results are parsed once per material per operator run. Materials linked from a library  '''
+    ''' can't be written to, so their results are only kept until the end of the run                                                '''
+    key = material.as_pointer()
+    stored = material_analysis_cache.get(key)
+    if stored is None:
+        stored = dict()
+        if material.library == None:
+            fingerprint = material_fingerprint(material)
+            try:
+                stored = json.loads(material.get(MATERIAL_ANALYSIS_PROPERTY, "{}"))
+            except (TypeError, ValueError):
+                stored = dict()
+            if not isinstance(stored, dict) or stored.get("fingerprint") != fingerprint:
+                stored = {"fingerprint": fingerprint}
+        material_analysis_cache[key] = stored
+
+    if name not in stored:
+        stored[name] = MATERIAL_ANALYSES[name](material)
+        if material.library == None:
+            material[MATERIAL_ANALYSIS_PROPERTY] = json.dumps(stored)
+    return stored[name]
+
+class FaceMaterialIndex:
+    ''' The material index of every face of a mesh, read once into a NumPy array with foreach_get '''
+    ''' Answers "which faces use any of these materials" with one mask, instead of a loop per material '''
+
+    def __init__(self, mesh):
+        self.slot_names = [material.name if material is not None else None for material in mesh.materials]
+        self.material_indices = np.empty(len(mesh.polygons), dtype=np.int32)
+        mesh.polygons.foreach_get("material_index", self.material_indices)
+
+    def slots(self, material_names):
+        ''' Returns the indices of every slot that holds one of the materials. A material can be in more than one slot '''
+        return np.array([index for index, name in enumerate(self.slot_names) if name in material_names], dtype=np.int32)
+
+    def mask(self, material_names):
+        ''' Returns a boolean array, True for every face that uses one of the materials '''
+        return np.isin(self.material_indices, self.slots(material_names))
+
+    def face_counts(self):
+        ''' Returns how many faces use each material, by material name. Faces with an empty or missing slot aren't counted '''
+        slot_counts = np.bincount(self.material_indices, minlength=len(self.slot_names))
+        counts = dict()
+        for index, name in enumerate(self.slot_names):
+            if name is not None:
+                counts[name] = counts.get(name, 0) + int(slot_counts[index])
+        return counts
+
+# The data type and domain that Convert Vertex Color switches each color attribute data type to
+COLOR_ATTRIBUTE_CONVERSIONS = {"FLOAT_COLOR": ("BYTE_COLOR", "CORNER"), "BYTE_COLOR": ("FLOAT_COLOR", "POINT")}
+
+def read_color_attribute(attribute):
+    ''' Reads a color attribute into an (n, 4) float32 array with foreach_get. "color" is scene linear for both data types: Blender '''
+    ''' decodes byte colors from sRGB while reading them, and encodes them back when they're written                                '''
+    colors = np.empty(len(attribute.data) * 4, dtype=np.float32)
+    attribute.data.foreach_get("color", colors)
+    return colors.reshape(-1, 4)
+
+def resample_color_domain(mesh, colors, from_domain, to_domain):
+    ''' Moves colors between the POINT and CORNER domains. Corners take their vertex's color. Vertices take the average of their corners '''
+    ''' (vertices without any face corner become black), which is done with one bincount per channel                                 '''
+    if from_domain == to_domain:
+        return colors
+
+    loop_vertices = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loop_vertices)
+    if from_domain == 'POINT' and to_domain == 'CORNER':
+        return colors[loop_vertices]
+    if from_domain == 'CORNER' and to_domain == 'POINT':
+        vertex_count = len(mesh.vertices)
+        corner_counts = np.maximum(np.bincount(loop_vertices, minlength=vertex_count), 1)
+        averaged = np.empty((vertex_count, 4), dtype=np.float32)
+        for channel in range(4):
+            averaged[:, channel] = np.bincount(loop_vertices, weights=colors[:, channel], minlength=vertex_count) / corner_counts
+        return averaged
+    raise ValueError(f"Can't convert colors from the {from_domain} domain to the {to_domain} domain")
+
+def convert_color_attribute(mesh, attribute, data_type, domain, name):
+    ''' Replaces a color attribute with one of another data type and domain, keeping its colors. The new attribute is named name, and '''
+    ''' is the active / render color attribute if the old one was                                                                     '''
+    color_attributes = mesh.color_attributes
+    colors = resample_color_domain(mesh, read_color_attribute(attribute), attribute.domain, domain)
+
+    # Everything needed from the old attribute has to be read before it's removed
+    old_name = attribute.name
+    was_active = color_attributes.active_color != None and color_attributes.active_color.name == old_name
+    was_render = hasattr(color_attributes, "render_color_index") and color_attributes.render_color_index >= 0 and color_attributes[color_attributes.render_color_index].name == old_name
+    if name == "" or (name != old_name and name in mesh.attributes):
+        name = old_name
+
+    color_attributes.remove(attribute)
+    new_attribute = color_attributes.new(name=name, type=data_type, domain=domain)
+    new_attribute.data.foreach_set("color", np.ascontiguousarray(colors, dtype=np.float32).ravel())
+
+    if was_active:
+        color_attributes.active_color = new_attribute
+    if was_render:
+        color_attributes.render_color_index = [color_attribute.name for color_attribute in color_attributes].index(name)
+    return new_attribute
+
+def select_mesh_faces(mesh, face_mask):
+    ''' Reveals all of a mesh, and selects exactly the faces in face_mask (plus their edges and vertices) with foreach_set '''
+    ''' Edges and vertices are taken from the selected faces' loops, so no loose edges come along when separating      '''
+    loop_totals = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", loop_totals)
+    loop_vertices = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loop_vertices)
+    loop_edges = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("edge_index", loop_edges)
+
+    # Each face's loops are stored together, in face order
+    loop_mask = np.repeat(face_mask, loop_totals)
+    vertex_mask = np.zeros(len(mesh.vertices), dtype=bool)
+    vertex_mask[loop_vertices[loop_mask]] = True
+    edge_mask = np.zeros(len(mesh.edges), dtype=bool)
+    edge_mask[loop_edges[loop_mask]] = True
+
+    for elements, mask in ((mesh.vertices, vertex_mask), (mesh.edges, edge_mask), (mesh.polygons, face_mask)):
+        elements.foreach_set("hide", np.zeros(len(elements), dtype=bool))
+        elements.foreach_set("select", mask)
+
+def remove_unused_material_slots(obj):
+    ''' Removes the material slots that no face uses, like the Remove Unused Slots operator but without an operator call per object '''
+    ''' Blender shifts the faces' material indices down when a slot is removed, but not the object's own slot links. So the link  '''
+    ''' and material of object-linked slots are put back on the slots they moved to                                              '''
+    mesh = obj.data
+    used = np.bincount(FaceMaterialIndex(mesh).material_indices, minlength=len(mesh.materials))
+    kept_slots = [index for index in range(len(mesh.materials)) if used[index] > 0]
+    if len(kept_slots) == len(mesh.materials):
+        return
+
+    slot_links = [(slot.link, slot.material) for slot in obj.material_slots]
+    for index in reversed(range(len(mesh.materials))):
+        if used[index] == 0:
+            mesh.materials.pop(index=index)
+
+    for slot, index in zip(obj.material_slots, kept_slots):
+        link, material = slot_links[index]
+        if link == 'OBJECT' or slot.link == 'OBJECT':
+            slot.link = link
+            if link == 'OBJECT':
+                slot.material = material
+
+# Custom property that marks where each object came from while separating. Separated objects are copies of their source object,
+# so they carry it over too
+ISOLATE_SOURCE_PROPERTY = "mbt_isolate_source"
+
+def separate_faces(face_masks):
+    ''' Separates the masked faces of every object in face_masks ({object: face mask}) into new objects. All objects share one  '''
+    ''' edit mode session and one mesh.separate call. Objects in face_masks must not share a mesh. Returns {object: new object} '''
+    if len(face_masks) == 0:
+        return dict()
+
+    if bpy.context.mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode='OBJECT')
+    bpy.ops.object.select_all(action='DESELECT')
+
+    for obj, face_mask in face_masks.items():
+        select_mesh_faces(obj.data, face_mask)
+        obj[ISOLATE_SOURCE_PROPERTY] = obj.name
+        obj.hide_set(False)
+        obj.select_set(True)
+
+    bpy.context.view_layer.objects.active = next(iter(face_masks))
     bpy.ops.object.mode_set(mode='EDIT')
     bpy.ops.mesh.separate(type='SELECTED')
     bpy.ops.object.mode_set(mode='OBJECT')
 
+    separated = dict()
     for obj in bpy.context.selected_objects:
-        bpy.context.view_layer.objects.active = obj
-        bpy.ops.object.material_slot_remove_unused()
+        source_name = obj.get(ISOLATE_SOURCE_PROPERTY)
+        if source_name == None:
+            continue
+        del obj[ISOLATE_SOURCE_PROPERTY]
+        remove_unused_material_slots(obj)
+        if obj.name != source_name:
+            separated[bpy.data.objects[source_name]] = obj
+
+    # Leave only the separated objects selected
+    for obj in face_masks:
+        obj.select_set(False)
+    if len(separated) > 0:
+        bpy.context.view_layer.objects.active = next(iter(separated.values()))
+
+    return separated
+
+# Largest buffer (in bytes) that pixels are quantized into, one chunk at a time, by a PixelHasher with a memory budget
+PIXEL_HASH_CHUNK_SIZE = 4 * 1048576
+
+class PixelHasher:
+    ''' Hashes image pixels through reusable NumPy buffers, so no Python float or string is ever created per pixel '''
+    ''' The buffers grow to fit the largest image seen, and are reused for every image after that                '''
+    ''' With a memory_budget (in bytes), images whose float copy doesn't fit in it must not be hashed (see fits). The others '''
+    ''' are quantized and hashed in chunks, so the 8-bit buffer never grows past PIXEL_HASH_CHUNK_SIZE, and the float buffer '''
+    ''' never past the budget. Chunks give exactly the same hashes as hashing everything at once                            '''
+
+    def __init__(self, mode="QUANTIZED", memory_budget=0):
+        self.mode = mode
+        self.memory_budget = memory_budget
+        self.oversized_images = []
+        self._float_buffer = np.empty(0, dtype=np.float32)
+        self._byte_buffer = np.empty(0, dtype=np.uint8)
+
+    def fits(self, image):
+        ''' Checks if the float copy of an image's pixels fits in the memory budget. Always True without a budget '''
+        return self.memory_budget <= 0 or image.size[0] * image.size[1] * image.channels * 4 <= self.memory_budget
+
+    def _get_buffers(self, count):
+        # Blender can only copy out a whole image at once (slicing image.pixels copies the whole image too), so the float buffer
+        # always holds a whole image. The 8-bit buffer holds a whole image too without a budget, or only one chunk with one
+        if self._float_buffer.size < count:
+            self._float_buffer = np.empty(count, dtype=np.float32)
+
+        byte_count = 0
+        if self.mode != "EXACT":
+            byte_count = count if self.memory_budget <= 0 else min(count, PIXEL_HASH_CHUNK_SIZE)
+        if self._byte_buffer.size < byte_count:
+            self._byte_buffer = np.empty(byte_count, dtype=np.uint8)
+        return self._float_buffer[:count], self._byte_buffer[:byte_count]
+
+    def _quantize(self, floats, out):
+        # Quantize in place, the same way int(p * 255) did for every pixel before
+        np.multiply(floats, 255.0, out=floats)
+        np.clip(floats, 0.0, 255.0, out=floats)
+        np.copyto(out, floats, casting='unsafe')
+        return out
+
+    def hexdigest(self, image):
+        floats, quantized = self._get_buffers(len(image.pixels))
+        image.pixels.foreach_get(floats)
+
+        if self.mode == "EXACT":
+            return hashlib.md5(memoryview(floats)).hexdigest()
+
+        if quantized.size < floats.size:
+            return self._chunked_hexdigest(floats, quantized)
+
+        return hashlib.md5(memoryview(self._quantize(floats, quantized))).hexdigest()
+
+    def _chunked_hexdigest(self, floats, chunk_buffer):
+        # Feeding the same bytes in chunks gives the same digest as hashing them at once, so cached hashes stay valid
+        digest = hashlib.md5()
+        for start in range(0, floats.size, chunk_buffer.size):
+            chunk = floats[start:start + chunk_buffer.size]
+            digest.update(memoryview(self._quantize(chunk, chunk_buffer[:chunk.size])))
+        return digest.hexdigest()
+
+    def perceptual_hash(self, image, hash_size=8, sample_size=32):
+        ''' Returns a 64-bit DCT perceptual hash of the image as an int, plus its average color        '''
+        ''' Similar looking images get hashes that differ by only a few bits, even after recompression '''
+        ''' Returns (None, None) for images without any pixel data                                     '''
+        count = len(image.pixels)
+        if count == 0:
+            return None, None
+
+        floats, _ = self._get_buffers(count)
+        image.pixels.foreach_get(floats)
+        width, height = image.size
+        pixels = floats.reshape(height, width, image.channels)
+        average_color = pixels.reshape(-1, image.channels).mean(axis=0)
+
+        if image.channels >= 3:
+            gray = pixels[..., 0] * 0.299 + pixels[..., 1] * 0.587 + pixels[..., 2] * 0.114
+        else:
+            gray = pixels[..., 0]
+
+        # Box filter down to sample_size x sample_size, by summing each band of rows and columns
+        row_edges = np.linspace(0, height, sample_size + 1).astype(np.intp)
+        column_edges = np.linspace(0, width, sample_size + 1).astype(np.intp)
+        row_sizes = np.maximum(np.diff(row_edges), 1)
+        column_sizes = np.maximum(np.diff(column_edges), 1)
+        small = np.add.reduceat(gray, np.minimum(row_edges[:-1], height - 1), axis=0)
+        small = np.add.reduceat(small, np.minimum(column_edges[:-1], width - 1), axis=1)
+        small = small / np.outer(row_sizes, column_sizes)
+
+        # Keep only the lowest frequencies of the 2D DCT, and compare them to their median
+        dct = dct_matrix(sample_size)
+        low_frequencies = (dct @ small @ dct.T)[:hash_size, :hash_size].flatten()
+        bits = low_frequencies > np.median(low_frequencies[1:])
+        return int.from_bytes(np.packbits(bits).tobytes(), 'big'), average_color
+
+dct_matrices = dict()
+
+def dct_matrix(size):
+    ''' Returns the (cached) orthonormal DCT-II matrix of the given size, so a 2D DCT is just D @ X @ D.T '''
+    if size not in dct_matrices:
+        k = np.arange(size).reshape(-1, 1)
+        n = np.arange(size).reshape(1, -1)
+        matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2.0 / size)
+        matrix[0] /= np.sqrt(2.0)
+        dct_matrices[size] = matrix
+    return dct_matrices[size]
+
+class BKTree:
+    ''' BK-tree of integer hashes, using the Hamming distance between them                                    '''
+    ''' A radius query only descends into children whose edge distance is within the radius of the query's distance '''
+    ''' to the current node, which skips most of the tree instead of comparing against every hash                  '''
+
+    def __init__(self):
+        self.root = None
+
+    @staticmethod
+    def distance(a, b):
+        return bin(a ^ b).count("1")
+
+    def add(self, value, item):
+        # Each node is [value, items with that exact value, {edge distance: child node}]
+        if self.root is None:
+            self.root = [value, [item], dict()]
+            return
+
+        node = self.root
+        while True:
+            distance = self.distance(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            if distance not in node[2]:
+                node[2][distance] = [value, [item], dict()]
+                return
+            node = node[2][distance]
+
+    def query(self, value, radius):
+        ''' Returns a list of (distance, item) for every item within the given Hamming radius of value '''
+        results = []
+        pending = [self.root] if self.root is not None else []
+        while pending:
+            node = pending.pop()
+            distance = self.distance(value, node[0])
+            if distance <= radius:
+                results.extend((distance, item) for item in node[1])
+            for edge, child in node[2].items():
+                if distance - radius <= edge <= distance + radius:
+                    pending.append(child)
+        return results
+
+def remap_duplicate_images(remap):
+    ''' Takes a dictionary of duplicate image -> canonical image, points every user of each duplicate at its canonical image, '''
+    ''' then removes the duplicates. ID.user_remap reaches all users in one call - materials, node groups, world and light  '''
+    ''' node trees, image editors - so no node tree has to be walked. Returns the number of removed duplicates               '''
+    for duplicate, canonical in remap.items():
+        duplicate.user_remap(canonical)
+        bpy.data.images.remove(duplicate)
+    return len(remap)
+
+def image_memory_size(image):
+    ''' Approximate size in bytes of an image once loaded in memory '''
+    return image.size[0] * image.size[1] * image.channels * (4 if image.is_float else 1)
+
+def create_pixel_hasher():
+    ''' Creates a PixelHasher from the hash settings in the Textures panel '''
+    properties = bpy.context.scene.MatBatchProperties
+    memory_budget = properties.HashMemoryBudget * 1048576 if properties.HashLimitMemory else 0
+    return PixelHasher(properties.HashMode, memory_budget)
+
+def image_source_path(image):
+    ''' Returns the absolute path of the file behind a file-backed image, or None for generated, movie, sequence and UDIM images '''
+    if image.source == 'FILE' and image.filepath != "":
+        return os.path.normpath(bpy.path.abspath(image.filepath, library=image.library))
+    return None
+
+def image_file_size(image):
+    ''' Returns the size in bytes of the file behind an image, without loading its pixels. Packed images report their packed size '''
+    if image.packed_file is not None:
+        return image.packed_file.size
+
+    path = image_source_path(image)
+    if path is not None:
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return None
+
+    return None
+
+class TextureHashCache:
+    ''' Persistent cache of texture hashes, stored as a small SQLite database in Blender's user config folder        '''
+    ''' Entries are keyed by the absolute file path, modification time and size (or the packed data's checksum), so '''
+    ''' any change to the file invalidates its entry. The least recently used entries are evicted past max_entries  '''
+
+    def __init__(self, max_entries=50000):
+        self.max_entries = max_entries
+        folder = bpy.utils.user_resource('CONFIG', path="matbatchtools", create=True)
+        self.connection = sqlite3.connect(os.path.join(folder, "texture_hashes.sqlite"))
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS hashes (path TEXT, packed TEXT, mode TEXT, mtime REAL, size INTEGER, digest TEXT, last_used REAL, PRIMARY KEY (path, packed, mode))")
+        self._touched = []
+
+    @staticmethod
+    def key_for(image):
+        ''' Returns (path, packed checksum, mtime, size) for an image, or None if the image can't be cached '''
+        ''' Generated images and images with unsaved pixel edits have no stable source, so they are never cached '''
+        if image.is_dirty:
+            return None
+
+        if image.packed_file is not None:
+            packed_checksum = hashlib.md5(image.packed_file.data).hexdigest()
+            return ("", packed_checksum, 0.0, image.packed_file.size)
+
+        path = image_source_path(image)
+        if path is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (path, "", stat.st_mtime, stat.st_size)
+
+    def get(self, key, mode):
+        if key is None:
+            return None
+
+        row = self.connection.execute(
+            "SELECT mtime, size, digest FROM hashes WHERE path = ? AND packed = ? AND mode = ?", (key[0], key[1], mode)).fetchone()
+        if row is None or row[0] != key[2] or row[1] != key[3]:
+            return None
+
+        self._touched.append((time.time(), key[0], key[1], mode))
+        return row[2]
+
+    def put(self, key, mode, digest):
+        if key is None:
+            return
+
+        self.connection.execute(
+            "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?, ?)", (key[0], key[1], mode, key[2], key[3], digest, time.time()))
+
+    def clear(self):
+        self.connection.execute("DELETE FROM hashes")
+        self._touched.clear()
+
+    def close(self):
+        ''' Writes the access times of any cache hits, evicts the least recently used entries past the size cap, then closes the database '''
+        self.connection.executemany(
+            "UPDATE hashes SET last_used = ? WHERE path = ? AND packed = ? AND mode = ?", self._touched)
+
+        overflow = self.connection.execute("SELECT COUNT(*) FROM hashes").fetchone()[0] - self.max_entries
+        if overflow > 0:
+            self.connection.execute(
+                "DELETE FROM hashes WHERE rowid IN (SELECT rowid FROM hashes ORDER BY last_used ASC LIMIT ?)", (overflow,))
+
+        self.connection.commit()
+        self.connection.close()
+
+def open_texture_hash_cache():
+    ''' Opens the texture hash cache if it's enabled in the settings, otherwise returns None '''
+    if not bpy.context.scene.MatBatchProperties.HashUseCache:
+        return None
+    return TextureHashCache(bpy.context.scene.MatBatchProperties.HashCacheMaxEntries)
+
+def image_layout_key(image, mode):
+    ''' Returns the resolution and channel count of an image, plus whether it stores float pixels in EXACT mode. Images with a different '''
+    ''' layout can never hash the same. In QUANTIZED mode, byte and float images quantize to the same 8-bit values, so they're compared  '''
+    key = (tuple(image.size), image.channels)
+    if mode == "EXACT":
+        key += (image.is_float,)
+    return key
+
+def find_duplicate_candidates(images, hasher, cache=None):
+    ''' Groups images by a cheap key, and returns only the images that share their group with at least one other image, as a list,  '''
+    ''' plus a dictionary of image -> hash of every image that had to be hashed along the way, so they're never read a second time    '''
+    ''' The key can only differ between images that can never hash the same: the file size in SOURCE mode (which hashes the file      '''
+    ''' bytes), or the resolution and channel layout in the pixel modes, since the same pixels can be stored in files of any size      '''
+    ''' In the pixel modes, every group with 2+ members is hashed in full right away (through the hash cache), since reading an image  '''
+    ''' for any sample already costs a full copy of its pixels. Only images whose hash is shared are returned                            '''
+    buckets = dict()
+    for image in images:
+        key = image_file_size(image) if hasher.mode == "SOURCE" else image_layout_key(image, hasher.mode)
+        buckets.setdefault(key, []).append(image)
+
+    candidates = []
+    digests = dict()
+    for bucket in buckets.values():
+        if len(bucket) < 2:
+            continue
+
+        # Byte-identical files always share their file size, so the file bytes are hashed later, all together on the thread pool
+        if hasher.mode == "SOURCE":
+            candidates.extend(bucket)
+            continue
+
+        images_by_hash = dict()
+        for image in bucket:
+            digest = hash_image(image, hasher, cache)
+            digests[image] = digest
+            if digest is not None:
+                images_by_hash.setdefault(digest, []).append(image)
+
+        for same_hash in images_by_hash.values():
+            if len(same_hash) > 1:
+                candidates.extend(same_hash)
+
+    return candidates, digests
+
+def hash_image(image, hasher, cache=None):
+    ''' Returns the hash of an image, reading it from the hash cache when the image's source hasn't changed                 '''
+    ''' Images that don't fit the hasher's memory budget are added to its oversized_images, and hashed by their source bytes '''
+    ''' instead. Returns None if such an image has no source bytes to hash                                                   '''
+    if not hasher.fits(image):
+        hasher.oversized_images.append(image)
+        return hash_image_source(image, cache)
+
+    key = None
+    if cache is not None:
+        key = TextureHashCache.key_for(image)
+        digest = cache.get(key, hasher.mode)
+        if digest is not None:
+            return digest
+
+    digest = hasher.hexdigest(image)
+    if cache is not None:
+        cache.put(key, hasher.mode, digest)
+    return digest
+
+def hash_file_bytes(path):
+    ''' Returns the MD5 hash of a file's bytes, read through a memory map. Never touches bpy, so it's safe to run on worker threads '''
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return hashlib.md5().hexdigest()
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return hashlib.md5(mapped).hexdigest()
+
+def hash_packed_bytes(data):
+    return hashlib.md5(data).hexdigest()
+
+def hash_image_source(image, cache=None):
+    ''' Returns the hash of an image's file (or packed data) without decoding it, the same as the SOURCE hash mode, or None for  '''
+    ''' generated images, images with unsaved pixel edits and unreadable files                                                  '''
+    if image.packed_file is not None:
+        return hash_packed_bytes(image.packed_file.data)
+
+    path = image_source_path(image)
+    if path is None or image.is_dirty:
+        return None
+
+    key = None
+    if cache is not None:
+        key = TextureHashCache.key_for(image)
+        digest = cache.get(key, "SOURCE")
+        if digest is not None:
+            return digest
+
+    try:
+        digest = hash_file_bytes(path)
+    except OSError:
+        return None
+    if cache is not None:
+        cache.put(key, "SOURCE", digest)
+    return digest
+
+def summarize_names(names, limit=10):
+    ''' Joins up to limit names for a message box. Longer lists are cut short, and printed to the console in full '''
+    if len(names) <= limit:
+        return ", ".join(names)
+    for name in names:
+        print(name)
+    return ", ".join(names[:limit]) + f", ... and {len(names) - limit} more (see the console)"
+
+def hash_images_by_source(images, workers=0, cache=None):
+    ''' Hashes the source bytes of many images on a thread pool, and returns a dictionary of image -> hash         '''
+    ''' Everything that touches bpy (paths, packed data, the cache) runs here on the main thread. The workers only get '''
+    ''' plain paths and bytes, and hashlib releases the GIL while hashing, so all CPU cores are used                 '''
+    ''' Jobs are submitted as they're built, and only a few are kept in flight, so at most that many copies of packed '''
+    ''' image data exist at once                                                                                    '''
+    digests = dict()
+    fallback_hasher = PixelHasher("QUANTIZED")
+    max_workers = workers if workers > 0 else os.cpu_count()
+    pending = deque()
+
+    def finish(image, key, future):
+        # Results are applied back on the main thread, in submission order
+        try:
+            digest = future.result()
+        except OSError:
+            digests[image] = fallback_hasher.hexdigest(image)
+            return
+
+        digests[image] = digest
+        if cache is not None and key is not None:
+            cache.put(key, "SOURCE", digest)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for image in images:
+            if image.packed_file is not None:
+                # The cache key of a packed image is already a hash of its data, so looking it up would cost as much as hashing it
+                pending.append((image, None, pool.submit(hash_packed_bytes, image.packed_file.data)))
+            else:
+                path = image_source_path(image)
+                if path is None or image.is_dirty:
+                    digests[image] = fallback_hasher.hexdigest(image)
+                    continue
 
-    mesh_obj.select_set(False)
-    bpy.context.view_layer.objects.active = bpy.context.selected_objects[0]
-    new_obj = bpy.context.active_object
+                key = None
+                if cache is not None:
+                    key = TextureHashCache.key_for(image)
+                    digest = cache.get(key, "SOURCE")
+                    if digest is not None:
+                        digests[image] = digest
+                        continue
+
+                pending.append((image, key, pool.submit(hash_file_bytes, path)))
+
+            # Wait for the oldest job once enough are queued, so packed data doesn't pile up faster than it's hashed
+            while len(pending) > max_workers * 2:
+                finish(*pending.popleft())
+
+        while len(pending) > 0:
+            finish(*pending.popleft())
 
-    return new_obj
+    return digests
 
 
 # Bake Target copy operator
@@ -496,12 +2508,12 @@ class AssignUVMapNode(bpy.types.Operator):
                                         node.inputs[0].links[0].from_node)
                                     reference_node = node
 
-                                # If the Image Texture has some other kind of node connected... recursively search to find the closest UV Map node
+                                # If the Image Texture has some other kind of node connected... search upstream to find the closest UV Map node
                                 else:
-                                    foundnode = recursive_node_search(
-                                        node, "UVMAP")
+                                    foundnode, path = find_upstream_node(
+                                        node, lambda candidate: candidate.type == "UVMAP")
                                     if foundnode:
-                                        reference_node = foundnode.outputs[0].links[0].to_node
+                                        reference_node = path[-2]
                                         nodetree.nodes.remove(
                                             foundnode)
                                     else:
@@ -536,42 +2548,43 @@ class OverwriteUVSlotName(bpy.types.Operator):
 
     def execute(self, context):
         num_processed = 0
-        # Check if any objects are selected
-        if check_for_selected(True) != False:
+        mesh_work = plan_mesh_work()
 
-            # For each selected object
-            for obj in bpy.context.selected_objects:
-                if obj.type == "MESH":
-                    mesh = obj.data
-                    uvslots = mesh.uv_layers
-                    uvslot_index = int(
-                        bpy.context.scene.MatBatchProperties.UVSlotIndex)
-                    uvname = bpy.context.scene.MatBatchProperties.UVMapNodeTarget
-
-                    counter = 0
-                    for slot in uvslots:
-                        if slot.name == uvname:
-                            if counter != uvslot_index - 1:
-                                slot.name = slot.name + ".001"
-                        else:
-                            counter += 1
-
-                    if len(uvslots) == 0 and uvslot_index == 1:
-                        uvslots.new(
-                            name=uvname)
-                    elif len(uvslots) == 1 and uvslot_index == 2:
-                        uvslots.new(
-                            name=uvname)
-                    elif len(uvslots) == 0 and uvslot_index == 2:
-                        uvslots.new(
-                            name=uvname + ".001")
-                        uvslots.new(
-                            name=uvname)
-                    elif uvslots[uvslot_index-1] != None:
-                        uvslots[uvslot_index -
-                                1].name = uvname
-                    num_processed += 1
-                    obj.data.update()
+        # Check if any objects are selected
+        if mesh_work != False:
+
+            # For each unique mesh in the selected objects
+            for work_item in mesh_work:
+                mesh = work_item.mesh
+                uvslots = mesh.uv_layers
+                uvslot_index = int(
+                    bpy.context.scene.MatBatchProperties.UVSlotIndex)
+                uvname = bpy.context.scene.MatBatchProperties.UVMapNodeTarget
+
+                counter = 0
+                for slot in uvslots:
+                    if slot.name == uvname:
+                        if counter != uvslot_index - 1:
+                            slot.name = slot.name + ".001"
+                    else:
+                        counter += 1
+
+                if len(uvslots) == 0 and uvslot_index == 1:
+                    uvslots.new(
+                        name=uvname)
+                elif len(uvslots) == 1 and uvslot_index == 2:
+                    uvslots.new(
+                        name=uvname)
+                elif len(uvslots) == 0 and uvslot_index == 2:
+                    uvslots.new(
+                        name=uvname + ".001")
+                    uvslots.new(
+                        name=uvname)
+                elif uvslots[uvslot_index-1] != None:
+                    uvslots[uvslot_index -
+                            1].name = uvname
+                num_processed += len(work_item.owners)
+                mesh.update()
 
 
         display_msg_box(
@@ -590,20 +2603,21 @@ class SetUVSlotAsActive(bpy.types.Operator):
 
     def execute(self, context):
         num_processed = 0
+        mesh_work = plan_mesh_work()
+
         # Check if any objects are selected
-        if check_for_selected(True) != False:
+        if mesh_work != False:
 
-            # For each selected object
-            for obj in bpy.context.selected_objects:
-                if obj.type == "MESH":
-                    mesh = obj.data
-                    uvslots = mesh.uv_layers
-                    uvslot_index = int(
-                        bpy.context.scene.MatBatchProperties.UVSlotIndex)
-                    if len(uvslots) > 0:
-                        uvslots.active = uvslots[uvslot_index - 1]
-                        num_processed += 1
-                    obj.data.update()
+            # For each unique mesh in the selected objects
+            for work_item in mesh_work:
+                mesh = work_item.mesh
+                uvslots = mesh.uv_layers
+                uvslot_index = int(
+                    bpy.context.scene.MatBatchProperties.UVSlotIndex)
+                if len(uvslots) > 0:
+                    uvslots.active = uvslots[uvslot_index - 1]
+                    num_processed += len(work_item.owners)
+                    mesh.update()
 
 
         display_msg_box(
@@ -623,30 +2637,26 @@ class AssignVCToNodes(bpy.types.Operator):
     def execute(self, context):
         num_processed = 0
 
-        list_of_mats = check_for_selected()
+        work_items = plan_material_work()
 
         # Check if any objects are selected.
-        if list_of_mats != False:
+        if work_items != False:
 
-            # For each selected object
-            for obj in bpy.context.selected_objects:
-
-                if obj.type == "MESH":
-                    num_processed += 1
-                    
-                    # For each material in selected object
-                    for mat in list_of_mats:
+            # Only the materials change, so each unique material is visited once, and no mesh needs an update
+            for work_item in work_items:
+                if work_item.material.node_tree == None:
+                    continue
 
-                        for node in bpy.data.materials[mat].node_tree.nodes:
+                for node in work_item.material.node_tree.nodes:
 
-                            if node.type == "VERTEX_COLOR":
-                                node.layer_name = bpy.context.scene.MatBatchProperties.VCName
-                            elif node.type == "ATTRIBUTE":
-                                node.attribute_name = bpy.context.scene.MatBatchProperties.VCName
-                    obj.data.update()
+                    if node.type == "VERTEX_COLOR":
+                        node.layer_name = bpy.context.scene.MatBatchProperties.VCName
+                    elif node.type == "ATTRIBUTE":
+                        node.attribute_name = bpy.context.scene.MatBatchProperties.VCName
+                num_processed += 1
 
         display_msg_box(
-            f'Assigned vertex color layer in {num_processed} object(s).', 'Info', 'INFO')
+            f'Assigned vertex color layer in {num_processed} material(s).', 'Info', 'INFO')
         
         return {'FINISHED'}
 
@@ -665,33 +2675,34 @@ class RenameVertexColorSlot(bpy.types.Operator):
         # Blender 3.2 renamed "vertex colors" to "color attributes," so let's check the version beforehand
         useColorAttributes = (bpy.app.version >= (3, 2, 0))
 
+        mesh_work = plan_mesh_work()
+
         # Check if any objects are selected
-        if check_for_selected(True) != False:
+        if mesh_work != False:
 
-            # For each selected object
-            for obj in bpy.context.selected_objects:
-                if obj.type == "MESH":
+            # For each unique mesh in the selected objects
+            for work_item in mesh_work:
 
-                    mesh = obj.data
-                    if useColorAttributes:
-                        vcslots = mesh.color_attributes
-                    else:
-                        vcslots = mesh.vertex_colors
-                    vcname = bpy.context.scene.MatBatchProperties.VCName
+                mesh = work_item.mesh
+                if useColorAttributes:
+                    vcslots = mesh.color_attributes
+                else:
+                    vcslots = mesh.vertex_colors
+                vcname = bpy.context.scene.MatBatchProperties.VCName
 
-                    if len(vcslots) > 0:
-                        vcslots[0].name = vcname
+                if len(vcslots) > 0:
+                    vcslots[0].name = vcname
+                else:
+                    if useColorAttributes:
+                        vcslots.new(name=vcname, type="FLOAT_COLOR",
+                                    domain="POINT")
+                        # vcslots.new(name=vcname, type="BYTE_COLOR",
+                        #             domain="CORNER")
                     else:
-                        if useColorAttributes:
-                            vcslots.new(name=vcname, type="FLOAT_COLOR",
-                                        domain="POINT")
-                            # vcslots.new(name=vcname, type="BYTE_COLOR",
-                            #             domain="CORNER")
-                        else:
-                            vcslots.new(name=vcname)
-                        
-                    num_processed += 1
-                    obj.data.update()
+                        vcslots.new(name=vcname)
+                    
+                num_processed += 1
+                mesh.update()
 
         display_msg_box(
             f'Renamed {num_processed} vertex color slot(s).', 'Info', 'INFO')
@@ -700,7 +2711,7 @@ class RenameVertexColorSlot(bpy.types.Operator):
 # Convert Vertex Color operator
 
 class ConvertVertexColor(bpy.types.Operator):
-    """Converts the data type of the first Color Attribute slot in all selected objects, between 'Face Corner Byte Color' and 'Vertex Color'"""
+    """Converts the data type of the first Color Attribute slot in all selected objects, between 'Face Corner Byte Color' and 'Vertex Color'. The colors are kept: face corners are averaged per vertex, and vertex colors are copied to every face corner"""
     bl_idname = "object.convert_vertex_color"
     bl_label = "Convert Vertex Color Slot 1"
     bl_options = {'REGISTER'}
@@ -717,28 +2728,24 @@ class ConvertVertexColor(bpy.types.Operator):
 
         num_processed = 0
 
+        mesh_work = plan_mesh_work()
+
         # Check if any objects are selected
-        if check_for_selected(True) != False:
+        if mesh_work != False:
 
-            # For each selected object
-            for obj in bpy.context.selected_objects:
-                if obj.type == "MESH":
+            # For each unique mesh in the selected objects. A mesh shared by several objects is only converted once
+            for work_item in mesh_work:
 
-                    mesh = obj.data
-                    vcslots = mesh.color_attributes
-                    vcname = bpy.context.scene.MatBatchProperties.VCName
-
-                    if len(vcslots) == 1:
-                        if vcslots[0].data_type == "FLOAT_COLOR":
-                            vcslots.remove(vcslots[0])
-                            vcslots.new(name=vcname, type="BYTE_COLOR",
-                                        domain="CORNER")
-                        elif vcslots[0].data_type == "BYTE_COLOR":
-                            vcslots.remove(vcslots[0])
-                            vcslots.new(name=vcname, type="FLOAT_COLOR",
-                                        domain="POINT")
-                        num_processed += 1
-                    obj.data.update()
+                mesh = work_item.mesh
+                vcslots = mesh.color_attributes
+                vcname = bpy.context.scene.MatBatchProperties.VCName
+
+                # Only the first slot is converted. Any other slots are left as they are
+                if len(vcslots) > 0 and vcslots[0].data_type in COLOR_ATTRIBUTE_CONVERSIONS:
+                    data_type, domain = COLOR_ATTRIBUTE_CONVERSIONS[vcslots[0].data_type]
+                    convert_color_attribute(mesh, vcslots[0], data_type, domain, vcname)
+                    num_processed += 1
+                    mesh.update()
 
         display_msg_box(
             f'Converted {num_processed} color attribute slot(s).', 'Info', 'INFO')
@@ -764,57 +2771,53 @@ class SetBlendMode(bpy.types.Operator):
         if alpha_mode == "BLEND":
             shadow_mode = "CLIP"
 
-        list_of_mats = check_for_selected()
+        work_items = plan_material_work()
 
         # Check if any objects are selected.
-        if list_of_mats != False:
+        if work_items != False:
 
-            # For each selected object
-            for obj in bpy.context.selected_objects:
-                if obj.type == "MESH":
-
-                    # For each material in selected object
-                    for mat in list_of_mats:
+            # For each unique material in the selected objects
+            for work_item in work_items:
+                material = work_item.material
 
-                        principled_nodes = []
-                        for node in bpy.data.materials[mat].node_tree.nodes:
-                            if node.type == "BSDF_PRINCIPLED":
-                                principled_nodes.append(node)
-
-                        # If user also wants to remove any alpha from the Principled node itself too
-                        if bpy.context.scene.MatBatchProperties.AlphaPrincipledRemove == True and alpha_mode == "OPAQUE":
-                            for node in principled_nodes:
-                                if len(node.inputs[principled_alpha_slot].links) > 0:
-                                    bpy.data.materials[mat].node_tree.links.remove(
-                                        node.inputs[principled_alpha_slot].links[0])
-                                node.inputs[principled_alpha_slot].default_value = 1.0
-
-                        # Filter 1 - Principled BSDF with Alpha
-                        if filter_mode == "PRINCIPLEDNODE":
-                            for node in bpy.data.materials[mat].node_tree.nodes:
-                                if node.type == "BSDF_PRINCIPLED":
-                                    if len(node.inputs[principled_alpha_slot].links) > 0:
-                                        update_alpha_settings(mat, alpha_mode, shadow_mode, alpha_threshold)
-                                        num_processed += 1
-                                        break
-                                    else:
-                                        if node.inputs[principled_alpha_slot].default_value < 1.0:
-                                            update_alpha_settings(mat, alpha_mode, shadow_mode, alpha_threshold)
-                                            num_processed += 1
-                                            break
-
-                        # Filter 2 - Transparent BSDF
-                        elif filter_mode == "TRANSPARENTNODE":
-                            for node in bpy.data.materials[mat].node_tree.nodes:
-                                    update_alpha_settings(mat, alpha_mode, shadow_mode, alpha_threshold)
+                principled_nodes = []
+                for node in material.node_tree.nodes:
+                    if node.type == "BSDF_PRINCIPLED":
+                        principled_nodes.append(node)
+
+                # If user also wants to remove any alpha from the Principled node itself too
+                if bpy.context.scene.MatBatchProperties.AlphaPrincipledRemove == True and alpha_mode == "OPAQUE":
+                    for node in principled_nodes:
+                        if len(node.inputs[principled_alpha_slot].links) > 0:
+                            material.node_tree.links.remove(
+                                node.inputs[principled_alpha_slot].links[0])
+                        node.inputs[principled_alpha_slot].default_value = 1.0
+
+                # Filter 1 - Principled BSDF with Alpha
+                if filter_mode == "PRINCIPLEDNODE":
+                    for node in material.node_tree.nodes:
+                        if node.type == "BSDF_PRINCIPLED":
+                            if len(node.inputs[principled_alpha_slot].links) > 0:
+                                update_alpha_settings(material, alpha_mode, shadow_mode, alpha_threshold)
+                                num_processed += 1
+                                break
+                            else:
+                                if node.inputs[principled_alpha_slot].default_value < 1.0:
+                                    update_alpha_settings(material, alpha_mode, shadow_mode, alpha_threshold)
                                     num_processed += 1
                                     break
 
-                        else:
-                            update_alpha_settings(mat, alpha_mode, shadow_mode, alpha_threshold)
+                # Filter 2 - Transparent BSDF
+                elif filter_mode == "TRANSPARENTNODE":
+                    for node in material.node_tree.nodes:
+                            update_alpha_settings(material, alpha_mode, shadow_mode, alpha_threshold)
                             num_processed += 1
-                            continue
-                    obj.data.update()
+                            break
+
+                else:
+                    update_alpha_settings(material, alpha_mode, shadow_mode, alpha_threshold)
+                    num_processed += 1
+                    continue
 
         display_msg_box(
             f'Updated alpha settings for {str(num_processed)} material(s).', 'Info', 'INFO')
@@ -872,6 +2875,7 @@ class UnifyNodeSettings(bpy.types.Operator):
 
     def execute(self, context):
         num_processed = 0
+        num_changed = 0
         node_type = node_unify_settings["type"]
 
         # Check if template node's material still exists:
@@ -883,151 +2887,21 @@ class UnifyNodeSettings(bpy.types.Operator):
                 template_node = bpy.data.materials[node_unify_settings["material"]
                                                    ].node_tree.nodes[node_unify_settings["name"]]
 
-                list_of_mats = check_for_selected()
+                work_items = plan_material_work()
 
                 # Check if any objects are selected.
-                if list_of_mats != False:
+                if work_items != False:
 
                     # Check if there are any previously copied node settings
                     if node_unify_settings["name"] != "":
 
-                        # For each selected object
-                        for obj in bpy.context.selected_objects:
-                            if obj.type == "MESH":
-                                num_processed += 1
-
-                                # For each material in selected object
-                                for mat in list_of_mats:
-
-                                    valid_nodes = []
-
-                                    for node in bpy.data.materials[mat].node_tree.nodes:
-
-                                        # Check if node is of the saved type
-                                        if node.type == node_type:
+                        # Capture the template node's settings once, instead of once per node
+                        label_filter = bpy.context.scene.MatBatchProperties.UnifyFilterLabel
+                        dispatch = {node_type: {label_filter: NodeSettingsSnapshot(template_node)}}
 
-                                            # Check if a Label Filter was specified
-                                            if bpy.context.scene.MatBatchProperties.UnifyFilterLabel != "":
-                                                if node.label == bpy.context.scene.MatBatchProperties.UnifyFilterLabel:
-                                                    valid_nodes.append(node)
-                                                else:
-                                                    continue
+                        num_processed = len(work_items)
+                        num_changed = unify_nodes(work_items, dispatch, [template_node], bpy.context.scene.MatBatchProperties.UnifyOnlyChanges)
 
-                                            else:
-                                                valid_nodes.append(node)
-
-                                    # Special operations for curve nodes - storing template curve data for later
-                                    template_curve_data = [[],[],[],[]]
-                                    template_curve_handle_types = [[],[],[],[]]
-                                    if 'CURVE' in node.type:
-                                        curve_index = 0
-                                        for curve in template_node.mapping.curves:
-                                            for point in curve.points:
-                                                template_curve_data[curve_index].append(tuple(point.location))
-                                                template_curve_handle_types[curve_index].append(point.handle_type)
-                                            curve_index += 1
-                                    else:
-                                        del template_curve_data
-                                        del template_curve_handle_types
-
-                                    # Special operations for color ramp nodes - storing template gradient data for later
-                                    template_ramp_data = []
-                                    if 'VALTORGB' in node.type:
-                                        for stop in template_node.color_ramp.elements:
-                                            template_ramp_data.append((stop.position, tuple(stop.color)))
-                                    else:
-                                        del template_ramp_data
-                                                
-                                    for node in valid_nodes:
-
-                                        # Copy and paste inputs from template node
-                                        input_counter = 0
-
-                                        for i in node.inputs:
-
-                                            if hasattr(i, "default_value") and hasattr(template_node.inputs[input_counter], "default_value"):
-
-                                                i.default_value = template_node.inputs[
-                                                    input_counter].default_value
-                                                input_counter += 1
-
-                                        # Copy and paste properties from template node, but exclude the properties contained in a "do not use" list
-                                        property_list = list(
-                                            template_node.bl_rna.properties.keys())
-                                        new_property_list = list()
-
-                                        do_not_use = ['rna_type', 'type', 'location', 'width', 'width_hidden', 'height', 'dimensions', 'name', 'label', 'inputs', 'outputs', 'internal_links', 'parent', 'use_custom_color', 'color', 'select', 'show_options',
-                                                      'show_preview', 'hide', 'mute', 'show_texture', 'bl_idname', 'bl_label', 'bl_description', 'bl_icon', 'bl_static_type', 'bl_width_default', 'bl_width_min', 'bl_width_max', 'bl_height_default', 'bl_height_min', 'bl_height_max']
-
-                                        for prop in property_list:
-                                            if prop not in do_not_use:
-                                                if node.is_property_readonly(prop) == False:
-                                                    new_property_list.append(
-                                                        prop)
-
-                                        for prop in new_property_list:
-                                            setattr(
-                                                node, prop, eval(f"template_node.{prop}"))
-
-                                        # Special operations for curve nodes - copying template curve data over
-                                        if 'CURVE' in template_node.type and 'CURVE' in node.type:
-                                            curve_index = 0
-                                            for curve in node.mapping.curves:
-
-                                                # Clear the existing points first
-                                                point_count = len(curve.points)
-                                                for index in list(range(0,point_count)):
-                                                    try:
-                                                        curve.points.remove(curve.points[index])
-                                                    except:
-                                                        continue
-                                                
-                                                # Check if the point counts are the same. If not, we need to add new points
-                                                point_count_difference = abs(len(curve.points) - len(template_curve_data[curve_index]))
-                                                if point_count_difference > 0:
-                                                    for index in range(0, point_count_difference):
-                                                        curve.points.new(1,1)
-
-                                                point_index = 0
-                                                for point in curve.points:
-                                                    point.location = template_curve_data[curve_index][point_index]
-                                                    point.handle_type = template_curve_handle_types[curve_index][point_index]
-                                                    point_index += 1
-
-                                                curve_index += 1
-                                            node.mapping.use_clip = template_node.mapping.use_clip
-                                            node.mapping.clip_min_x = template_node.mapping.clip_min_x
-                                            node.mapping.clip_min_y = template_node.mapping.clip_min_y
-                                            node.mapping.clip_max_x = template_node.mapping.clip_max_x
-                                            node.mapping.clip_max_y = template_node.mapping.clip_max_y
-                                            node.mapping.update()
-                                        
-                                        # Special operations for color ramp nodes - copying template gradient data over
-                                        if 'VALTORGB' in template_node.type and 'VALTORGB' in node.type:
-                                            # Clear the existing points first
-                                            stop_count = len(node.color_ramp.elements)
-                                            for index in list(range(0,stop_count)):
-                                                try:
-                                                    node.color_ramp.elements.remove(node.color_ramp.elements[index])
-                                                except:
-                                                    continue
-
-                                            # Check if the stop counts are the same. If not, we need to add new points.
-                                            stop_count_difference = abs(len(node.color_ramp.elements) - len(template_ramp_data))
-                                            if stop_count_difference > 0:
-                                                for index in range(0,stop_count_difference):
-                                                    node.color_ramp.elements.new(1.0)
-
-                                            stop_index = 0
-                                            for stop in node.color_ramp.elements:
-                                                stop.position = template_ramp_data[stop_index][0]
-                                                stop.color = template_ramp_data[stop_index][1]
-                                                stop_index += 1
-                                            
-                                            node.color_ramp.color_mode = template_node.color_ramp.color_mode
-                                            node.color_ramp.hue_interpolation = template_node.color_ramp.hue_interpolation
-                                            node.color_ramp.elements.update()
-                                           
                     else:
                         display_msg_box(
                             "You haven't set a a template yet. Use the Set as Template button to set one.", "Error", "ERROR")
@@ -1042,7 +2916,108 @@ class UnifyNodeSettings(bpy.types.Operator):
             return {'FINISHED'}
         
         display_msg_box(
-            f'Applied unified node settings in {num_processed} object(s).', 'Info', 'INFO')
+            f'Applied unified node settings in {num_processed} material(s). {num_changed} node(s) changed.', 'Info', 'INFO')
+        return {'FINISHED'}
+
+# Node Unify template set operators
+
+class AddUnifyTemplate(bpy.types.Operator):
+    """Adds the currently active, selected node to the Node Unify template set, together with the current Label Filter. A template already in the set for the same node type and label filter is replaced"""
+    bl_idname = "material.add_unify_template"
+    bl_label = "Add to Template Set"
+    bl_options = {'REGISTER'}
+
+    def execute(self, context):
+        active_object = bpy.context.active_object
+
+        # Check if there's an active material with an active node
+        if active_object == None or active_object.active_material == None or active_object.active_material.node_tree == None:
+            display_msg_box(
+                "There is no active material. Click on a mesh object with a material to set one as active", "Error", "ERROR")
+            return {'FINISHED'}
+
+        active_node = active_object.active_material.node_tree.nodes.active
+        if active_node == None:
+            display_msg_box(
+                "There is no active node. Click on a node to set one as active", "Error", "ERROR")
+            return {'FINISHED'}
+
+        templates = bpy.context.scene.MatBatchProperties.UnifyTemplates
+        label_filter = bpy.context.scene.MatBatchProperties.UnifyFilterLabel
+
+        # Each (node type, label filter) pair can only have one template
+        template = None
+        for entry in templates:
+            if entry.NodeType == active_node.type and entry.FilterLabel == label_filter:
+                template = entry
+                break
+        if template == None:
+            template = templates.add()
+
+        template.NodeName = active_node.name
+        template.NodeType = active_node.type
+        template.NodeLabel = active_node.bl_label
+        template.Material = active_object.active_material.name
+        template.FilterLabel = label_filter
+
+        return {'FINISHED'}
+
+
+class RemoveUnifyTemplate(bpy.types.Operator):
+    """Removes this template from the Node Unify template set. The template node itself is not changed"""
+    bl_idname = "material.remove_unify_template"
+    bl_label = "Remove from Template Set"
+    bl_options = {'REGISTER'}
+
+    index: bpy.props.IntProperty(default=-1)
+
+    def execute(self, context):
+        templates = bpy.context.scene.MatBatchProperties.UnifyTemplates
+        if 0 <= self.index < len(templates):
+            templates.remove(self.index)
+        return {'FINISHED'}
+
+
+class UnifyTemplateSet(bpy.types.Operator):
+    """Applies every template in the Node Unify template set, in all materials on selected objects, in a single pass over each material. Nodes with a label that has its own template use that one; other nodes use the template without a label filter"""
+    bl_idname = "material.unify_template_set"
+    bl_label = "Unify Template Set"
+    bl_options = {'REGISTER'}
+
+    def execute(self, context):
+        templates = bpy.context.scene.MatBatchProperties.UnifyTemplates
+
+        if len(templates) == 0:
+            display_msg_box(
+                "The template set is empty. Use the Add to Template Set button to add nodes to it.", "Error", "ERROR")
+            return {'FINISHED'}
+
+        work_items = plan_material_work()
+
+        # Check if any objects are selected.
+        if work_items == False:
+            return {'FINISHED'}
+
+        # Capture every template node once, and index the snapshots by node type and label filter
+        dispatch = dict()
+        template_nodes = []
+        missing = []
+        for template in templates:
+            template_node = get_unify_template_node(template.Material, template.NodeName)
+            if template_node == None:
+                missing.append(f"{template.Material} > {template.NodeName}")
+                continue
+            template_nodes.append(template_node)
+            dispatch.setdefault(template.NodeType, dict())[template.FilterLabel] = NodeSettingsSnapshot(template_node)
+
+        num_changed = unify_nodes(work_items, dispatch, template_nodes, bpy.context.scene.MatBatchProperties.UnifyOnlyChanges)
+
+        message = f'Applied {len(template_nodes)} template(s) in {len(work_items)} material(s). {num_changed} node(s) changed.'
+        if len(missing) > 0:
+            display_msg_box(
+                message + " Skipped templates whose node no longer exists: " + ", ".join(missing), "Error", "ERROR")
+        else:
+            display_msg_box(message, 'Info', 'INFO')
         return {'FINISHED'}
 
 # Shader Switch operator
@@ -1057,10 +3032,10 @@ class SwitchShader(bpy.types.Operator):
     def execute(self, context):
 
         num_processed = 0
-        list_of_mats = check_for_selected()
+        work_items = plan_material_work()
 
         # Check if any objects are selected.
-        if list_of_mats != False:
+        if work_items != False:
 
             old_shader_type = None
             target_shader_type = bpy.context.scene.MatBatchProperties.SwitchShaderTarget
@@ -1070,59 +3045,55 @@ class SwitchShader(bpy.types.Operator):
             else:
                 old_shader_type = "EMISSION"
 
-            # For each selected object
-            for obj in bpy.context.selected_objects:
-                if obj.type == "MESH":
-
-                    # For each material in selected object
-                    for mat in list_of_mats:
+            # For each unique material in the selected objects
+            for work_item in work_items:
 
-                        material = bpy.data.materials[mat]
+                material = work_item.material
 
-                        # Find the other shader
-                        old_shaders = []
-                        for node in bpy.data.materials[mat].node_tree.nodes:
-                            if node.type == old_shader_type:
-                                old_shaders.append(node)
-                                break
+                # Find the other shader
+                old_shaders = []
+                for node in material.node_tree.nodes:
+                    if node.type == old_shader_type:
+                        old_shaders.append(node)
+                        break
 
-                        # If the old shader wasn't found, skip this material and continue to the next material
-                        if len(old_shaders) == 0:
-                            continue
+                # If the old shader wasn't found, skip this material and continue to the next material
+                if len(old_shaders) == 0:
+                    continue
 
-                        # If opposite shader was found:
-                        else:
+                # If opposite shader was found:
+                else:
 
-                            for old_shader in old_shaders:
-
-                                new_shader = None
-                                input_node_socket = None
-                                output_node_socket = None
-
-                                if len(old_shader.inputs[0].links) > 0:
-                                    input_node_socket = old_shader.inputs[0].links[0].from_socket
-                                if len(old_shader.outputs[0].links) > 0:
-                                    output_node_socket = old_shader.outputs[0].links[0].to_socket
-
-                                # Create new shader
-                                if target_shader_type == "BSDF_PRINCIPLED":
-                                    new_shader = bpy.data.materials[mat].node_tree.nodes.new(
-                                        "ShaderNodeBsdfPrincipled")
-
-                                if target_shader_type == "EMISSION":
-                                    new_shader = bpy.data.materials[mat].node_tree.nodes.new(
-                                        "ShaderNodeEmission")
-
-                                # Place the new shader in the old shader's location
-                                new_shader.location = old_shader.location
-                                if len(old_shader.inputs[0].links) > 0:
-                                    material.node_tree.links.new(
-                                        new_shader.inputs[0], input_node_socket)
-                                if len(old_shader.outputs[0].links) > 0:
-                                    material.node_tree.links.new(
-                                        output_node_socket, new_shader.outputs[0])
-                                material.node_tree.nodes.remove(old_shader)
-                                num_processed += 1
+                    for old_shader in old_shaders:
+
+                        new_shader = None
+                        input_node_socket = None
+                        output_node_socket = None
+
+                        if len(old_shader.inputs[0].links) > 0:
+                            input_node_socket = old_shader.inputs[0].links[0].from_socket
+                        if len(old_shader.outputs[0].links) > 0:
+                            output_node_socket = old_shader.outputs[0].links[0].to_socket
+
+                        # Create new shader
+                        if target_shader_type == "BSDF_PRINCIPLED":
+                            new_shader = material.node_tree.nodes.new(
+                                "ShaderNodeBsdfPrincipled")
+
+                        if target_shader_type == "EMISSION":
+                            new_shader = material.node_tree.nodes.new(
+                                "ShaderNodeEmission")
+
+                        # Place the new shader in the old shader's location
+                        new_shader.location = old_shader.location
+                        if len(old_shader.inputs[0].links) > 0:
+                            material.node_tree.links.new(
+                                new_shader.inputs[0], input_node_socket)
+                        if len(old_shader.outputs[0].links) > 0:
+                            material.node_tree.links.new(
+                                output_node_socket, new_shader.outputs[0])
+                        material.node_tree.nodes.remove(old_shader)
+                        num_processed += 1
 
         display_msg_box(
             f'Switched shader in {num_processed} material(s).', 'Info', 'INFO')
@@ -1140,628 +3111,74 @@ class ApplyMatTemplate(bpy.types.Operator):
     def execute(self, context):
 
         num_processed = 0
-        list_of_mats = check_for_selected()
-        useColorAttributes = bpy.app.version >= (3, 2, 0)
-        mix_node_type = "ShaderNodeMixRGB" if bpy.app.version < (3, 4, 0) else "ShaderNodeMix"
-        principled_alpha_slot = 21 if bpy.app.version < (4, 0, 0) else 4
+        num_unchanged = 0
+        work_items = plan_material_work()
+        clear_connected_nodes_cache()
 
         # Check if any objects are selected.
-        if list_of_mats != False:
+        if work_items != False:
+
+            # Compile the template once for this Blender version, then replay it in every material
+            try:
+                template_key = bpy.context.scene.MatBatchProperties.Template
+                instanced = bpy.context.scene.MatBatchProperties.TemplateInstancing
+                library_path = None
+                if instanced and bpy.context.scene.MatBatchProperties.TemplateLibraryPath != "":
+                    library_path = os.path.normpath(bpy.path.abspath(bpy.context.scene.MatBatchProperties.TemplateLibraryPath))
+                template = MaterialTemplate(template_key, get_material_template(template_key), bpy.context.scene.MatBatchProperties.SkipTexture, library_path=library_path)
+            except ValueError as error:
+                display_msg_box(str(error), "Error", "ERROR")
+                return {'FINISHED'}
 
-            target_template = bpy.context.scene.MatBatchProperties.Template
-            skip_texture = bpy.context.scene.MatBatchProperties.SkipTexture
-        
-            # For each selected object
-            for obj in bpy.context.selected_objects:
-                if obj.type == "MESH":
+            diff = bpy.context.scene.MatBatchProperties.TemplateDiffApply
 
-                    # For each material in selected object
-                    for mat in list_of_mats:
+            # For each unique material in the selected objects
+            try:
+                for work_item in work_items:
 
-                        material = bpy.data.materials[mat]
+                    # UV map and color attribute names are taken from one of the objects using the material
+                    material = work_item.material
+                    if not material.use_nodes:
                         material.use_nodes = True
+                    if template.apply(material, work_item.representative, instanced, diff):
+                        num_processed += 1
+                    else:
+                        num_unchanged += 1
 
-                        if material and material.use_nodes:
-
-                            match target_template:
-
-                                case "ECT":
-
-                                    if bpy.app.version >= (4, 2, 0):
-                                        material.surface_render_method = 'DITHERED'
-                                    else:
-                                        material.blend_method = 'OPAQUE'
-
-                                    # Store the image of the existing image texture node (if any)
-                                    stored_image = None
-                                    for node in material.node_tree.nodes:
-                                        if node.type == 'TEX_IMAGE' and node.image:
-                                            stored_image = node.image
-                                            break
-
-                                    # Clear existing nodes
-                                    material.node_tree.nodes.clear()
-                                    if stored_image != None:
-                                        if skip_texture != "":
-                                            if skip_texture in stored_image.filepath:
-                                                stored_image = None
-
-                                    # Create necessary nodes
-                                    uv_map_node = None
-                                    img_tex_node = None
-                                    mix_color_node = None
-                                    if stored_image != None:
-                                        uv_map_node = material.node_tree.nodes.new(type='ShaderNodeUVMap')
-                                        img_texture_node = material.node_tree.nodes.new(type='ShaderNodeTexImage')
-                                        mix_color_node = material.node_tree.nodes.new(type=mix_node_type)
-                                        if "MixRGB" not in mix_node_type:
-                                            mix_color_node.data_type = 'RGBA'
-                                        mix_color_node.blend_type = 'MULTIPLY'
-                                        mix_color_node.inputs[0].default_value = 1.0  # Set the factor to 1.0
-                                        img_texture_node.image = stored_image
-                                        if len(obj.data.uv_layers) > 0:
-                                            uv_map_node.uv_map = obj.data.uv_layers[0].name
-                                    color_attr_node = material.node_tree.nodes.new(type='ShaderNodeVertexColor')
-                                    emission_node = material.node_tree.nodes.new(type='ShaderNodeEmission')
-                                    material_output_node = material.node_tree.nodes.new(type='ShaderNodeOutputMaterial')
-
-                                    # Arrange nodes for clarity
-                                    if stored_image != None:
-                                        img_texture_node.location = (-500, 0)
-                                        mix_color_node.location = (-200, 100)
-                                        uv_map_node.location = (-700, 0)
-                                    color_attr_node.location = (-400, 150)
-                                    emission_node.location = (0, 100)
-                                    material_output_node.location = (200, 100)
-
-                                    # Add correct Vertex Color name
-                                    if useColorAttributes:
-                                        if len(obj.data.color_attributes) > 0:
-                                            color_attr_node.layer_name = obj.data.color_attributes[0].name
-                                    else:
-                                        if len(obj.data.vertex_colors) > 0:
-                                            color_attr_node.layer_name = obj.data.vertex_colors[0].name
-
-                                    # Link nodes
-                                    links = material.node_tree.links
-                                    if stored_image != None:
-                                        if "MixRGB" not in mix_node_type:
-                                            links.new(img_texture_node.outputs[0], mix_color_node.inputs[7])
-                                            links.new(color_attr_node.outputs[0], mix_color_node.inputs[6])
-                                            links.new(mix_color_node.outputs[2], emission_node.inputs[0])
-                                        else:
-                                            links.new(img_texture_node.outputs[0], mix_color_node.inputs[2])
-                                            links.new(color_attr_node.outputs[0], mix_color_node.inputs[1])
-                                            links.new(mix_color_node.outputs[0], emission_node.inputs[0])
-                                        links.new(emission_node.outputs[0], material_output_node.inputs[0])
-                                        links.new(uv_map_node.outputs[0], img_texture_node.inputs[0])
-                                    else:
-                                        links.new(color_attr_node.outputs[0], emission_node.inputs[0])
-                                        links.new(emission_node.outputs[0], material_output_node.inputs[0])
-
-                                case "EC":
-
-                                    if bpy.app.version >= (4, 2, 0):
-                                        material.surface_render_method = 'DITHERED'
-                                    else:
-                                        material.blend_method = 'OPAQUE'
-
-                                    # Clear existing nodes
-                                    material.node_tree.nodes.clear()
-
-                                    # Create necessary nodes
-                                    color_attr_node = material.node_tree.nodes.new(type='ShaderNodeVertexColor')
-                                    emission_node = material.node_tree.nodes.new(type='ShaderNodeEmission')
-                                    material_output_node = material.node_tree.nodes.new(type='ShaderNodeOutputMaterial')
-
-                                    # Arrange nodes for clarity
-                                    color_attr_node.location = (-200, 100)
-                                    emission_node.location = (0, 100)
-                                    material_output_node.location = (200, 100)
-
-                                    # Add correct Vertex Color name
-                                    if useColorAttributes:
-                                        if len(obj.data.color_attributes) > 0:
-                                            color_attr_node.layer_name = obj.data.color_attributes[0].name
-                                    else:
-                                        if len(obj.data.vertex_colors) > 0:
-                                            color_attr_node.layer_name = obj.data.vertex_colors[0].name
-
-                                    # Link nodes
-                                    links = material.node_tree.links
-                                    links.new(color_attr_node.outputs[0], emission_node.inputs[0])
-                                    links.new(emission_node.outputs[0], material_output_node.inputs[0])
-
-                                case "ACCT":
-
-                                    if bpy.app.version >= (4, 2, 0):
-                                        material.surface_render_method = 'DITHERED'
-                                    else:
-                                        material.blend_method = 'CLIP'
-                                    
-                                    # Store the image of the existing image texture node (if any)
-                                    stored_image = None
-                                    for node in material.node_tree.nodes:
-                                        if node.type == 'TEX_IMAGE' and node.image:
-                                            stored_image = node.image
-                                            break
-
-                                    # Clear existing nodes
-                                    material.node_tree.nodes.clear()
-                                    if stored_image != None:
-                                        if skip_texture != "":
-                                            if skip_texture in stored_image.filepath:
-                                                stored_image = None
-
-                                    # Create necessary nodes
-                                    if stored_image is not None:
-                                        uv_map_node = material.node_tree.nodes.new(type='ShaderNodeUVMap')
-                                        img_texture_node = material.node_tree.nodes.new(type='ShaderNodeTexImage')
-                                        mix_color_node = material.node_tree.nodes.new(type=mix_node_type)
-                                        if "MixRGB" not in mix_node_type:
-                                            mix_color_node.data_type = 'RGBA'
-                                        mix_color_node.blend_type = 'MULTIPLY'
-                                        mix_color_node.inputs[0].default_value = 1.0  # Set the factor to 1.0
-                                        img_texture_node.image = stored_image
-                                        if len(obj.data.uv_layers) > 0:
-                                            uv_map_node.uv_map = obj.data.uv_layers[0].name
-
-                                    color_attr_node = material.node_tree.nodes.new(type='ShaderNodeVertexColor')
-                                    emission_node = material.node_tree.nodes.new(type='ShaderNodeEmission')
-                                    material_output_node = material.node_tree.nodes.new(type='ShaderNodeOutputMaterial')
-                                    mix_shader_node = material.node_tree.nodes.new(type='ShaderNodeMixShader')
-                                    transparent_node = material.node_tree.nodes.new(type='ShaderNodeBsdfTransparent')
-
-                                    material.alpha_threshold = 0.5
-
-                                    # Add correct Vertex Color name
-                                    if useColorAttributes:
-                                        if len(obj.data.color_attributes) > 0:
-                                            color_attr_node.layer_name = obj.data.color_attributes[0].name
-                                    else:
-                                        if len(obj.data.vertex_colors) > 0:
-                                            color_attr_node.layer_name = obj.data.vertex_colors[0].name
-
-                                    # Arrange nodes for clarity
-                                    if stored_image is not None:
-                                        uv_map_node.location = (-700, 0)
-                                        img_texture_node.location = (-500, 0)
-                                        mix_color_node.location = (-200, 100)
-
-                                    color_attr_node.location = (-400, 150)
-                                    emission_node.location = (0, 100)
-                                    mix_shader_node.location = (200, 100)
-                                    transparent_node.location = (0, -100)
-                                    material_output_node.location = (400, 100)
-
-                                    # Link nodes
-                                    links = material.node_tree.links
-                                    if stored_image is not None:
-                                        links.new(uv_map_node.outputs[0], img_texture_node.inputs[0])
-                                        links.new(img_texture_node.outputs[0], mix_color_node.inputs[2])
-
-                                        if "MixRGB" not in mix_node_type:
-                                            links.new(img_texture_node.outputs[0], mix_color_node.inputs[7])
-                                            links.new(color_attr_node.outputs[0], mix_color_node.inputs[6])
-                                            links.new(mix_color_node.outputs[2], emission_node.inputs[0])
-                                        else:
-                                            links.new(img_texture_node.outputs[0], mix_color_node.inputs[2])
-                                            links.new(color_attr_node.outputs[0], mix_color_node.inputs[1])
-                                            links.new(mix_color_node.outputs[0], emission_node.inputs[0])
-                                    else:
-                                        links.new(color_attr_node.outputs[0], emission_node.inputs[0])
-                                        links.new(emission_node.outputs[0], material_output_node.inputs[0])
-
-                                    # Mix Shader links
-                                    links.new(emission_node.outputs[0], mix_shader_node.inputs[2])
-                                    links.new(transparent_node.outputs[0], mix_shader_node.inputs[1])
-                                    links.new(img_texture_node.outputs[1], mix_shader_node.inputs[0])
-                                    links.new(mix_shader_node.outputs[0], material_output_node.inputs[0])
-
-                                    # Blender 4.2 got rid of the alpha clip setting, so we use the Math node instead
-                                    if bpy.app.version >= (4, 2, 0):
-                                        material.surface_render_method = 'DITHERED'
-                                        greaterthan_node = material.node_tree.nodes.new(type='ShaderNodeMath')
-                                        greaterthan_node.operation = 'GREATER_THAN'
-                                        greaterthan_node.location = (-200,-140)
-                                        links.new(img_texture_node.outputs[1], greaterthan_node.inputs[0])
-                                        links.new(greaterthan_node.outputs[0], mix_shader_node.inputs[0])
-                                    else:
-                                        material.blend_method = "CLIP"
-
-
-                                case "ACT":
-
-                                    material.blend_method = "BLEND"
-                                    
-                                    # Store the image of the existing image texture node (if any)
-                                    stored_image = None
-                                    for node in material.node_tree.nodes:
-                                        if node.type == 'TEX_IMAGE' and node.image:
-                                            stored_image = node.image
-                                            break
-
-                                    # Clear existing nodes
-                                    material.node_tree.nodes.clear()
-                                    if stored_image != None:
-                                        if skip_texture != "":
-                                            if skip_texture in stored_image.filepath:
-                                                stored_image = None
-
-                                    # Create necessary nodes
-                                    if stored_image is not None:
-                                        uv_map_node = material.node_tree.nodes.new(type='ShaderNodeUVMap')
-                                        img_texture_node = material.node_tree.nodes.new(type='ShaderNodeTexImage')
-                                        mix_color_node = material.node_tree.nodes.new(type=mix_node_type)
-                                        if "MixRGB" not in mix_node_type:
-                                            mix_color_node.data_type = 'RGBA'
-                                        mix_color_node.blend_type = 'MULTIPLY'
-                                        mix_color_node.inputs[0].default_value = 1.0  # Set the factor to 1.0
-                                        img_texture_node.image = stored_image
-                                        if len(obj.data.uv_layers) > 0:
-                                            uv_map_node.uv_map = obj.data.uv_layers[0].name
-
-                                    color_attr_node = material.node_tree.nodes.new(type='ShaderNodeVertexColor')
-                                    emission_node = material.node_tree.nodes.new(type='ShaderNodeEmission')
-                                    material_output_node = material.node_tree.nodes.new(type='ShaderNodeOutputMaterial')
-                                    add_shader_node = material.node_tree.nodes.new(type='ShaderNodeAddShader')
-                                    transparent_node = material.node_tree.nodes.new(type='ShaderNodeBsdfTransparent')
-
-                                    # Add correct Vertex Color name
-                                    if useColorAttributes:
-                                        if len(obj.data.color_attributes) > 0:
-                                            color_attr_node.layer_name = obj.data.color_attributes[0].name
-                                    else:
-                                        if len(obj.data.vertex_colors) > 0:
-                                            color_attr_node.layer_name = obj.data.vertex_colors[0].name
-
-                                    # Arrange nodes for clarity
-                                    if stored_image is not None:
-                                        uv_map_node.location = (-700, 0)
-                                        img_texture_node.location = (-500, 0)
-                                        mix_color_node.location = (-200, 100)
-
-                                    color_attr_node.location = (-400, 150)
-                                    emission_node.location = (0, 100)
-                                    add_shader_node.location = (200, 100)
-                                    transparent_node.location = (0, -100)
-                                    material_output_node.location = (400, 100)
-
-                                    # Link nodes
-                                    links = material.node_tree.links
-                                    if stored_image is not None:
-                                        links.new(uv_map_node.outputs[0], img_texture_node.inputs[0])
-                                        links.new(img_texture_node.outputs[0], mix_color_node.inputs[2])
-
-                                        if "MixRGB" not in mix_node_type:
-                                            links.new(img_texture_node.outputs[0], mix_color_node.inputs[7])
-                                            links.new(color_attr_node.outputs[0], mix_color_node.inputs[6])
-                                            links.new(mix_color_node.outputs[2], emission_node.inputs[0])
-                                        else:
-                                            links.new(img_texture_node.outputs[0], mix_color_node.inputs[2])
-                                            links.new(color_attr_node.outputs[0], mix_color_node.inputs[1])
-                                            links.new(mix_color_node.outputs[0], emission_node.inputs[0])
-                                    else:
-                                        links.new(color_attr_node.outputs[0], emission_node.inputs[0])
-                                        links.new(emission_node.outputs[0], material_output_node.inputs[0])
-
-                                    # Additive links
-                                    links.new(emission_node.outputs[0], add_shader_node.inputs[0])
-                                    links.new(transparent_node.outputs[0], add_shader_node.inputs[1])
-                                    links.new(add_shader_node.outputs[0], material_output_node.inputs[0])
-
-                                case "AC":
-
-                                    material.blend_method = "BLEND"
-
-                                    # Clear existing nodes
-                                    material.node_tree.nodes.clear()
-
-                                    # Create necessary nodes
-                                    color_attr_node = material.node_tree.nodes.new(type='ShaderNodeVertexColor')
-                                    emission_node = material.node_tree.nodes.new(type='ShaderNodeEmission')
-                                    material_output_node = material.node_tree.nodes.new(type='ShaderNodeOutputMaterial')
-                                    add_shader_node = material.node_tree.nodes.new(type='ShaderNodeAddShader')
-                                    transparent_node = material.node_tree.nodes.new(type='ShaderNodeBsdfTransparent')
-
-                                    # Add correct Vertex Color name
-                                    if useColorAttributes:
-                                        if len(obj.data.color_attributes) > 0:
-                                            color_attr_node.layer_name = obj.data.color_attributes[0].name
-                                    else:
-                                        if len(obj.data.vertex_colors) > 0:
-                                            color_attr_node.layer_name = obj.data.vertex_colors[0].name
-
-                                    # Arrange nodes for clarity
-                                    color_attr_node.location = (-200, 100)
-                                    emission_node.location = (0, 100)
-                                    add_shader_node.location = (200, 100)
-                                    transparent_node.location = (0, -100)
-                                    material_output_node.location = (400, 100)
-
-                                    # Link nodes
-                                    links = material.node_tree.links
-                                    links.new(color_attr_node.outputs[0], emission_node.inputs[0])
-                                    links.new(emission_node.outputs[0], material_output_node.inputs[0])
-
-                                    # Additive links
-                                    links.new(emission_node.outputs[0], add_shader_node.inputs[0])
-                                    links.new(transparent_node.outputs[0], add_shader_node.inputs[1])
-                                    links.new(add_shader_node.outputs[0], material_output_node.inputs[0])
-
-                                case "PT":
-
-                                    if bpy.app.version >= (4, 2, 0):
-                                        material.surface_render_method = 'DITHERED'
-                                    else:
-                                        material.blend_method = 'OPAQUE'
-                                    uses_transparency = False
-                                    has_alpha_channel = True
-
-                                    # Store the image of the existing image texture node (if any)
-                                    stored_image = None
-                                    for node in material.node_tree.nodes:
-                                        if node.type == 'TEX_IMAGE' and node.image:
-                                            stored_image = node.image
-
-                                            # Check if the found texture (if any) was being used for transparency previously
-                                            for output in node.outputs:
-                                                if output.links:
-                                                    for link in output.links:
-                                                        if (link.to_node.type == "BSDF_PRINCIPLED" and link.to_socket.identifier == "Alpha") or (link.to_node.type == "MIX_SHADER" and link.to_socket.identifier == "Fac") or (link.to_node.type == "MATH" and link.to_node.operation == "GREATER_THAN"):
-                                                            uses_transparency = True
-                                                            has_alpha_channel = True if output.identifier == "Alpha" else False
-                                                            break
-                                            break
-
-                                    nodes = material.node_tree.nodes
-                                    links = material.node_tree.links
-
-                                    nodes.clear()
-
-                                    # Create nodes: UV Map, Image Texture, Principled BSDF, Material Output
-                                    if stored_image != None:
-                                        uv_map_node = nodes.new(type='ShaderNodeUVMap')
-                                        img_tex_node = nodes.new(type='ShaderNodeTexImage')
-                                        if len(obj.data.uv_layers) > 0:
-                                            uv_map_node.uv_map = obj.data.uv_layers[0].name
-                                        img_tex_node.image = stored_image
-                                    principled_node = nodes.new(type='ShaderNodeBsdfPrincipled')
-                                    material_output_node = nodes.new(type='ShaderNodeOutputMaterial')
-
-                                    # Set positions for the nodes
-                                    if stored_image != None:
-                                        uv_map_node.location = (-700, 0)
-                                        img_tex_node.location = (-500, 0)
-                                    principled_node.location = (-200, 0)
-                                    material_output_node.location = (100, 0)
-
-                                    # Create links between nodes
-                                    if stored_image != None:
-                                        links.new(uv_map_node.outputs[0], img_tex_node.inputs[0])
-                                        links.new(img_tex_node.outputs[0], principled_node.inputs[0])
-                                    links.new(principled_node.outputs[0], material_output_node.inputs[0])
-
-                                    if uses_transparency:
-                                        # Blender 4.0 moved the # of the Principled BSDF's Alpha input
-                                        links.new(img_tex_node.outputs[1 if has_alpha_channel else 0],principled_node.inputs[principled_alpha_slot])
-
-                                        if bpy.app.version >= (4, 2, 0):
-                                            material.surface_render_method = 'DITHERED'
-                                            greaterthan_node = material.node_tree.nodes.new(type='ShaderNodeMath')
-                                            greaterthan_node.operation = "GREATER_THAN"
-                                            greaterthan_node.location = (-377, -83)
-                                            img_tex_node.location = (-655, 0)
-                                            uv_map_node.location = (-854, 0)
-                                            links.new(img_tex_node.outputs[1], greaterthan_node.inputs[0])
-                                            links.new(greaterthan_node.outputs[0], principled_node.inputs[4])
-                                        else:
-                                            material.blend_method = "CLIP"
-                                            material.alpha_threshold = 0.5
-
-                                case "PC":
-                                    if bpy.app.version >= (4, 2, 0):
-                                        material.surface_render_method = 'DITHERED'
-                                    else:
-                                        material.blend_method = 'OPAQUE'
-
-                                    # Store the image of the existing image texture node (if any)
-
-                                    nodes = material.node_tree.nodes
-                                    links = material.node_tree.links
-
-                                    nodes.clear()
-
-                                    # Create nodes: Color Attribute, Principled BSDF, Material Output
-                                    color_attr_node = nodes.new(type='ShaderNodeVertexColor')
-                                    principled_node = nodes.new(type='ShaderNodeBsdfPrincipled')
-                                    material_output_node = nodes.new(type='ShaderNodeOutputMaterial')
+            # Anything that still goes wrong while applying (like a library that became unreadable) stops the run, and is reported
+            # together with how far it got
+            except ValueError as error:
+                if num_processed > 0:
+                    update_owner_meshes(work_items)
+                display_msg_box(
+                    f'{error}. The template was applied to {num_processed} material(s) before stopping.', "Error", "ERROR")
+                return {'FINISHED'}
 
-                                    # Add correct Vertex Color name
-                                    if useColorAttributes:
-                                        if len(obj.data.color_attributes) > 0:
-                                            color_attr_node.layer_name = obj.data.color_attributes[0].name
-                                    else:
-                                        if len(obj.data.vertex_colors) > 0:
-                                            color_attr_node.layer_name = obj.data.vertex_colors[0].name
+            if num_processed > 0:
+                update_owner_meshes(work_items)
 
-                                    # Set positions for the nodes
-                                    color_attr_node.location = (-400, 0)
-                                    principled_node.location = (-200, 0)
-                                    material_output_node.location = (100, 0)
+        display_msg_box(
+            f'Applied template to {num_processed} material(s). {num_unchanged} material(s) already matched the template and were left untouched.', 'Info', 'INFO')
 
-                                    # Create links between nodes
-                                    links.new(color_attr_node.outputs[0], principled_node.inputs[0])
-                                    links.new(principled_node.outputs[0], material_output_node.inputs[0])
+        return {'FINISHED'}
 
-                                case "HDRT":
+# Reload Material Templates operator
 
-                                    if bpy.app.version >= (4, 2, 0):
-                                        material.surface_render_method = 'BLENDED'
-                                    else:
-                                        material.blend_method = 'OPAQUE'
-                                    
-                                    # Store the image of the existing image texture node (if any)
-                                    stored_image = None
-                                    stored_hdr_image = None
-
-                                    for node in material.node_tree.nodes:
-                                        if node.type == 'TEX_IMAGE' and node.image:
-                                            # An extra check to make sure we're not using the HDR texture as the albedo
-                                            if not ('OPEN_EXR' in node.image.file_format or 'HDR' in node.image.file_format or 'lightmap' in node.image.name_full):
-                                                if is_node_connected(material, node):
-                                                    stored_image = node.image
-                                                    break
-
-                                    for node in material.node_tree.nodes:
-                                        if node.type == 'TEX_IMAGE' and node.image:
-                                            # Find the HDR texture in the material and store it, if one was already present 
-                                            if 'OPEN_EXR' in node.image.file_format or 'HDR' in node.image.file_format or 'lightmap' in node.image.name_full:
-                                                stored_hdr_image = node.image
-                                                break
-
-                                    # Clear existing nodes and check if the designated "skipped texture" was stored
-                                    material.node_tree.nodes.clear()
-                                    if stored_image != None:
-                                        if skip_texture != "":
-                                            if skip_texture in stored_image.filepath:
-                                                stored_image = None
-
-                                    # Create necessary nodes
-                                    uv_map_node = None
-                                    uv_hdr_map_node = None
-                                    img_tex_node = None
-                                    mix_color_node = None
-                                    hdr_tex_node = material.node_tree.nodes.new(type='ShaderNodeTexImage')
-                                    uv_hdr_map_node = material.node_tree.nodes.new(type='ShaderNodeUVMap')
-                                    if stored_image != None:
-                                        uv_map_node = material.node_tree.nodes.new(type='ShaderNodeUVMap')
-                                        img_tex_node = material.node_tree.nodes.new(type='ShaderNodeTexImage')
-                                        mix_color_node = material.node_tree.nodes.new(type=mix_node_type)
-                                        if "MixRGB" not in mix_node_type:
-                                            mix_color_node.data_type = 'RGBA'
-                                        mix_color_node.blend_type = 'MULTIPLY'
-                                        if "MIX_RGB" in mix_color_node.type:
-                                            mix_color_node.use_clamp = False
-                                        else:
-                                            mix_color_node.clamp_factor = False
-                                            mix_color_node.clamp_result = False
-                                        mix_color_node.inputs[0].default_value = 1.0  # Set the factor to 1.0
-                                        img_tex_node.image = stored_image
-                                        if len(obj.data.uv_layers) > 0:
-                                            uv_map_node.uv_map = obj.data.uv_layers[0].name
-                                    emission_node = material.node_tree.nodes.new(type='ShaderNodeEmission')
-                                    material_output_node = material.node_tree.nodes.new(type='ShaderNodeOutputMaterial')
-
-                                    # Arrange nodes for clarity
-                                    if stored_image != None:
-                                        img_tex_node.location = (-500, 0)
-                                        mix_color_node.location = (-200, 100)
-                                        uv_map_node.location = (-700, 0)
-                                    hdr_tex_node.location = (-500, 350)
-                                    uv_hdr_map_node.location = (hdr_tex_node.location.x - 200, hdr_tex_node.location.y)
-                                    emission_node.location = (0, 100)
-                                    material_output_node.location = (200, 100)
-
-                                    # Look for an HDR texture already stored in this Blender file, if one wasn't found earlier
-                                    if stored_hdr_image != None:
-                                        hdr_tex_node.image = stored_hdr_image
-                                    else:
-                                        for searched_img in bpy.data.images:
-                                            if 'OPEN_EXR' in searched_img.file_format or 'HDR' in searched_img.file_format or 'lightmap' in searched_img.name_full:
-                                                hdr_tex_node.image = searched_img
-                                    hdr_tex_node.label = "HDR Lightmap"
-                                    uv_hdr_map_node.uv_map = "lightmap"
-
-                                    # Link nodes
-                                    links = material.node_tree.links
-
-                                    print(f"\nStored image is: {stored_image}")
-                                    if stored_image != None:
-                                        if "MixRGB" not in mix_node_type:
-                                            links.new(img_tex_node.outputs[0], mix_color_node.inputs[7])
-                                            links.new(hdr_tex_node.outputs[0], mix_color_node.inputs[6])
-                                            links.new(mix_color_node.outputs[2], emission_node.inputs[0])
-                                        else:
-                                            links.new(img_tex_node.outputs[0], mix_color_node.inputs[2])
-                                            links.new(hdr_tex_node.outputs[0], mix_color_node.inputs[1])
-                                            links.new(mix_color_node.outputs[0], emission_node.inputs[0])
-                                        links.new(emission_node.outputs[0], material_output_node.inputs[0])
-                                        links.new(uv_map_node.outputs[0], img_tex_node.inputs[0])
-                                    else:
-                                        links.new(hdr_tex_node.outputs[0], emission_node.inputs[0])
-                                        links.new(emission_node.outputs[0], material_output_node.inputs[0])
-                                    links.new(uv_hdr_map_node.outputs[0], hdr_tex_node.inputs[0])
-
-                                case "PP":
-                                    node_tree = material.node_tree
-
-                                    uv_map_nodes = [node for node in node_tree.nodes if node.type == 'UVMAP']
-
-                                    for uv_map_node in uv_map_nodes:
-                                        connections = [link.to_socket for link in uv_map_node.outputs[0].links]
-
-                                        # Create a Separate XYZ node
-                                        separate_xyz_node = node_tree.nodes.new(type='ShaderNodeSeparateXYZ')
-                                        separate_xyz_node.label = "Ping Pong Separate"
-                                        separate_xyz_node.location = uv_map_node.location.x, uv_map_node.location.y + 200
-                                        node_tree.links.new(uv_map_node.outputs[0], separate_xyz_node.inputs[0])
-
-                                        # Create the first Math node
-                                        math_node_1 = node_tree.nodes.new(type='ShaderNodeMath')
-                                        math_node_1.operation = 'PINGPONG'
-                                        math_node_1.label = "Ping Pong X"
-                                        math_node_1.inputs[1].default_value = 1.0
-                                        math_node_1.location = separate_xyz_node.location.x + 200, separate_xyz_node.location.y
-                                        node_tree.links.new(separate_xyz_node.outputs[0], math_node_1.inputs[0])
-
-                                        # Create the second Math node
-                                        math_node_2 = node_tree.nodes.new(type='ShaderNodeMath')
-                                        math_node_2.operation = 'PINGPONG'
-                                        math_node_2.label = "Ping Pong Y"
-                                        math_node_2.inputs[1].default_value = 1.0
-                                        math_node_2.location = separate_xyz_node.location.x + 200, separate_xyz_node.location.y - 100
-                                        node_tree.links.new(separate_xyz_node.outputs[1], math_node_2.inputs[0])
-
-                                        # Create the Combine XYZ node
-                                        combine_xyz_node = node_tree.nodes.new(type='ShaderNodeCombineXYZ')
-                                        combine_xyz_node.location = math_node_1.location.x + 200, (math_node_1.location.y + math_node_2.location.y) / 2
-                                        combine_xyz_node.label = "Ping Pong Combine"
-                                        combine_xyz_node.inputs[2].default_value = 0.0
-                                        node_tree.links.new(math_node_1.outputs['Value'], combine_xyz_node.inputs[0])
-                                        node_tree.links.new(math_node_2.outputs['Value'], combine_xyz_node.inputs[1])
-
-                                        # Reconnect the original connections to the Combine XYZ node
-                                        for socket in connections:
-                                            node_tree.links.new(combine_xyz_node.outputs['Vector'], socket)
-
-                                case "NO_PP":
-                                    node_tree = material.node_tree
-
-                                    pp_separate_nodes = [node for node in node_tree.nodes if node.label == 'Ping Pong Separate']
-
-                                    for pp_separate_node in pp_separate_nodes:
-                                        in_node = pp_separate_node.inputs[0].links[0].from_node
-                                        pp_x_node = pp_separate_node.outputs[0].links[0].to_node
-                                        pp_y_node = pp_separate_node.outputs[1].links[0].to_node
-                                        pp_combine_node = pp_x_node.outputs[0].links[0].to_node
-                                        out_nodes = [link.to_node for link in pp_combine_node.outputs[0].links]
-
-                                        # Reconnect the original connections to the Combine XYZ node
-                                        for out_node in out_nodes:
-                                            node_tree.links.new(in_node.outputs[0], out_node.inputs[0])
-
-                                        # Remove Ping Pong nodes
-                                        node_tree.nodes.remove(pp_x_node)
-                                        node_tree.nodes.remove(pp_y_node)
-                                        node_tree.nodes.remove(pp_combine_node)
-                                        node_tree.nodes.remove(pp_separate_node)
+class ReloadMaterialTemplates(bpy.types.Operator):
+    """Reloads the user material templates (.json files) from the "matbatchtools/templates" folder in Blender's user config folder"""
+    bl_idname = "material.reload_mat_templates"
+    bl_label = "Reload Templates"
+    bl_options = {'REGISTER'}
 
-                            num_processed += 1
-                    obj.data.update()
+    def execute(self, context):
+        errors = load_user_templates()
 
-        display_msg_box(
-            f'Applied template to {num_processed} material(s).', 'Info', 'INFO')
+        if len(errors) > 0:
+            display_msg_box(
+                f'Loaded {len(user_templates)} user template(s). Failed to load: ' + "; ".join(errors), 'Error', 'ERROR')
+        else:
+            display_msg_box(
+                f'Loaded {len(user_templates)} user template(s) from {template_folder()}', 'Info', 'INFO')
 
         return {'FINISHED'}
 
@@ -1784,28 +3201,8 @@ class FindActiveFaceTexture(bpy.types.Operator):
             obj = bpy.context.active_object
             if obj.type == "MESH":
 
-                # Get active material
-                mat = obj.active_material
-
-                node_tree = mat.node_tree
-
-                # Find the diffuse image texture node
-                diffuse = None
-
-                for node in node_tree.nodes:
-                    if node.type == "TEX_IMAGE":
-                        if len(node.outputs[0].links) > 0:
-
-                            for link in node.outputs[0].links:
-
-                                # Check if Image Texture is connected to a "color" socket," or a Mix node's A and B sockets
-                                if "Color" in link.to_socket.name or "A" in link.to_socket.name or "B" in link.to_socket.name:
-                                    diffuse = node
-                                    break
-
-                    # Check if diffuse was found already, and if so, break out of the loop
-                    if diffuse != None:
-                        break
+                # Find the diffuse image texture node in the active material
+                diffuse = find_diffuse_texture_node(obj.active_material)
 
                 # If diffuse was found:
                 if diffuse != None:
@@ -1844,31 +3241,8 @@ class CopyActiveFaceTexture(bpy.types.Operator):
             obj = bpy.context.active_object
             if obj.type == "MESH":
 
-                # Get active material
-                mat = obj.active_material
-
-                node_tree = mat.node_tree
-
-                # Find the diffuse image texture node
-                diffuse = None
-
-                for node in node_tree.nodes:
-                    if node.type == "TEX_IMAGE":
-                        if len(node.outputs[0].links) > 0:
-
-                            for link in node.outputs[0].links:
-
-                                # Check if Image Texture is connected to a "color" socket," or a Mix node's A and B sockets
-                                if "Color" in link.to_socket.name or "A" in link.to_socket.name or "B" in link.to_socket.name:
-                                    
-                                    # Check if there's an actual image texture loaded in the node
-                                    if node.image:
-                                        diffuse = node
-                                        break
-
-                    # Check if diffuse was found already, and if so, break out of the loop
-                    if diffuse != None:
-                        break
+                # Find the diffuse image texture node in the active material, with an actual image loaded in it
+                diffuse = find_diffuse_texture_node(obj.active_material, require_image=True)
 
                 # If diffuse was found:
                 if diffuse != None:
@@ -1898,33 +3272,13 @@ class PasteActiveFaceTexture(bpy.types.Operator):
             obj = bpy.context.active_object
             if obj.type == "MESH":
 
-                # Get active material
-                mat = obj.active_material
-
-                node_tree = mat.node_tree
-
                 # Check if a texture was already copied
                 copied_tex = bpy.context.scene.MatBatchProperties.CopiedTexture
 
                 if copied_tex != "" and bpy.data.images[copied_tex]:
 
-                    # Find the diffuse image texture node
-                    diffuse = None
-
-                    for node in node_tree.nodes:
-                        if node.type == "TEX_IMAGE":
-                            if len(node.outputs[0].links) > 0:
-
-                                for link in node.outputs[0].links:
-
-                                    # Check if Image Texture is connected to a "color" socket," or a Mix node's A and B sockets
-                                    if "Color" in link.to_socket.name or "A" in link.to_socket.name or "B" in link.to_socket.name:
-                                        diffuse = node
-                                        break
-
-                        # Check if diffuse was found already, and if so, break out of the loop
-                        if diffuse != None:
-                            break
+                    # Find the diffuse image texture node in the active material
+                    diffuse = find_diffuse_texture_node(obj.active_material)
 
                     # If diffuse was found:
                     if diffuse != None:
@@ -1949,87 +3303,125 @@ class CopyTexToMatName(bpy.types.Operator):
 
         num_processed = 0
 
-        list_of_mats = check_for_selected()
-        mats_to_rename = dict()
+        work_items = plan_material_work()
+        mats_to_rename = []
+        clear_connected_nodes_cache()
+        clear_material_analysis_cache()
+
+        # Node tree signatures, computed at most once per material (and node group) in this run
+        signatures = dict()
+        tree_signatures = dict()
 
         # Check if any objects are selected.
-        if list_of_mats != False:
+        if work_items != False:
 
-            # For each selected object
-            for obj in bpy.context.selected_objects:
-                if obj.type == "MESH":
+            # For each unique material in the selected objects
+            for work_item in work_items:
+                material = work_item.material
 
-                    # For each material
-                    for mat in list_of_mats:
-                        diffuse_textures_found = set()
+                # Find the diffuse image texture nodes. Unchanged materials reuse the names found in an earlier run
+                diffuse_textures_found = get_material_analysis(material, "diffuse_textures")
 
-                        if mat in bpy.data.materials.keys():
-                            node_tree = bpy.data.materials[mat].node_tree
+                if len(diffuse_textures_found) != 0:
+                    mats_to_rename.append((work_item, diffuse_textures_found))
 
-                            # Find the diffuse image texture node
-                            if node_tree != None:
-                                for node in node_tree.nodes:
+            if len(mats_to_rename) != 0:
 
-                                    if node.type == "TEX_IMAGE" and is_node_connected(bpy.data.materials[mat], node):
+                # If diffuse was found:
+                for work_item, diffuse_textures_found in mats_to_rename:
+                    material = work_item.material
+                    finalized_name = ""
+
+                    # Change the current material's name
+                    for texture in diffuse_textures_found:
+                        if finalized_name != "":
+                            finalized_name = finalized_name + " "
+                        finalized_name = finalized_name + texture
+
+                    # Check if a material with that name already exists
+                    existing_material = bpy.data.materials.get(finalized_name)
+                    if existing_material != None and existing_material != material:
+
+                        # Compare the node tree signatures - make sure the node setups are identical, to avoid mismatching any unique but very similar materials
+                        for compared_material in (material, existing_material):
+                            if compared_material.as_pointer() not in signatures:
+                                signatures[compared_material.as_pointer()] = node_tree_signature(compared_material.node_tree, tree_signatures)
+                        signature = signatures[material.as_pointer()]
+                        if signature != signatures[existing_material.as_pointer()]:
+                            finalized_name += " " + signature[:8]
+                            existing_material = bpy.data.materials.get(finalized_name)
+
+                    if existing_material == None:
+                        material.name = finalized_name
+                        num_processed += 1
 
-                                        # Check if a file is actually loaded in this image texture node
-                                        if node.image:
+                    # Reassign the existing material in every slot that used this one, on every object using it
+                    elif existing_material != material:
+                        for obj in work_item.owners:
+                            for slot in obj.material_slots:
+                                if slot.material == material:
+                                    slot.material = existing_material
+                        num_processed += 1
 
-                                            if len(node.outputs[0].links) > 0:
+                display_msg_box(
+                    f'Renamed {num_processed} material(s).', 'Info', 'INFO')
+            else:
+                display_msg_box(
+                    'No diffuse textures found.', 'Error', 'ERROR')
 
-                                                for link in node.outputs[0].links:
+        return {'FINISHED'}
 
-                                                    # Check if Image Texture is connected to a "color" socket," or a Mix node's A and B sockets
-                                                    if "Color" in link.to_socket.name or "A" in link.to_socket.name or "B" in link.to_socket.name or link.to_socket.type == 'RGBA':
-                                                        # Get the texture name, but without the file extension
-                                                        diffuse_name = node.image.name.split(".", 1)[0]
-                                                        diffuse_textures_found.add(diffuse_name)
-                                                        continue
-                                        else:
-                                            continue
 
-                        if len(diffuse_textures_found) != None:
-                            mats_to_rename[mat] = diffuse_textures_found
+# Merge Identical Materials operator
 
-                if len(mats_to_rename.keys()) != 0:
+class MergeIdenticalMaterials(bpy.types.Operator):
+    """Finds materials with identical node setups and settings, in all selected objects, and replaces all of them with a single copy. Copies that are no longer used by anything are deleted"""
+    bl_idname = "material.merge_identical_materials"
+    bl_label = "Merge Identical Materials"
+    bl_options = {'REGISTER'}
 
-                    # If diffuse was found:
-                    for mat in mats_to_rename.keys():
-                        finalized_name = ""
-
-                        # Change the current material's name
-                        for texture in mats_to_rename[mat]:
-                            if finalized_name != "":
-                                finalized_name = finalized_name + " "
-                            finalized_name = finalized_name + texture
-
-                        # Check if a material with that name already exists
-                        if finalized_name in bpy.data.materials.keys():
-                            if mat in obj.material_slots.keys():
-
-                                # Compare the node count for the materials - make sure they have the same amount of nodes, to avoid mismatching any unique but very similar materials
-                                if len(bpy.data.materials[mat].node_tree.nodes) != len(bpy.data.materials[finalized_name].node_tree.nodes):
-                                    finalized_name += " " + str(len(bpy.data.materials[mat].node_tree.nodes))
-
-                        if finalized_name in bpy.data.materials.keys():
-                            if mat in obj.material_slots.keys():
-                                old_index = obj.material_slots[mat].slot_index
-                                if obj.material_slots[old_index].material.name != finalized_name:
-                                    obj.material_slots[old_index].material = bpy.data.materials[finalized_name]
-                                    num_processed += 1
+    def execute(self, context):
 
-                        else:
-                            if mat in bpy.data.materials.keys():
-                                bpy.data.materials[mat].name = finalized_name
-                                if mat in list_of_mats:
-                                    list_of_mats.remove(mat)
-                                num_processed += 1
+        work_items = plan_material_work()
 
-                    display_msg_box(
-                        f'Renamed {num_processed} material(s).', 'Info', 'INFO')
-                else:
-                    display_msg_box(
-                        'No diffuse textures found.', 'Error', 'ERROR')
+        # Check if any objects are selected.
+        if work_items != False:
+
+            # Group the materials by signature. Node groups shared between materials are only hashed once
+            tree_signatures = dict()
+            buckets = dict()
+            for work_item in work_items:
+                buckets.setdefault(material_signature(work_item.material, tree_signatures), []).append(work_item)
+
+            num_merged = 0
+            num_removed = 0
+            for bucket in buckets.values():
+                if len(bucket) < 2:
+                    continue
+
+                # Keep the material without a ".001" style suffix if there is one, so the original name survives
+                canonical = min(bucket, key=lambda work_item: (is_numbered_duplicate_name(work_item.material.name), work_item.material.name)).material
+
+                for work_item in bucket:
+                    duplicate = work_item.material
+                    if duplicate == canonical:
+                        continue
+
+                    for obj in work_item.owners:
+                        for slot in obj.material_slots:
+                            if slot.material == duplicate:
+                                slot.material = canonical
+                    num_merged += 1
+
+                    # Only delete the duplicate if nothing else (like an unselected object) still uses it
+                    if duplicate.users == 0:
+                        bpy.data.materials.remove(duplicate)
+                        num_removed += 1
+
+            update_owner_meshes(work_items)
+
+            display_msg_box(
+                f'Merged {num_merged} duplicate material(s) and deleted {num_removed} unused one(s). Unique materials: {len(work_items)} before, {len(buckets)} after.', 'Info', 'INFO')
 
         return {'FINISHED'}
 
@@ -2044,144 +3436,101 @@ class IsolateByMatTrait(bpy.types.Operator):
 
     def execute(self, context):
 
-        list_of_mats = check_for_selected()
+        work_items = plan_material_work()
+        clear_connected_nodes_cache()
+        clear_material_analysis_cache()
         isolate_to_collection = bpy.context.scene.MatBatchProperties.IsolateCollection
-        principled_alpha_slot = 21 if bpy.app.version < (4, 0, 0) else 4
-        principled_emissive_color_slot = 19 if bpy.app.version < (4, 0, 0) else 27
-        principled_emissive_strength_slot = 20 if bpy.app.version < (4, 0, 0) else 28
-        trait = bpy.context.scene.MatBatchProperties.IsolateTrait
-        matching_materials = set()
-        separated_objs = set()
+        trait_setting = bpy.context.scene.MatBatchProperties.IsolateTrait
+        wanted_traits = MATERIAL_TRAIT_PRIORITY if trait_setting == "all" else (trait_setting,)
 
-        root_collection = None
+        # Material name -> the trait its faces are isolated with
+        material_traits = dict()
+        separated_objs = {trait: set() for trait in wanted_traits}
 
         # Check if any objects are selected.
-        if list_of_mats != False:
+        if work_items != False:
 
-            for obj in bpy.context.selected_objects:
-                if obj.type == "MESH":
-
-                    for mat in list_of_mats:
-
-                        material = bpy.data.materials[mat]
-                        material.use_nodes = True
-                        is_transparent = False
-                        is_emissive = False
-                        is_animated = False
-
-                        if material and material.use_nodes:
-                            for node in material.node_tree.nodes:
-                                if is_node_connected(material, node):
-
-                                    if trait == "transparent":
-                                        
-                                        # Transparency scenario 1 - Principled BSDF with alpha input
-                                        if node.type == "BSDF_PRINCIPLED":
-                                            if len(node.inputs[principled_alpha_slot].links) > 0 or node.inputs[principled_alpha_slot].default_value != 1:
-                                                is_transparent = True
-                                                break
-
-                                        # Transparency scenario 2 - Transparent BSDF
-                                        elif node.type == "BSDF_TRANSPARENT":
-                                            is_transparent = True
-                                            break
-                                        
-                                    if trait == "emissive":
-
-                                        # Emissive scenario 1 - Principled BSDF with emissive input
-                                        if node.type == "BSDF_PRINCIPLED":
-                                            em_color_slot = node.inputs[principled_emissive_color_slot]
-                                            em_strength_slot = node.inputs[principled_emissive_strength_slot]
-                                            if em_strength_slot.default_value != 0.0 or len(em_strength_slot.links) > 0:
-                                                if len(em_color_slot.links) > 0:
-                                                    is_emissive = True
-                                                    break
-                                                elif list(em_color_slot.default_value) != [0.0,0.0,0.0,1.0] and list(em_color_slot.default_value) != [0.0,0.0,0.0,0.0]:
-                                                    is_emissive = True
-                                                    break
-
-                                        # Emissive scenario 2 - Emission shader
-                                        elif node.type == "EMISSION":
-                                            is_emissive = True
-                                            break
-                
-                                        
-                                    if trait == "animated":
-
-                                        # Animated scenario 1 - Animation data exists and isn't "none"
-                                        if material.node_tree.animation_data != None:
-                                            is_animated = True
-                                            break
-
-                                        # Animated scenario 2 - Image Sequence node
-                                        elif node.type == "TEX_IMAGE":
-                                            if node.image.source == 'SEQUENCE':
-                                                is_animated = True
-                                                break
-                                            
-                        if is_transparent and trait == "transparent":
-                            matching_materials.add(material.name)
-                        if is_emissive and trait == "emissive":
-                            matching_materials.add(material.name)
-                        if is_animated and trait == "animated":
-                            matching_materials.add(material.name)
+            # Each unique material is classified once, for every trait at the same time, no matter how many selected objects use it
+            for work_item in work_items:
+                material = work_item.material
+                material.use_nodes = True
+                trait = isolated_trait(get_material_analysis(material, "traits"), wanted_traits)
+                if trait != None:
+                    material_traits[material.name] = trait
 
         materials_matched_count = 0
-        if len(matching_materials) > 0:
+        if len(material_traits) > 0:
 
-            # Search all selected mesh objects for faces that have this material assigned.
-            mesh_objects = [obj for obj in bpy.context.selected_objects if obj.type == "MESH" and not (obj.name.endswith("_" + trait))]
+            # Search all selected mesh objects for faces that have these materials assigned.
+            mesh_objects = [obj for obj in bpy.context.selected_objects if obj.type == "MESH" and not any(obj.name.endswith("_" + trait) for trait in wanted_traits)]
             if len(mesh_objects) == 0:
                 display_msg_box(
                     f'Selected trait has already been fully isolated in the selected object(s).', 'Info', 'INFO')
                 return {'FINISHED'}
-            
-            bpy.ops.object.select_all(action='DESELECT')
+
+            # Objects that share a mesh only need it separated once
+            source_objects = []
+            seen_meshes = set()
             for obj in mesh_objects:
-                obj.hide_set(False)
-                obj.select_set(True)
-                bpy.context.view_layer.objects.active = obj
-
-                matching_faces = set()
-                for material in matching_materials:
-                    material_matched = False
-                    for face_index in find_faces_with_material(obj, material):
-                        matching_faces.add(face_index)
-                        material_matched = True
-                    if material_matched:
-                        materials_matched_count += 1
-
-                if len(matching_faces) > 0:
-                    if len(obj.data.polygons) == len(matching_faces):
-                        continue
-                    separated_obj = separate_faces(obj, matching_faces)
+                if obj.data.as_pointer() not in seen_meshes:
+                    seen_meshes.add(obj.data.as_pointer())
+                    source_objects.append(obj)
+
+            # One read of each mesh's face material indices is enough to count the materials that were found
+            for obj in source_objects:
+                face_counts = FaceMaterialIndex(obj.data).face_counts()
+                materials_matched_count += sum(1 for material in material_traits if face_counts.get(material, 0) > 0)
+
+            # Each trait takes one separation round, shared by all objects. Face indices change after every round, so each round
+            # reads the remaining faces again
+            for trait in wanted_traits:
+                trait_materials = {material for material, material_trait in material_traits.items() if material_trait == trait}
+                if len(trait_materials) == 0:
+                    continue
+
+                face_masks = dict()
+                for obj in source_objects:
+                    face_mask = FaceMaterialIndex(obj.data).mask(trait_materials)
+                    matching_count = np.count_nonzero(face_mask)
+                    if matching_count > 0 and matching_count < len(face_mask):
+                        face_masks[obj] = face_mask
+
+                for obj, separated_obj in separate_faces(face_masks).items():
                     separated_obj.name = obj.name + "_" + trait
+                    separated_objs[trait].add(separated_obj)
 
-                    separated_objs.add(separated_obj)
-            
             if isolate_to_collection:
-                if trait.capitalize() in bpy.data.collections.keys():
-                    root_collection = bpy.data.collections[trait.capitalize()]
-                else:
-                    root_collection = bpy.data.collections.new(trait.capitalize())
-                    bpy.context.scene.collection.children.link(root_collection)
-
-                for obj in separated_objs:
-                    # Unlink the new collision model from other collections
-                    obj_collections = [
-                        c for c in bpy.data.collections if obj.name in c.objects.keys()]
-                    for c in obj_collections:
-                        if obj.name in c.objects.keys():
-                            c.objects.unlink(obj)
-                    if obj.name in bpy.context.scene.collection.objects.keys():
-                        bpy.context.scene.collection.objects.unlink(obj)
-
-                    root_collection.objects.link(obj)
-                    bpy.context.view_layer.objects.active = obj
+                for trait, objs in separated_objs.items():
+                    if len(objs) == 0:
+                        continue
+
+                    if trait.capitalize() in bpy.data.collections.keys():
+                        root_collection = bpy.data.collections[trait.capitalize()]
+                    else:
+                        root_collection = bpy.data.collections.new(trait.capitalize())
+                        bpy.context.scene.collection.children.link(root_collection)
+
+                    for obj in objs:
+                        # Unlink the new collision model from other collections
+                        obj_collections = [
+                            c for c in bpy.data.collections if obj.name in c.objects.keys()]
+                        for c in obj_collections:
+                            if obj.name in c.objects.keys():
+                                c.objects.unlink(obj)
+                        if obj.name in bpy.context.scene.collection.objects.keys():
+                            bpy.context.scene.collection.objects.unlink(obj)
+
+                        root_collection.objects.link(obj)
+
+            # Leave every separated object selected, not only the last round's
+            for objs in separated_objs.values():
+                for obj in objs:
                     obj.select_set(True)
+                    bpy.context.view_layer.objects.active = obj
 
+        trait_name = "" if trait_setting == "all" else trait_setting + " "
         display_msg_box(
-            f'Isolated {materials_matched_count} {trait} material(s) into {len(separated_objs)} separate object(s).', 'Info', 'INFO')
+            f'Isolated {materials_matched_count} {trait_name}material(s) into {sum(len(objs) for objs in separated_objs.values())} separate object(s).', 'Info', 'INFO')
         return {'FINISHED'}
 
 # Update Backface Culling operator 
@@ -2232,46 +3581,180 @@ class RenameTexturesByHash(bpy.types.Operator):
     def execute(self, context):
 
         num_processed = 0
-        num_dupes_removed = 0
-        duplicates_to_remove = set()
-        original_images = set()
+        hasher = create_pixel_hasher()
+        cache = open_texture_hash_cache()
 
-        def generate_hash_from_image(image):
-            pixels = list(image.pixels)  # Get image pixels as a flat list
-            pixel_data = ''.join([str(int(p * 255)) for p in pixels])  # Convert to string
-            hash_object = hashlib.md5(pixel_data.encode())  # Generate MD5 hash
-            return hash_object.hexdigest()  # Return hexadecimal MD5 hash string
+        # The cache is closed (and the hashes found so far are saved) even if hashing fails part way
+        try:
+            if bpy.context.scene.MatBatchProperties.HashDuplicatesOnly:
+                original_images, digests = find_duplicate_candidates(bpy.data.images, hasher, cache)
+            else:
+                original_images, digests = list(bpy.data.images), dict()
 
-        for image in bpy.data.images:
-            original_images.add(image)
+            # Images already hashed while looking for duplicates aren't read again
+            unhashed_images = [image for image in original_images if image not in digests]
+            if hasher.mode == "SOURCE":
+                digests.update(hash_images_by_source(unhashed_images, bpy.context.scene.MatBatchProperties.HashWorkers, cache))
+            else:
+                digests.update({image: hash_image(image, hasher, cache) for image in unhashed_images})
+        finally:
+            if cache is not None:
+                cache.close()
+
+        # Images over the memory budget were hashed by their source bytes instead. The ones without any keep their current name
+        hashed_by_source = [image.name for image in hasher.oversized_images if digests.get(image) is not None]
+        skipped = [image.name for image in hasher.oversized_images if digests.get(image) is None]
 
+        # Group the images by hash, and build an explicit duplicate -> canonical map
+        images_by_hash = dict()
         for image in original_images:
-            hash_name = generate_hash_from_image(image)[:32]
-            if hash_name[:32] in bpy.data.images.keys():
-                duplicates_to_remove.add(hash_name)
+            if digests[image] is not None:
+                images_by_hash.setdefault(digests[image][:32], []).append(image)
+
+        canonical_images = dict()
+        remap = dict()
+        for hash_name, images in images_by_hash.items():
+
+            # Prefer the image that already has the hash name, so running the operator twice changes nothing
+            canonical = next((image for image in images if image.name == hash_name), images[0])
+            canonical_images[hash_name] = canonical
+            for image in images:
+                if image != canonical:
+                    remap[image] = canonical
+
+        num_dupes_removed = remap_duplicate_images(remap)
+
+        # Rename only once the duplicates are gone, so every hash name is free for its canonical image
+        for hash_name, image in canonical_images.items():
             image.name = hash_name
             num_processed += 1
 
-        for material in bpy.data.materials:
-            if material.node_tree:
-                for node in material.node_tree.nodes:
-                    if node.type == 'TEX_IMAGE' and node.image.name.split(".")[0] in duplicates_to_remove:
-                        node.image = bpy.data.images[node.image.name.split(".")[0]]
-            else:
-                continue
+        if len(bpy.data.images) > 0: 
+            message = f'Renamed {num_processed} texture(s).\nRemoved {str(num_dupes_removed)} duplicate textures.'
+            if len(hashed_by_source) > 0:
+                message += f'\n{len(hashed_by_source)} texture(s) over the memory budget were hashed by their file bytes instead: {summarize_names(hashed_by_source)}'
+            if len(skipped) > 0:
+                message += f'\nSkipped {len(skipped)} texture(s) over the memory budget that have no file to hash instead: {summarize_names(skipped)}'
+            display_msg_box(message, 'Info', 'INFO')
+        else:
+            display_msg_box(
+                'No textures found.', 'Error', 'ERROR')
+
+        return {'FINISHED'}
+
+# Find Similar Textures operator
+
+class FindSimilarTextures(bpy.types.Operator):
+    """Find textures in this Blender file that look the same, even if they were re-exported or recompressed, by comparing perceptual hashes. Optionally replace each near-duplicate with its best (highest resolution) copy"""
+    bl_idname = "material.find_similar_textures"
+    bl_label = "Find Similar Textures"
+    bl_options = {'REGISTER'}
+
+    def execute(self, context):
+
+        threshold = bpy.context.scene.MatBatchProperties.SimilarThreshold
+        apply_remap = bpy.context.scene.MatBatchProperties.SimilarApply
+        hasher = PixelHasher("EXACT")
+        tree = BKTree()
+        fingerprints = dict()
 
-        # Remove any duplicate images
         for image in bpy.data.images:
-            if "." in image.name:
-                bpy.data.images.remove(image)
-                num_dupes_removed += 1
+            if image.type != 'IMAGE':
+                continue
+            perceptual_hash, average_color = hasher.perceptual_hash(image)
+            if perceptual_hash is not None:
+                fingerprints[image] = (perceptual_hash, average_color)
+                tree.add(perceptual_hash, image)
+
+        # Visit the biggest images first, so each group is kept in its highest quality copy
+        ordered_images = sorted(fingerprints.keys(), key=lambda image: (-(image.size[0] * image.size[1]), image.name))
+        assigned = set()
+        groups = []
+
+        for image in ordered_images:
+            if image in assigned:
+                continue
+            assigned.add(image)
+            perceptual_hash, average_color = fingerprints[image]
+            aspect = image.size[0] / image.size[1]
 
-        if len(bpy.data.images) > 0: 
-            display_msg_box(
-                f'Renamed {num_processed} texture(s).\nRemoved {str(num_dupes_removed)} duplicate textures.', 'Info', 'INFO')
+            duplicates = []
+            for distance, other in tree.query(perceptual_hash, threshold):
+                if other in assigned:
+                    continue
+
+                # Flat or nearly flat textures all share similar hashes, so their average colors and aspect ratios must also match
+                if np.abs(fingerprints[other][1][:3] - average_color[:3]).max() > 0.05:
+                    continue
+                if abs(other.size[0] / other.size[1] - aspect) > 0.01 * aspect:
+                    continue
+
+                duplicates.append(other)
+                assigned.add(other)
+
+            if len(duplicates) > 0:
+                groups.append((image, duplicates))
+
+        bytes_saved = sum(image_memory_size(duplicate) for canonical, duplicates in groups for duplicate in duplicates)
+        num_duplicates = sum(len(duplicates) for canonical, duplicates in groups)
+        report = [f'{canonical.name} <- {", ".join(duplicate.name for duplicate in duplicates)}' for canonical, duplicates in groups]
+
+        if apply_remap:
+            remap_duplicate_images({duplicate: canonical for canonical, duplicates in groups for duplicate in duplicates})
+
+        if len(groups) > 0:
+            summary = f'{"Replaced" if apply_remap else "Found"} {num_duplicates} near-duplicate texture(s) in {len(groups)} group(s), saving about {bytes_saved / 1048576:.1f} MB.'
+            lines = [summary] + report[:20]
+            if len(report) > 20:
+                lines.append(f'... and {len(report) - 20} more group(s). See the console for the full list.')
+                for line in report[20:]:
+                    print(line)
+            display_msg_box("\n".join(lines), 'Info', 'INFO')
         else:
             display_msg_box(
-                'No textures found.', 'Error', 'ERROR')
+                'No near-duplicate textures found.', 'Info', 'INFO')
+
+        return {'FINISHED'}
+
+# Rebuild Texture Hash Cache operator
+
+class RebuildTextureHashCache(bpy.types.Operator):
+    """Clear the texture hash cache, then hash every texture in this Blender file again and store the results. Use this if the cache ever gets out of sync with your texture files"""
+    bl_idname = "material.rebuild_texture_hash_cache"
+    bl_label = "Rebuild Hash Cache"
+    bl_options = {'REGISTER'}
+
+    def execute(self, context):
+
+        num_processed = 0
+        hasher = create_pixel_hasher()
+        cache = TextureHashCache(bpy.context.scene.MatBatchProperties.HashCacheMaxEntries)
+
+        # The cache is closed (and the hashes found so far are saved) even if hashing fails part way
+        try:
+            cache.clear()
+
+            if hasher.mode == "SOURCE":
+                cacheable_images = [image for image in bpy.data.images if image.packed_file is None and TextureHashCache.key_for(image) is not None]
+                hash_images_by_source(cacheable_images, bpy.context.scene.MatBatchProperties.HashWorkers, cache)
+                num_processed = len(cacheable_images)
+            else:
+                for image in bpy.data.images:
+                    key = TextureHashCache.key_for(image)
+                    if key is None:
+                        continue
+                    if not hasher.fits(image):
+                        hasher.oversized_images.append(image)
+                        continue
+                    cache.put(key, hasher.mode, hasher.hexdigest(image))
+                    num_processed += 1
+        finally:
+            cache.close()
+
+        message = f'Rebuilt the hash cache with {num_processed} texture(s).'
+        if len(hasher.oversized_images) > 0:
+            message += f'\nSkipped {len(hasher.oversized_images)} texture(s) over the memory budget: {summarize_names([image.name for image in hasher.oversized_images])}'
+        display_msg_box(message, 'Info', 'INFO')
 
         return {'FINISHED'}
 
@@ -2293,6 +3776,7 @@ def menu_func(self, context):
     self.layout.operator(ApplyMatTemplate.bl_idname)
     self.layout.operator(FindActiveFaceTexture.bl_idname)
     self.layout.operator(CopyTexToMatName.bl_idname)
+    self.layout.operator(MergeIdenticalMaterials.bl_idname)
     self.layout.operator(IsolateByMatTrait.bl_idname)
     self.layout.operator(RenameTexturesByHash.bl_idname)
 
@@ -2302,6 +3786,7 @@ def imageeditor_menu_func(self, context):
     self.layout.operator(CopyActiveFaceTexture.bl_idname)
     self.layout.operator(PasteActiveFaceTexture.bl_idname)
     self.layout.operator(RenameTexturesByHash.bl_idname)
+    self.layout.operator(FindSimilarTextures.bl_idname)
     self.layout.operator(CopyTexToMatName.bl_idname)
     
 # MATERIALS PANEL
@@ -2353,14 +3838,33 @@ class MaterialBatchToolsSubPanel_Nodes(bpy.types.Panel):
         rowUnify2 = boxUnify.row()
         rowUnify3 = boxUnify.row()
         rowUnify4 = boxUnify.row()
+        rowUnify5 = boxUnify.row()
 
         rowUnify2.prop(
             bpy.context.scene.MatBatchProperties, "UnifyFilterLabel")
-        rowUnify3.operator("material.set_as_template_node")
-        rowUnify4.operator("material.unify_node_settings")
-        rowUnify4.enabled = (
+        rowUnify3.prop(
+            bpy.context.scene.MatBatchProperties, "UnifyOnlyChanges")
+        rowUnify4.operator("material.set_as_template_node")
+        rowUnify5.operator("material.unify_node_settings")
+        rowUnify5.enabled = (
             bpy.context.scene.MatBatchProperties.SavedNodeName != "")
 
+        # Node Unify template set UI
+        templates = bpy.context.scene.MatBatchProperties.UnifyTemplates
+        boxUnifySet = boxUnify.box()
+        boxUnifySet.label(text="Template Set")
+        for index, template in enumerate(templates):
+            rowUnifySetEntry = boxUnifySet.row()
+            filter_text = f' "{template.FilterLabel}"' if template.FilterLabel != "" else ""
+            rowUnifySetEntry.label(text=f"{template.NodeLabel}{filter_text} ({template.Material})")
+            rowUnifySetEntry.operator("material.remove_unify_template", text="", icon='X').index = index
+        rowUnifySet1 = boxUnifySet.row()
+        rowUnifySet2 = boxUnifySet.row()
+
+        rowUnifySet1.operator("material.add_unify_template")
+        rowUnifySet2.operator("material.unify_template_set")
+        rowUnifySet2.enabled = (len(templates) > 0)
+
         layout.separator()
 
         # Bake Target Node UI
@@ -2389,14 +3893,30 @@ class MaterialBatchToolsSubPanel_Nodes(bpy.types.Panel):
         rowTemplate1 = boxTemplate.row()
         rowTemplate2 = boxTemplate.row()
         rowTemplate3 = boxTemplate.row()
+        rowTemplate4 = boxTemplate.row()
+        rowTemplate5 = boxTemplate.row()
 
         rowSwitchShader1.prop(
             bpy.context.scene.MatBatchProperties, "SwitchShaderTarget")
         rowSwitchShader2.operator("material.switch_shader")
 
         rowTemplate1.prop(bpy.context.scene.MatBatchProperties, "Template")
+        rowTemplate1.operator("material.reload_mat_templates", text="", icon="FILE_REFRESH")
         rowTemplate2.prop(bpy.context.scene.MatBatchProperties, "SkipTexture")
-        rowTemplate3.operator("material.apply_mat_template")
+        rowTemplate3.prop(bpy.context.scene.MatBatchProperties, "TemplateInstancing")
+        rowTemplate3.prop(bpy.context.scene.MatBatchProperties, "TemplateDiffApply")
+        rowTemplate4.prop(bpy.context.scene.MatBatchProperties, "TemplateLibraryPath")
+        rowTemplate4.enabled = bpy.context.scene.MatBatchProperties.TemplateInstancing
+        rowTemplate5.operator("material.apply_mat_template")
+
+        layout.separator()
+
+        # Material Merge UI
+        boxMerge = layout.box()
+        boxMerge.label(text="Material Merge")
+        rowMerge1 = boxMerge.row()
+
+        rowMerge1.operator("material.merge_identical_materials")
 
 class MaterialBatchToolsSubPanel_Transparency(bpy.types.Panel):
     bl_parent_id = "MATERIAL_PT_matbatchtools"
@@ -2541,11 +4061,65 @@ class MaterialBatchToolsSubPanel_Isolate(bpy.types.Panel):
         rowIsolate2.prop(bpy.context.scene.MatBatchProperties, "IsolateTrait")
         rowIsolate3.operator("material.isolate_by_trait")
 
+class MaterialBatchToolsSubPanel_Textures(bpy.types.Panel):
+    bl_parent_id = "MATERIAL_PT_matbatchtools"
+    bl_label = 'Textures'
+    bl_idname = "MATERIAL_PT_matbatchtools_textures"
+    bl_space_type = 'PROPERTIES'
+    bl_region_type = 'WINDOW'
+    bl_options = {"DEFAULT_CLOSED"}
+    bl_context = 'material'
+
+    @ classmethod
+    def poll(cls, context):
+        return (context.object != None)
+
+    def draw_header(self, context):
+        layout = self.layout
+
+    def draw(self, context):
+        layout = self.layout
+
+        # Rename by Hash UI
+        boxHash = layout.box()
+        boxHash.label(text="Rename by Hash")
+        rowHash1 = boxHash.row()
+        rowHash2 = boxHash.row()
+        rowHash3 = boxHash.row()
+        rowHash4 = boxHash.row()
+        rowHash5 = boxHash.row()
+        rowHash6 = boxHash.row()
+        rowHash7 = boxHash.row()
+
+        rowHash1.prop(bpy.context.scene.MatBatchProperties, "HashMode")
+        rowHash1.prop(bpy.context.scene.MatBatchProperties, "HashWorkers")
+        rowHash2.prop(bpy.context.scene.MatBatchProperties, "HashLimitMemory")
+        rowHash3.prop(bpy.context.scene.MatBatchProperties, "HashMemoryBudget")
+        rowHash3.enabled = bpy.context.scene.MatBatchProperties.HashLimitMemory
+        rowHash4.prop(bpy.context.scene.MatBatchProperties, "HashDuplicatesOnly")
+        rowHash5.prop(bpy.context.scene.MatBatchProperties, "HashUseCache")
+        rowHash5.prop(bpy.context.scene.MatBatchProperties, "HashCacheMaxEntries")
+        rowHash6.operator("material.rename_textures_by_hash")
+        rowHash7.operator("material.rebuild_texture_hash_cache")
+
+        layout.separator()
+
+        # Similar Textures UI
+        boxSimilar = layout.box()
+        boxSimilar.label(text="Similar Textures")
+        rowSimilar1 = boxSimilar.row()
+        rowSimilar2 = boxSimilar.row()
+
+        rowSimilar1.prop(bpy.context.scene.MatBatchProperties, "SimilarThreshold")
+        rowSimilar1.prop(bpy.context.scene.MatBatchProperties, "SimilarApply")
+        rowSimilar2.operator("material.find_similar_textures")
+
 
 # End of classes
 
 
 classes = (
+    NodeUnifyTemplate,
     MatBatchProperties,
     CopyBakeTargetNode,
     PasteBakeTargetNode,
@@ -2559,20 +4133,28 @@ classes = (
     SetBlendMode,
     SetAsTemplateNode,
     UnifyNodeSettings,
+    AddUnifyTemplate,
+    RemoveUnifyTemplate,
+    UnifyTemplateSet,
     SwitchShader,
     ApplyMatTemplate,
+    ReloadMaterialTemplates,
     FindActiveFaceTexture,
     CopyActiveFaceTexture,
     PasteActiveFaceTexture,
     CopyTexToMatName,
+    MergeIdenticalMaterials,
     IsolateByMatTrait,
     UpdateBackfaceCulling,
     RenameTexturesByHash,
+    FindSimilarTextures,
+    RebuildTextureHashCache,
     MaterialBatchToolsPanel,
     MaterialBatchToolsSubPanel_Nodes,
     MaterialBatchToolsSubPanel_UV_VC,
     MaterialBatchToolsSubPanel_Transparency,
-    MaterialBatchToolsSubPanel_Isolate
+    MaterialBatchToolsSubPanel_Isolate,
+    MaterialBatchToolsSubPanel_Textures
 )
 
 
@@ -2583,6 +4165,12 @@ def register():
     bpy.types.Scene.MatBatchProperties = bpy.props.PointerProperty(
         type=MatBatchProperties)
 
+    try:
+        for error in load_user_templates():
+            print(f"Material Batch Tools: couldn't load template {error}")
+    except OSError:
+        pass
+
     bpy.types.IMAGE_MT_image.append(imageeditor_menu_func)
 
 
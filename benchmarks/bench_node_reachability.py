@@ -0,0 +1,138 @@
+""" Benchmark for the "is this node connected to the Material Output" check.
+
+Compares the old recursive walk (one full walk per node asked about) with the memoized reachability
+set, on node graphs of 50 to 500 nodes. Two graph shapes are used: a tree with no shared nodes, and
+a chain of diamonds, where every node is shared by two paths. Run it from a terminal with:
+
+    blender --background --factory-startup --python benchmarks/bench_node_reachability.py
+"""
+
+import importlib.util
+import os
+import time
+
+import bpy
+
+ADDON_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "__init__.py")
+SIZES = (50, 100, 200, 500)
+
+# The old walk visits every path in a diamond chain, which doubles with each diamond
+LEGACY_MAX_DIAMONDS = 16
+
+
+def load_addon():
+    spec = importlib.util.spec_from_file_location("matbatchtools_bench", ADDON_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def legacy_is_node_connected(material, node_to_check):
+    output_node = None
+    for node in material.node_tree.nodes:
+        if node.type == 'OUTPUT_MATERIAL':
+            output_node = node
+            break
+
+    if not output_node:
+        return False
+
+    def check_connections(current_node):
+        if current_node == node_to_check:
+            return True
+        for input_socket in current_node.inputs:
+            for link in input_socket.links:
+                if check_connections(link.from_node):
+                    return True
+        return False
+
+    return check_connections(output_node)
+
+
+def new_material(name):
+    material = bpy.data.materials.new(name)
+    material.use_nodes = True
+    material.node_tree.nodes.clear()
+    output = material.node_tree.nodes.new('ShaderNodeOutputMaterial')
+    return material, output
+
+
+def build_tree(node_count):
+    ''' Binary tree of Math nodes. Every node has exactly one path to the output '''
+    material, output = new_material(f"bench_tree_{node_count}")
+    nodes, links = material.node_tree.nodes, material.node_tree.links
+
+    root = nodes.new('ShaderNodeMath')
+    links.new(root.outputs[0], output.inputs['Displacement'])
+    pending = [root]
+    created = 1
+    while created < node_count - 1:
+        parent = pending.pop(0)
+        for index in range(2):
+            if created >= node_count - 1:
+                break
+            child = nodes.new('ShaderNodeMath')
+            links.new(child.outputs[0], parent.inputs[index])
+            pending.append(child)
+            created += 1
+
+    # One node that isn't connected at all, so every walk has a worst case
+    nodes.new('ShaderNodeMath')
+    return material
+
+
+def build_diamonds(node_count):
+    ''' Chain of diamonds: each step splits into two Math nodes that merge again, so paths double at every step '''
+    material, output = new_material(f"bench_diamonds_{node_count}")
+    nodes, links = material.node_tree.nodes, material.node_tree.links
+
+    bottom = nodes.new('ShaderNodeMath')
+    links.new(bottom.outputs[0], output.inputs['Displacement'])
+    diamonds = (node_count - 3) // 3
+    for _ in range(diamonds):
+        left = nodes.new('ShaderNodeMath')
+        right = nodes.new('ShaderNodeMath')
+        top = nodes.new('ShaderNodeMath')
+        links.new(left.outputs[0], bottom.inputs[0])
+        links.new(right.outputs[0], bottom.inputs[1])
+        links.new(top.outputs[0], left.inputs[0])
+        links.new(top.outputs[0], right.inputs[0])
+        bottom = top
+
+    nodes.new('ShaderNodeMath')
+    return material, diamonds
+
+
+def time_all_nodes(function, material):
+    start = time.perf_counter()
+    for node in material.node_tree.nodes:
+        function(material, node)
+    return time.perf_counter() - start
+
+
+def main():
+    addon = load_addon()
+
+    def memoized(material, node):
+        return addon.is_node_connected(material, node)
+
+    print(f"{'graph':<10}{'nodes':>8}{'legacy s':>12}{'memoized s':>14}")
+    for size in SIZES:
+        for shape in ("tree", "diamonds"):
+            if shape == "tree":
+                material = build_tree(size)
+                run_legacy = True
+            else:
+                material, diamonds = build_diamonds(size)
+                run_legacy = diamonds <= LEGACY_MAX_DIAMONDS
+
+            legacy = f"{time_all_nodes(legacy_is_node_connected, material):.4f}" if run_legacy else "skipped"
+            addon.clear_connected_nodes_cache()
+            fresh = time_all_nodes(memoized, material)
+            print(f"{shape:<10}{len(material.node_tree.nodes):>8}{legacy:>12}{fresh:>14.4f}")
+
+            bpy.data.materials.remove(material)
+
+
+if __name__ == "__main__":
+    main()
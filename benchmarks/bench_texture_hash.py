@@ -0,0 +1,82 @@
+""" Benchmark for the pixel hashing used by Rename All Textures by Hash.
+
+Compares the old list(image.pixels) + string path with the NumPy buffer path, in time and peak
+memory per megapixel. The budgeted hasher (Limit Memory) still copies each image out in full as floats,
+but quantizes it through a chunk buffer of at most PIXEL_HASH_CHUNK_SIZE instead of a full 8-bit copy.
+Run it from a terminal, outside of any production file:
+
+    blender --background --factory-startup --python benchmarks/bench_texture_hash.py
+"""
+
+import hashlib
+import importlib.util
+import os
+import time
+import tracemalloc
+
+import bpy
+import numpy as np
+
+ADDON_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "__init__.py")
+SIZES = (256, 512, 1024, 2048)
+
+# Memory budget used for the budgeted hasher, in bytes. Big enough for every size below
+MEMORY_BUDGET = 512 * 1048576
+
+# The legacy path builds one Python string per channel, so it is skipped above this size
+LEGACY_MAX_SIZE = 1024
+
+
+def load_addon():
+    spec = importlib.util.spec_from_file_location("matbatchtools_bench", ADDON_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def legacy_hash(image):
+    pixels = list(image.pixels)
+    pixel_data = ''.join([str(int(p * 255)) for p in pixels])
+    return hashlib.md5(pixel_data.encode()).hexdigest()
+
+
+def make_image(size):
+    image = bpy.data.images.new(f"bench_{size}", size, size, alpha=True)
+    rng = np.random.default_rng(size)
+    image.pixels.foreach_set(rng.random(size * size * 4, dtype=np.float32))
+    return image
+
+
+def measure(function, image):
+    tracemalloc.start()
+    start = time.perf_counter()
+    function(image)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    addon = load_addon()
+
+    print(f"{'method':<12}{'size':>8}{'s / MP':>12}{'peak MB / MP':>16}")
+    for size in SIZES:
+        image = make_image(size)
+        megapixels = (size * size) / 1_000_000
+
+        methods = [("quantized", addon.PixelHasher("QUANTIZED").hexdigest),
+                   ("budgeted", addon.PixelHasher("QUANTIZED", MEMORY_BUDGET).hexdigest),
+                   ("exact", addon.PixelHasher("EXACT").hexdigest)]
+        if size <= LEGACY_MAX_SIZE:
+            methods.insert(0, ("legacy", legacy_hash))
+
+        for label, function in methods:
+            elapsed, peak = measure(function, image)
+            print(f"{label:<12}{size:>8}{elapsed / megapixels:>12.4f}{peak / megapixels / 1_048_576:>16.2f}")
+
+        bpy.data.images.remove(image)
+
+
+if __name__ == "__main__":
+    main()